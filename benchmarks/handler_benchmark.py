@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+from weppy.handler import url
+from weppy.http import HTTPError, HTTPRequest, HTTPResponse
+from weppy.wsgi import WSGIApplication
+
+@url('/item/_/')
+class ItemHandler:
+    def get(self, req, item):
+        return HTTPResponse('item %s' % item)
+
+@url('/text/')
+class TextHandler:
+    def get(self, req):
+        return 'text'
+
+def benchmarks():
+    """
+    Return the benchmarks of dispatching GET and HEAD requests and unsupported methods to a
+    Handler, and of handling a request with WSGIApplication.
+    """
+    app = WSGIApplication(False)
+    app.add_handler(ItemHandler)
+    get = HTTPRequest.get(path_info='/item/1/')
+    head = HTTPRequest.head(path_info='/item/1/')
+    delete = HTTPRequest.delete(path_info='/item/1/')
+    miss = HTTPRequest.get(path_info='/missing/')
+
+    def not_allowed():
+        try:
+            ItemHandler(delete, '1')
+        except HTTPError:
+            pass
+
+    return [('handler.get', lambda: ItemHandler(get, '1')),
+            ('handler.get.str', lambda: TextHandler(get)),
+            ('handler.head', lambda: ItemHandler(head, '1')),
+            ('handler.not_allowed', not_allowed),
+            ('application.get', lambda: app.handle_request(get)),
+            ('application.not_found', lambda: app.handle_request(miss))]
+
+def main():
+    """
+    Print the cost of dispatching requests to handlers.
+    """
+    from suite import report
+    report(benchmarks())
+
+if __name__ == '__main__':
+    main()
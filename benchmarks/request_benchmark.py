@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+from weppy.http import HTTPRequest
+
+# body sizes in bytes of POST requests
+SIZES = (('1kb', 1024), ('64kb', 64 * 1024), ('1mb', 1024 * 1024))
+
+def clean_environ(req):
+    """
+    Return the environ of req without the parsed data WebOb caches in it, and its body.
+    """
+    environ = dict((key, value) for (key, value) in req._req.environ.items()
+                   if not key.startswith('webob.'))
+    body = environ['wsgi.input'].read() if 'wsgi.input' in environ else b''
+    return environ, body
+
+def post_environ(size, multipart):
+    """
+    Return the environ and body of a POST request of about size bytes, with 16 fields or, if
+    multipart is set, with a field and a file.
+    """
+    if multipart:
+        params = {'name': 'value', 'file': ('data.bin', 'x' * size)}
+    else:
+        params = dict(('field%d' % i, 'x' * (size // 16)) for i in range(16))
+    return clean_environ(HTTPRequest.post(path_info='/', params=params))
+
+def benchmarks():
+    """
+    Return the benchmarks of building an HTTPRequest for a typical browser GET request, with
+    and without accessing its parsed attributes, and of parsing POST bodies.
+    """
+    headers = {'HTTP_COOKIE': 'session=abc; theme=dark; lang=en',
+               'HTTP_ACCEPT': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.8',
+               'HTTP_ACCEPT_ENCODING': 'gzip,deflate,sdch',
+               'HTTP_ACCEPT_LANGUAGE': 'en-US,en;q=0.8,de;q=0.6'}
+    environ, body = clean_environ(HTTPRequest.get(path_info='/', query_string='a=1&b=2',
+                                                  headers=headers))
+
+    def untouched():
+        HTTPRequest(dict(environ)).path
+
+    def touched():
+        req = HTTPRequest(dict(environ))
+        (req.GET, req.headers, req.cookies, req.accept, req.accept_charset,
+         req.accept_encoding, req.accept_language)
+
+    result = [('request.get.untouched', untouched), ('request.get.touched', touched)]
+
+    def post(environ, body):
+        def parse():
+            copy = dict(environ)
+            copy['wsgi.input'] = io.BytesIO(body)
+            HTTPRequest(copy).POST
+        return parse
+
+    def stream(environ, body):
+        def parse():
+            copy = dict(environ)
+            copy['wsgi.input'] = io.BytesIO(body)
+            for (name, value) in HTTPRequest(copy).iter_multipart():
+                if hasattr(value, 'close'):
+                    value.close()
+        return parse
+
+    for (name, size) in SIZES:
+        result.append(('request.post.urlencoded.%s' % name, post(*post_environ(size, False))))
+        result.append(('request.post.multipart.%s' % name, post(*post_environ(size, True))))
+        result.append(('request.post.iter_multipart.%s' % name,
+                       stream(*post_environ(size, True))))
+    return result
+
+def main():
+    """
+    Print the cost of building and parsing HTTPRequest objects.
+    """
+    from suite import report
+    report(benchmarks())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+from weppy.http import HTTPRequest, HTTPResponse, JSONResponse
+
+def benchmarks():
+    """
+    Return the benchmarks of building and serialising buffered and streaming HTTPResponse
+    and JSONResponse objects through the WSGI interface.
+    """
+    environ = HTTPRequest.get(path_info='/').environ
+    small = 'x' * 100
+    large = 'x' * (256 * 1024)
+    chunks = ['x' * 1024] * 64
+    rows = [{'id': i, 'name': 'row %d' % i, 'tags': ['a', 'b'], 'score': i * 0.5}
+            for i in range(1000)]
+
+    def start_response(status, headerlist, exc_info=None):
+        pass
+
+    def serialise(body, **kwargs):
+        def run():
+            result = HTTPResponse(body(), **kwargs)(environ, start_response)
+            b''.join(result)
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+        return run
+
+    def serialise_json(response):
+        def run():
+            result = response()(environ, start_response)
+            b''.join(result)
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+        return run
+
+    return [('response.small', serialise(lambda: small)),
+            ('response.large', serialise(lambda: large)),
+            ('response.headers', serialise(lambda: small, headerlist=[
+                ('Content-Type', 'text/plain'), ('Cache-Control', 'max-age=60'),
+                ('X-Frame-Options', 'DENY')])),
+            ('response.streaming', serialise(lambda: iter(chunks))),
+            ('response.json.dumps', serialise(lambda: json.dumps(rows),
+                                              content_type='application/json')),
+            ('response.json', serialise_json(lambda: JSONResponse(rows))),
+            ('response.json.stream', serialise_json(lambda: JSONResponse.stream(iter(rows))))]
+
+def main():
+    """
+    Print the cost of serialising responses.
+    """
+    from suite import report
+    report(benchmarks())
+
+if __name__ == '__main__':
+    main()
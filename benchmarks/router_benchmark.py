@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+from weppy.router import Router
+
+def url_patterns(count):
+    """
+    Return a list of count URL patterns with static and placeholder segments.
+    """
+    return ['/resource%d/_/item/_/' % i for i in range(count)]
+
+def linear_resolve(routes, path):
+    """
+    Resolve path by matching every compiled regex, as WSGIApplication used to.
+    """
+    for (url_regex, handler) in routes:
+        match = url_regex.match(path)
+        if match is not None:
+            return handler, match.groups()
+    for (url_regex, handler) in routes:
+        if url_regex.match(path + '/') is not None:
+            return None, ()
+    return None, ()
+
+def benchmarks():
+    """
+    Return the benchmarks of a hit, a redirect and a miss for 10, 100 and 1000 routes.
+    """
+    result = []
+    for count in (10, 100, 1000):
+        router = Router()
+        for url_pattern in url_patterns(count):
+            router.add(url_pattern, url_pattern)
+        for (name, path) in (('hit', '/resource%d/a/item/b/' % (count - 1)),
+                             ('redirect', '/resource%d/a/item/b' % (count - 1)),
+                             ('miss', '/missing/a/item/b/')):
+            result.append(('router.%d.%s' % (count, name),
+                           lambda resolve=router.resolve, path=path: resolve(path)))
+    return result
+
+def main():
+    """
+    Print the cost of a hit, a redirect and a miss for several numbers of routes.
+    """
+    number = 10000
+    print('%8s %8s %14s %14s %14s' % ('routes', 'router', 'hit (us)', 'redirect (us)',
+                                        'miss (us)'))
+    for count in (10, 100, 1000, 10000):
+        router = Router()
+        routes = []
+        for url_pattern in url_patterns(count):
+            router.add(url_pattern, url_pattern)
+            url_regex = r'^%s$' % re.escape(url_pattern).replace(r'\_', '([^/]+)')
+            routes.append((re.compile(url_regex), url_pattern))
+        paths = ('/resource%d/a/item/b/' % (count - 1), '/resource%d/a/item/b' % (count - 1),
+                 '/missing/a/item/b/')
+        for (name, resolve) in (('trie', router.resolve),
+                                ('linear', lambda path: linear_resolve(routes, path))):
+            if name == 'linear' and count > 1000:
+                continue
+            times = [timeit.timeit(lambda: resolve(path), number=number) / number * 1e6
+                     for path in paths]
+            print('%8d %8s %14.2f %14.2f %14.2f' % ((count, name) + tuple(times)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import glob
+import json
+import os
+import platform
+import sys
+import timeit
+from argparse import ArgumentParser
+
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(DIRECTORY, '..', 'src'))
+
+def measure(func, number=None, repeat=5):
+    """
+    Return the best time in microseconds of a call of func over repeat runs of number calls.
+    number is calibrated so that a run takes at least 0.1 s if it is None.
+
+    func -- function without arguments.
+    number -- int that specifies the number of calls in a run. None by default.
+    repeat -- int that specifies the number of runs. 5 by default.
+    """
+    timer = timeit.Timer(func)
+    if number is None:
+        number = 1
+        while timer.timeit(number) < 0.1:
+            number *= 10
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+def report(benchmarks, repeat=5):
+    """
+    Print the time of each benchmark and return a dict of times in microseconds by name.
+
+    benchmarks -- list of tuples (name, function without arguments).
+    repeat -- int that specifies the number of runs of each benchmark. 5 by default.
+    """
+    results = {}
+    for (name, func) in benchmarks:
+        results[name] = measure(func, repeat=repeat)
+        print('%-48s %12.2f us' % (name, results[name]))
+        sys.stdout.flush()
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Print the ratio of each time to its baseline and return the sorted list of the names of
+    the benchmarks that regressed by more than threshold.
+
+    results -- dict of times in microseconds by name.
+    baseline -- dict of baseline times in microseconds by name.
+    threshold -- float that specifies the tolerated slowdown, e.g. 0.1 for 10%.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name] / baseline[name]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = 'improvement'
+        print('%-48s %12.2f %12.2f %7.2fx %s' % (name, baseline[name], results[name], ratio,
+                                                 flag))
+    return regressions
+
+def load_benchmarks(names=None):
+    """
+    Return the list of benchmarks of the *_benchmark.py modules of this directory, or of the
+    specified modules.
+
+    names -- list of str that specifies module names, e.g. ['router_benchmark']. None loads
+             all modules. None by default.
+    """
+    if names is None:
+        names = sorted(os.path.basename(path)[:-3]
+                       for path in glob.glob(os.path.join(DIRECTORY, '*_benchmark.py')))
+    if DIRECTORY not in sys.path:
+        sys.path.insert(0, DIRECTORY)
+    benchmarks = []
+    for name in names:
+        benchmarks.extend(__import__(name).benchmarks())
+    return benchmarks
+
+def main():
+    """
+    Run the benchmarks, optionally write their times as JSON, and compare them with a saved
+    baseline. Exit with status 1 if any benchmark regressed.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('-m', '--module', action='append', dest='modules',
+                        help='run the benchmarks of a module, e.g. router_benchmark')
+    parser.add_argument('-k', '--filter', dest='filter', default='',
+                        help='run the benchmarks whose name contains the specified str')
+    parser.add_argument('-r', '--repeat', type=int, dest='repeat', default=5,
+                        help='number of runs of each benchmark')
+    parser.add_argument('-o', '--output', dest='output', default=None,
+                        help='write the results as JSON to the specified file')
+    parser.add_argument('-c', '--compare', dest='baseline', default=None,
+                        help='compare the results with a JSON file written by --output')
+    parser.add_argument('-t', '--threshold', type=float, dest='threshold', default=0.1,
+                        help='tolerated slowdown before a regression is flagged')
+    args = parser.parse_args()
+    benchmarks = [(name, func) for (name, func) in load_benchmarks(args.modules)
+                  if args.filter in name]
+    results = report(benchmarks, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f,
+                      indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        print('')
+        print('%-48s %12s %12s %8s' % ('benchmark', 'baseline', 'current', 'ratio'))
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\n%d regression(s): %s' % (len(regressions), ', '.join(regressions)))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
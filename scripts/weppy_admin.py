@@ -7,14 +7,38 @@ from argparse import ArgumentParser
 
 def runserver(args):
     """
-    Start WSGI server on the specified port.
+    Start WSGI server on the specified port or address, with the specified number of worker
+    processes and threads, or the asyncio server.
     """
     sys.path.insert(0, args.path)
     from main import application
-    from wsgiref.simple_server import make_server
-    server = make_server('127.0.0.1', args.port, application)
+    from weppy.server import PreforkServer, make_server, parse_bind
+    host, port = parse_bind(args.bind) if args.bind else ('127.0.0.1', args.port)
+    if args.server == 'asyncio':
+        from weppy.aioserver import AsyncioServer
+        if args.workers > 1:
+            sys.exit('the asyncio server runs in a single process')
+        threads = args.threads if args.threads > 1 else None
+        server = AsyncioServer(application, host, port, threads, args.reuse_port)
+    elif args.workers > 1:
+        server = PreforkServer(application, host, port, args.workers, args.reuse_port,
+                               threads=args.threads, max_queue=args.max_queue)
+    else:
+        server = make_server(host, port, application, threads=args.threads,
+                             max_queue=args.max_queue)
     server.serve_forever()
 
+def manifest(args):
+    """
+    Write the route manifest of the application of the project, from which it loads its routes
+    without importing the controller modules at startup.
+    """
+    sys.path.insert(0, args.path)
+    from main import application
+    path = args.output or os.path.join(args.path, 'routes.json')
+    application.write_manifest(path)
+    print('wrote %s' % path)
+
 def startproject(args):
     """
     Copy sample project structure to the current directory.
@@ -35,8 +59,29 @@ def main():
                                   help='run server on the specified port')
     runserver_parser.add_argument('-P', '--path', type=str, dest='path', default='.',
                                   help='path of weppy project directory')
+    runserver_parser.add_argument('-b', '--bind', type=str, dest='bind', default=None,
+                                  help='run server on the specified host:port')
+    runserver_parser.add_argument('-w', '--workers', type=int, dest='workers', default=1,
+                                  help='number of prefork worker processes')
+    runserver_parser.add_argument('-t', '--threads', type=int, dest='threads', default=1,
+                                  help='number of threads handling requests in each process')
+    runserver_parser.add_argument('--max-queue', type=int, dest='max_queue', default=64,
+                                  help='number of accepted connections waiting for a thread')
+    runserver_parser.add_argument('--reuse-port', action='store_true', dest='reuse_port',
+                                  help='bind a SO_REUSEPORT socket in each worker process')
+    runserver_parser.add_argument('-s', '--server', choices=['wsgiref', 'asyncio'],
+                                  dest='server', default='wsgiref',
+                                  help='server implementation, asyncio requires Python 3.7')
     runserver_parser.set_defaults(func=runserver)
 
+    manifest_parser = subparsers.add_parser('manifest')
+    manifest_parser.add_argument('-P', '--path', type=str, dest='path', default='.',
+                                 help='path of weppy project directory')
+    manifest_parser.add_argument('-o', '--output', type=str, dest='output', default=None,
+                                 help='path of the manifest, routes.json in the project by '
+                                      'default')
+    manifest_parser.set_defaults(func=manifest)
+
     startproject_parser = subparsers.add_parser('startproject')
     startproject_parser.add_argument('name', default='src', help='name of project directory')
     startproject_parser.set_defaults(func=startproject)
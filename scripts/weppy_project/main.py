@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
 from weppy.wsgi import *
-from settings import DEBUG, CONTROLLERS
+from settings import DEBUG, CONTROLLERS, MANIFEST
 
-application = WSGIApplication(DEBUG, CONTROLLERS)
+application = WSGIApplication(DEBUG, CONTROLLERS, manifest=MANIFEST)
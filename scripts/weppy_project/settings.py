@@ -1,7 +1,10 @@
-import controller
+import os
 
 # bool that specifies wheter it is a development environment
 DEBUG = True
 
-# list of controller modules
-CONTROLLERS = [controller]
+# list of controller modules, or of their names, which are imported lazily with a manifest
+CONTROLLERS = ['controller']
+
+# str that specifies the path of the route manifest written by weppy_admin.py manifest
+MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'routes.json')
@@ -0,0 +1,319 @@
+import asyncio
+import functools
+import inspect
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from weppy.http import *
+from weppy.wsgi import WSGIApplication
+
+# This module requires Python 3.7 or later.
+
+class _ReceiveStream(object):
+    """
+    WSGI input that reads the request body from the messages of an ASGI receive channel.
+
+    It can be read synchronously from a thread other than the one running the event loop, or
+    asynchronously with the receive method.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._more = True
+
+    async def receive(self):
+        """
+        Return the next chunk of bytes of the body, or b'' at its end.
+        """
+        while self._more:
+            message = await self._receive()
+            if message['type'] == 'http.disconnect':
+                self._more = False
+                break
+            self._more = message.get('more_body', False)
+            chunk = message.get('body', b'')
+            if chunk:
+                return chunk
+        return b''
+
+    def _fill(self):
+        """
+        Read the next chunk of the body into the buffer and return whether there was one.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError('the body of an async handler must be read with '
+                               'weppy.asgi.read_body or weppy.asgi.iter_body')
+        chunk = asyncio.run_coroutine_threadsafe(self.receive(), self._loop).result()
+        self._buffer += chunk
+        return bool(chunk)
+
+    def read(self, size=-1):
+        """
+        Return at most size bytes of the body, or the rest of it if size is negative.
+        """
+        while (size < 0 or len(self._buffer) < size) and self._fill():
+            pass
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    def readline(self, size=-1):
+        """
+        Return the next line of the body, of at most size bytes if size is not negative.
+        """
+        while (b'\n' not in self._buffer and (size < 0 or len(self._buffer) < size) and
+               self._fill()):
+            pass
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size >= 0:
+            end = min(end, size)
+        line, self._buffer = self._buffer[:end], self._buffer[end:]
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+async def iter_body(req, max_size=None):
+    """
+    Yield the body of a request received through ASGI in chunks of bytes as they arrive, or
+    raise an HTTPRequestEntityTooLarge exception if it exceeds max_size. The body can only be
+    iterated once.
+
+    req -- HTTPRequest.
+    max_size -- int that specifies the maximum body size in bytes. None does not limit the
+                body size. None by default.
+    """
+    length = req.content_length
+    if max_size is not None and length is not None and length > max_size:
+        raise HTTPRequestEntityTooLarge()
+    stream = req.environ['wsgi.input']
+    size = 0
+    while True:
+        chunk = await stream.receive()
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise HTTPRequestEntityTooLarge()
+        yield chunk
+
+async def read_body(req, max_size=None):
+    """
+    Return the body of a request received through ASGI in bytes, or raise an
+    HTTPRequestEntityTooLarge exception if it exceeds max_size.
+
+    req -- HTTPRequest.
+    max_size -- int that specifies the maximum body size in bytes. None does not limit the
+                body size. None by default.
+    """
+    return b''.join([chunk async for chunk in iter_body(req, max_size)])
+
+def _environ(scope, stream):
+    """
+    Return a WSGI environ for the request described by an ASGI HTTP scope.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': str(client[0]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': stream,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'asgi.scope': scope,
+    }
+    for (name, value) in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+class ASGIApplication(WSGIApplication):
+    """
+    ASGI application interface, which serves the same controllers as WSGIApplication.
+
+    Handler methods defined with async def are awaited on the event loop, and other handler
+    methods are called in a pool of threads. The body of a request is read from the receive
+    channel as it is consumed, with weppy.asgi.iter_body or weppy.asgi.read_body in async
+    handler methods, and streaming response bodies, which can also be async iterables, are
+    sent chunk by chunk. Responses are not cached, and middleware is not applied.
+    """
+
+    def __init__(self, debug, controllers=None, etag=None, compressor=None, threads=None,
+                 tasks=None):
+        """
+        Inspect controller modules to find Handler instances.
+
+        debug -- bool that specifies whether it is a development environment.
+        controllers -- list of controller modules. None by default.
+        etag -- str that specifies whether an 'ETag' header is computed for the buffered bodies
+                of all GET and HEAD responses, as with the etag attribute of handlers, which
+                defaults to it: 'strong', 'weak' or None. None by default.
+        compressor -- weppy.compression.Compressor that compresses responses. None does not
+                      compress responses. None by default.
+        threads -- int that specifies the number of threads calling synchronous handler
+                   methods. None uses the default of concurrent.futures.ThreadPoolExecutor.
+                   None by default.
+        tasks -- weppy.tasks.TaskQueue that runs the functions scheduled by handlers with
+                 HTTPRequest.after_response, and is drained on shutdown. None runs them after
+                 responses are sent. None by default.
+        """
+        super(ASGIApplication, self).__init__(debug, controllers, etag=etag,
+                                              compressor=compressor, tasks=tasks)
+        self._threads = threads
+        self._executor = None
+
+    def _get_executor(self):
+        """
+        Return the pool of threads, which is created on first use.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self._threads)
+        return self._executor
+
+    async def handle_request_async(self, req):
+        """
+        Return an HTTPResponse processed by the appropriate Handler instance or by catching an
+        exception, or redirect the request by appending a slash to its path. The response is
+        compressed by the compressor, if any, unless its body is an async iterable.
+        """
+        if self._pools:
+            req.environ['weppy.pools'] = self._pools
+        if self._tasks is not None:
+            req.environ['weppy.tasks'] = self._tasks
+        if self._etag is not None:
+            req.environ['weppy.etag'] = self._etag
+        res = await self._handle_request_async(req)
+        if self._compressor is not None and not _is_async(res):
+            res = self._compressor(req, res)
+        return res
+
+    async def _handle_request_async(self, req):
+        """
+        Return an HTTPResponse processed by the appropriate Handler instance or by catching an
+        exception, or redirect the request by appending a slash to its path.
+        """
+        try:
+            handler, args, redirect = self._router.resolve(req.path)
+            if handler is None:
+                if redirect:
+                    return HTTPRedirect(req.path + '/')
+                raise HTTPNotFound()
+            if inspect.iscoroutinefunction(handler._methods.get(req.method)):
+                handler_method, etag, res = handler._dispatch(req, args)
+                if res is None:
+                    res = handler._finish(req, await handler_method(req, *args), etag)
+            else:
+                loop = asyncio.get_running_loop()
+                res = await loop.run_in_executor(self._get_executor(),
+                                                 functools.partial(handler, req, *args))
+            if self._etag is not None:
+                res = self._conditional(req, res)
+            return res
+        except Exception as error:
+            return self._handle_error(error)
+
+    async def _send_response(self, req, res, send):
+        """
+        Send res through the ASGI send channel, streaming its body if it is streaming.
+        """
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                   for (name, value) in res.headerlist]
+        await send({'type': 'http.response.start', 'status': int(res.status[:3]),
+                    'headers': headers})
+        if req.method == 'HEAD':
+            res.close()
+            await send({'type': 'http.response.body', 'body': b''})
+        elif not res.streaming:
+            await send({'type': 'http.response.body', 'body': res.body})
+        elif _is_async(res):
+            charset = res.charset or 'UTF-8'
+            async for chunk in res.app_iter._iterable:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(charset)
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk,
+                                'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        else:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            iterator = iter(res.app_iter)
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(executor, next, iterator, None)
+                    if chunk is None:
+                        break
+                    await send({'type': 'http.response.body', 'body': chunk,
+                                'more_body': True})
+            finally:
+                res.close()
+            await send({'type': 'http.response.body', 'body': b''})
+
+    async def _lifespan(self, receive, send):
+        """
+        Answer the messages of an ASGI lifespan scope, running the startup and shutdown hooks.
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    self.startup()
+                except Exception as error:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(error)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._executor is not None:
+                    self._executor.shutdown()
+                    self._executor = None
+                try:
+                    self.shutdown()
+                except Exception as error:
+                    await send({'type': 'lifespan.shutdown.failed', 'message': str(error)})
+                    return
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        """
+        ASGI interface.
+        """
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('unsupported ASGI scope type: %s' % scope['type'])
+        stream = _ReceiveStream(receive, asyncio.get_running_loop())
+        req = HTTPRequest(_environ(scope, stream))
+        try:
+            res = await self.handle_request_async(req)
+            await self._send_response(req, res, send)
+        finally:
+            if req.has_finalizers:
+                await asyncio.get_running_loop().run_in_executor(self._get_executor(),
+                                                                 req.finalize)
+
+def _is_async(res):
+    """
+    Return whether the body of res is an async iterable.
+    """
+    return res.streaming and hasattr(res.app_iter._iterable, '__aiter__')
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from email.utils import mktime_tz, parsedate_tz
+from weppy.http import HTTPResponse
+
+def _ttl(headers, now):
+    """
+    Return the number of seconds a response with the specified headers may be cached for
+    according to its 'Cache-Control' and 'Expires' headers, or 0 if it may not be cached.
+    """
+    directives = {}
+    for directive in headers.get('cache-control', '').split(','):
+        name, sep, value = directive.strip().partition('=')
+        directives[name.lower()] = value.strip('"')
+    if 'no-store' in directives or 'no-cache' in directives or 'private' in directives:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            try:
+                return max(int(directives[name]), 0)
+            except ValueError:
+                return 0
+    expires = parsedate_tz(headers.get('expires', ''))
+    if expires is not None:
+        return max(int(mktime_tz(expires) - now), 0)
+    return 0
+
+class _Entry(object):
+    """
+    Cached response.
+    """
+
+    __slots__ = ('base', 'status', 'headerlist', 'body', 'size', 'stored', 'expires')
+
+    def __init__(self, base, status, headerlist, body, stored, expires):
+        self.base = base
+        self.status = status
+        self.headerlist = headerlist
+        self.body = body
+        self.size = len(body) + sum(len(name) + len(value) for (name, value) in headerlist)
+        self.stored = stored
+        self.expires = expires
+
+class ResponseCache(object):
+    """
+    In-process LRU cache of the responses of a WSGIApplication, bounded by entry count and
+    total size and honouring the 'Cache-Control', 'Expires' and 'Vary' headers of responses.
+
+    Only 200 responses to GET requests with a buffered body and without a 'Set-Cookie' header
+    are stored, and responses to requests with an 'Authorization' header are only stored if
+    they are public. HEAD requests are answered from the responses stored for GET requests,
+    without their body. Responses are keyed by host, so that virtual hosts do not share them.
+    Responses served from the cache are recorded with the '<cached>' route by the metrics.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024, methods=('GET', 'HEAD')):
+        """
+        max_entries -- int that specifies the maximum number of cached responses. 1000 by
+                       default.
+        max_bytes -- int that specifies the maximum total size in bytes of the cached
+                     responses. 64 MB by default.
+        methods -- tuple of str that specifies the request methods answered from the cache.
+                   ('GET', 'HEAD') by default.
+        """
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._methods = methods
+        self._entries = OrderedDict()
+        self._vary = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, base, vary, environ):
+        """
+        Return the key of a response to the request with the specified environ.
+        """
+        return base + tuple(environ.get('HTTP_' + name.upper().replace('-', '_'))
+                            for name in vary)
+
+    def _remove(self, key):
+        """
+        Remove the entry with the specified key. The lock must be held.
+        """
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def __call__(self, req, handle_request):
+        """
+        Return the cached response to req, or the response returned by handle_request for req,
+        which is stored if it can be cached.
+
+        req -- HTTPRequest.
+        handle_request -- function that returns the HTTPResponse to an HTTPRequest.
+        """
+        method = req.method
+        if method not in self._methods:
+            return handle_request(req)
+        environ = req.environ
+        base = (req.host, req.path, req.query_string)
+        now = time.time()
+        vary = self._vary.get(base)
+        if vary is not None:
+            key = self._key(base, vary, environ)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry.expires > now:
+                        del self._entries[key]
+                        self._entries[key] = entry
+                        self.hits += 1
+                        headerlist = entry.headerlist + [('Age', str(int(now - entry.stored)))]
+                        res = HTTPResponse(entry.body, entry.status, None, None, headerlist)
+                        if method == 'HEAD':
+                            res.discard_body()
+                        timing = environ.get('weppy.timing')
+                        if timing is not None:
+                            timing[0] = '<cached>'
+                        return res
+                    self._remove(key)
+        with self._lock:
+            self.misses += 1
+        res = handle_request(req)
+        if method == 'GET':
+            self._store(base, environ, res, now)
+        return res
+
+    def _store(self, base, environ, res, now):
+        """
+        Store res as the response to the request with the specified environ if it can be
+        cached.
+        """
+        if not res.status.startswith('200') or res.streaming:
+            return
+        headers = dict((name.lower(), value) for (name, value) in res.headerlist)
+        if 'set-cookie' in headers:
+            return
+        if ('HTTP_AUTHORIZATION' in environ and
+                'public' not in headers.get('cache-control', '')):
+            return
+        vary = tuple(sorted(name.strip().lower()
+                            for name in headers.get('vary', '').split(',') if name.strip()))
+        if '*' in vary:
+            return
+        ttl = _ttl(headers, now)
+        if ttl <= 0:
+            return
+        headerlist = [(name, value) for (name, value) in res.headerlist
+                      if name.lower() != 'content-length']
+        entry = _Entry(base, res.status, headerlist, res.body, now, now + ttl)
+        if entry.size > self._max_bytes:
+            return
+        key = self._key(base, vary, environ)
+        with self._lock:
+            self._vary[base] = vary
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            if len(self._vary) > 2 * self._max_entries:
+                self._vary = dict((entry.base, self._vary[entry.base])
+                                  for entry in self._entries.values())
+
+    def invalidate(self, prefix='/'):
+        """
+        Remove the cached responses to requests whose path starts with prefix.
+
+        prefix -- str that specifies the path prefix. '/' by default.
+        """
+        with self._lock:
+            for key in [key for (key, entry) in self._entries.items()
+                        if entry.base[1].startswith(prefix)]:
+                self._remove(key)
+            for base in [base for base in self._vary if base[1].startswith(prefix)]:
+                del self._vary[base]
@@ -1,33 +1,101 @@
 import re
 from weppy.http import *
 
+# request methods dispatched to the handler methods of the same name in lower case
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS')
+
 class Handler(object):
     """
     Handle requests.
+
+    The handler methods are looked up once, when the handler is created. HEAD requests are
+    dispatched to the head method, if any, or else to the get method, and the body of the
+    response is discarded without being generated if it is streaming. OPTIONS requests are
+    answered with the 'Allow' header unless there is an options method, and requests with other
+    methods are answered with a 405 response with the 'Allow' header.
+
+    A handler class may set etag to 'strong' or 'weak' to compute an 'ETag' header for the
+    buffered bodies of GET and HEAD responses and answer matching 'If-None-Match' headers with
+    a 304 response. It defaults to the etag of the application. A handler class may also define
+    a validator(req, *args) method that returns a cheap str validator, e.g. a version or an
+    mtime, for the resource. It is called before the get method, which is not called if the
+    validator matches the 'If-None-Match' header.
+
+    Handler methods return an HTTPResponse, or a body for an HTTPResponse: a str, bytes or an
+    iterable of them, e.g. a generator, except that a dict or a list is returned as a
+    JSONResponse.
     """
 
+    etag = None
+    validator = None
+
     def __init__(self, url_pattern):
-        self._url_regex = re.compile(r'^%s$' % re.escape(url_pattern).replace('\_', '([^/]+)'))
+        self._url_pattern = url_pattern
+        self._url_regex = re.compile(r'^%s$' % re.escape(url_pattern).replace('\_', '([^/]+)')
+                                     .replace('\*', '(.+)'))
+        self._methods = {}
+        for method in METHODS:
+            handler_method = getattr(self, method.lower(), None)
+            if handler_method is not None:
+                self._methods[method] = handler_method
+        if 'HEAD' not in self._methods and 'GET' in self._methods:
+            self._methods['HEAD'] = self._methods['GET']
+        if 'OPTIONS' not in self._methods:
+            self._methods['OPTIONS'] = self._options
+        self._allow = ', '.join(method for method in METHODS if method in self._methods)
 
     def __call__(self, req, *args):
         """
         Call the appropriate handler method and return an HTTPResponse, or raise an
         HTTPMethodNotAllowed exception if it does not exist.
         """
-        http_method = req.method.lower()
-        if http_method == 'head':
-            http_method = 'get'
-        try:
-            handler_method = getattr(self, http_method)
-        except:
-            raise HTTPMethodNotAllowed()
-        res = handler_method(req, *args)
-        if isinstance(res, str):
+        handler_method, etag, res = self._dispatch(req, args)
+        if res is not None:
+            return res
+        return self._finish(req, handler_method(req, *args), etag)
+
+    def _dispatch(self, req, args):
+        """
+        Return a tuple (handler method, entity tag from the validator, HTTPNotModified response
+        or None), or raise an HTTPMethodNotAllowed exception if the handler method does not
+        exist.
+        """
+        handler_method = self._methods.get(req.method)
+        if handler_method is None:
+            raise HTTPMethodNotAllowed(self._allow)
+        etag = None
+        if self.validator is not None and req.method in ('GET', 'HEAD'):
+            validator = self.validator(req, *args)
+            if validator is not None:
+                etag = ('W/"%s"' if self.etag == 'weak' else '"%s"') % validator
+                if req.etag_matches(etag):
+                    return handler_method, etag, HTTPNotModified([('ETag', etag)])
+        return handler_method, etag, None
+
+    def _finish(self, req, res, etag):
+        """
+        Return the HTTPResponse for the value res returned by the handler method.
+        """
+        if isinstance(res, (dict, list)):
+            res = JSONResponse(res)
+        elif not isinstance(res, HTTPResponse):
             res = HTTPResponse(res)
-        if req.method.lower() == 'head':
-            res = HTTPResponse('', res.status, res.content_type, res.charset, res.headerlist)
+        mode = self.etag if self.etag is not None else req.environ.get('weppy.etag')
+        if etag is not None:
+            if res.etag is None and res.status.startswith('200'):
+                res.headerlist.append(('ETag', etag))
+        elif req.method in ('GET', 'HEAD') and mode is not None:
+            res = res.conditional(req, mode == 'weak')
+        if req.method == 'HEAD':
+            res.discard_body()
         return res
 
+    def _options(self, req, *args):
+        """
+        Return the response to an OPTIONS request, with the 'Allow' header.
+        """
+        return HTTPResponse('', headerlist=[('Allow', self._allow), ('Content-Length', '0')])
+
 class url(object):
     """
     Decorator to turn a class into a Handler instance.
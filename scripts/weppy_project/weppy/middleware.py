@@ -0,0 +1,72 @@
+class Middleware(object):
+    """
+    Base class of middleware, which hooks into the processing of requests.
+
+    Subclasses define any of the following methods, the others being None:
+
+    before(req) -- called before the request is processed. Returning an HTTPResponse skips
+                   the rest of the chain, including the after hook of this middleware;
+                   returning None continues.
+    after(req, res) -- called with the HTTPResponse of the rest of the chain. Returns the
+                       HTTPResponse to use, res or another one.
+    exception(req, error) -- called with an exception raised by the rest of the chain.
+                             Returning an HTTPResponse handles the exception, which is
+                             otherwise raised again when None is returned.
+    """
+
+    before = None
+    after = None
+    exception = None
+
+def _wrap_before(before, call):
+    """
+    Return a function that calls before, then call unless before returned a response.
+    """
+    def wrapper(req, *args):
+        res = before(req)
+        if res is not None:
+            return res
+        return call(req, *args)
+    return wrapper
+
+def _wrap_after(after, call):
+    """
+    Return a function that calls call, then after with its response.
+    """
+    def wrapper(req, *args):
+        return after(req, call(req, *args))
+    return wrapper
+
+def _wrap_exception(exception, call):
+    """
+    Return a function that calls call, and exception with the exceptions it raises.
+    """
+    def wrapper(req, *args):
+        try:
+            return call(req, *args)
+        except Exception as error:
+            res = exception(req, error)
+            if res is None:
+                raise
+            return res
+    return wrapper
+
+def compose(middlewares, call):
+    """
+    Return a function with the same arguments as call, which passes the request through the
+    hooks of middlewares, the first one being the outermost, around call. Only the hooks
+    defined by each middleware are added to the chain, so a request does not iterate over
+    middlewares.
+
+    middlewares -- list of Middleware instances.
+    call -- function that takes an HTTPRequest and positional arguments and returns an
+            HTTPResponse.
+    """
+    for middleware in reversed(middlewares):
+        if middleware.exception is not None:
+            call = _wrap_exception(middleware.exception, call)
+        if middleware.after is not None:
+            call = _wrap_after(middleware.after, call)
+        if middleware.before is not None:
+            call = _wrap_before(middleware.before, call)
+    return call
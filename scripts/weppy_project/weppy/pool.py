@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+class PoolTimeout(Exception):
+    """
+    Exception raised when no resource of a pool is available before the checkout timeout.
+    """
+
+def _close(resource):
+    """
+    Close a resource with its close method, if it has one.
+    """
+    close = getattr(resource, 'close', None)
+    if close is not None:
+        close()
+
+class Pool(object):
+    """
+    Bounded pool of resources, e.g. SQLite or socket connections, shared by the threads of a
+    process.
+
+    Resources are created on demand up to the size of the pool, and the most recently
+    returned idle resource is checked out first, after a health check if it has been idle for
+    a while. Resources inherited from the parent process are dropped without being closed
+    after a fork, so that a pool can be created before forking.
+    """
+
+    def __init__(self, create, size=8, timeout=5.0, check=None, check_interval=30.0,
+                 reset=None, close=None, max_idle=None):
+        """
+        create -- function that returns a new resource, e.g.
+                  lambda: sqlite3.connect(path, check_same_thread=False).
+        size -- int that specifies the maximum number of resources. 8 by default.
+        timeout -- float that specifies how many seconds acquire waits for a resource by
+                   default. 5 by default.
+        check -- function that returns whether a resource is healthy, e.g.
+                 lambda conn: conn.execute('SELECT 1'), where raising an exception or returning
+                 False discards the resource. None does not check resources. None by default.
+        check_interval -- float that specifies how many seconds a resource is idle before it
+                          is checked on checkout. 0 checks it on every checkout. 30 by
+                          default.
+        reset -- function called with a resource when it is released, e.g.
+                 lambda conn: conn.rollback(), where raising an exception discards the
+                 resource. None by default.
+        close -- function that closes a discarded resource. None calls its close method, if
+                 any. None by default.
+        max_idle -- float that specifies how many seconds an idle resource is kept before it
+                    is closed on checkout. None keeps idle resources. None by default.
+        """
+        self._create = create
+        self._size = size
+        self._timeout = timeout
+        self._check = check
+        self._check_interval = check_interval
+        self._reset = reset
+        self._close = close or _close
+        self._max_idle = max_idle
+        self._condition = threading.Condition(threading.Lock())
+        self._idle = deque()
+        self._count = 0
+        self._pid = os.getpid()
+        self._closed = False
+
+    size = property(lambda self: self._size)
+    count = property(lambda self: self._count)
+    idle = property(lambda self: len(self._idle))
+
+    def _check_fork(self):
+        """
+        Forget the resources inherited from the parent process after a fork.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._condition = threading.Condition(threading.Lock())
+            self._idle = deque()
+            self._count = 0
+
+    def acquire(self, timeout=None):
+        """
+        Check out a resource, creating one if the pool is not full, or raise a PoolTimeout
+        exception if none is available before the timeout.
+
+        timeout -- float that specifies how many seconds to wait for a resource. None uses
+                   the timeout of the pool. None by default.
+        """
+        self._check_fork()
+        if timeout is None:
+            timeout = self._timeout
+        deadline = time.time() + timeout
+        while True:
+            with self._condition:
+                while not self._idle and self._count >= self._size:
+                    if self._closed:
+                        raise RuntimeError('pool is closed')
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolTimeout('no resource available in %g seconds' % timeout)
+                    self._condition.wait(remaining)
+                if self._closed:
+                    raise RuntimeError('pool is closed')
+                if self._idle:
+                    resource, released = self._idle.pop()
+                else:
+                    self._count += 1
+                    resource = released = None
+            if released is None:
+                try:
+                    return self._create()
+                except BaseException:
+                    self._forget()
+                    raise
+            idle = time.time() - released
+            if self._max_idle is not None and idle > self._max_idle:
+                self._discard(resource)
+            elif self._check is None or idle < self._check_interval or self._healthy(resource):
+                return resource
+
+    def _healthy(self, resource):
+        """
+        Return whether the health check passes for resource, or discard it.
+        """
+        try:
+            healthy = self._check(resource) is not False
+        except Exception:
+            healthy = False
+        if not healthy:
+            self._discard(resource)
+        return healthy
+
+    def release(self, resource, discard=False):
+        """
+        Return a checked out resource to the pool.
+
+        resource -- resource returned by acquire.
+        discard -- bool that specifies whether the resource is closed instead, e.g. if it is
+                   broken. False by default.
+        """
+        if self._pid != os.getpid():
+            return
+        if not discard and self._reset is not None:
+            try:
+                self._reset(resource)
+            except Exception:
+                discard = True
+        if discard or self._closed:
+            self._discard(resource)
+            return
+        with self._condition:
+            self._idle.append((resource, time.time()))
+            self._condition.notify()
+
+    def _discard(self, resource):
+        """
+        Close a checked out resource and free its place in the pool.
+        """
+        try:
+            self._close(resource)
+        except Exception:
+            pass
+        self._forget()
+
+    def _forget(self):
+        """
+        Free the place of a resource in the pool.
+        """
+        with self._condition:
+            self._count -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Return a context manager that checks out a resource and returns it to the pool, or
+        discards it if an exception is raised.
+
+        timeout -- float that specifies how many seconds to wait for a resource. None uses
+                   the timeout of the pool. None by default.
+        """
+        resource = self.acquire(timeout)
+        try:
+            yield resource
+        except BaseException:
+            self.release(resource, discard=True)
+            raise
+        self.release(resource)
+
+    def close(self):
+        """
+        Close the idle resources, and the checked out ones when they are released.
+        """
+        self._check_fork()
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._condition.notify_all()
+        for (resource, released) in idle:
+            self._discard(resource)
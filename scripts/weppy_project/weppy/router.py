@@ -0,0 +1,166 @@
+import re
+
+class _Node(object):
+    """
+    Segment of a URL pattern in the Router trie.
+    """
+
+    __slots__ = ('static', 'patterns', 'wildcard', 'catchall', 'handler')
+
+    def __init__(self):
+        self.static = {}
+        self.patterns = []
+        self.wildcard = None
+        self.catchall = None
+        self.handler = None
+
+class Router(object):
+    """
+    Resolve request paths to Handler instances through a trie of URL pattern segments.
+
+    Each '_' in a URL pattern is a placeholder for a non-empty part of a segment, and a '*'
+    last segment is a placeholder for the non-empty rest of the path. Static segments take
+    precedence over placeholders, from left to right, so the first match does not depend on
+    the order in which handlers were added.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    def add(self, url_pattern, handler):
+        """
+        Add a handler for the specified URL pattern, replacing any handler previously added for
+        the same pattern.
+
+        url_pattern -- str that specifies the URL pattern, e.g. '/metal/_/food/_/'.
+        handler -- object that handles the requests matching url_pattern.
+        """
+        node = self._root
+        segments = url_pattern.split('/')
+        for (index, segment) in enumerate(segments):
+            if segment == '*':
+                if index != len(segments) - 1:
+                    raise ValueError('* must be the last segment of %r' % url_pattern)
+                if node.catchall is None:
+                    node.catchall = _Node()
+                node = node.catchall
+            elif segment == '_':
+                if node.wildcard is None:
+                    node.wildcard = _Node()
+                node = node.wildcard
+            elif '_' in segment:
+                regex = re.compile(r'^%s$' % '([^/]+)'.join(re.escape(part)
+                                                          for part in segment.split('_')))
+                for (pattern_regex, child) in node.patterns:
+                    if pattern_regex.pattern == regex.pattern:
+                        node = child
+                        break
+                else:
+                    child = _Node()
+                    node.patterns.append((regex, child))
+                    node = child
+            else:
+                child = node.static.get(segment)
+                if child is None:
+                    child = node.static[segment] = _Node()
+                node = child
+        node.handler = handler
+
+    def dump(self, key):
+        """
+        Return the trie as dicts and lists that can be serialized to JSON, e.g. in a route
+        manifest, and loaded with load.
+
+        key -- function that returns the value that stands for a handler, e.g. its URL pattern.
+        """
+        def dump_node(node):
+            return {
+                'static': dict((segment, dump_node(child))
+                               for (segment, child) in node.static.items()),
+                'patterns': [[regex.pattern, dump_node(child)]
+                             for (regex, child) in node.patterns],
+                'wildcard': dump_node(node.wildcard) if node.wildcard is not None else None,
+                'catchall': dump_node(node.catchall) if node.catchall is not None else None,
+                'handler': key(node.handler) if node.handler is not None else None,
+            }
+        return dump_node(self._root)
+
+    @classmethod
+    def load(cls, data, handler):
+        """
+        Return a Router with the trie returned by dump, without parsing URL patterns again.
+
+        data -- dict returned by dump.
+        handler -- function that returns the handler that a value returned by the key function
+                   of dump stands for.
+        """
+        def load_node(data):
+            node = _Node()
+            node.static = dict((segment, load_node(child))
+                               for (segment, child) in data['static'].items())
+            node.patterns = [(re.compile(pattern), load_node(child))
+                             for (pattern, child) in data['patterns']]
+            if data['wildcard'] is not None:
+                node.wildcard = load_node(data['wildcard'])
+            if data['catchall'] is not None:
+                node.catchall = load_node(data['catchall'])
+            if data['handler'] is not None:
+                node.handler = handler(data['handler'])
+            return node
+        router = cls()
+        router._root = load_node(data)
+        return router
+
+    def resolve(self, path):
+        """
+        Return a tuple (handler, args, redirect) for the specified path in a single walk of the
+        trie. handler is None if no URL pattern matches path, and redirect is True if a URL
+        pattern matches path with a slash appended.
+
+        path -- str that specifies the request path.
+        """
+        args = []
+        redirect = []
+        handler = self._match(self._root, path.split('/'), 0, args, redirect)
+        if handler is not None:
+            return handler, args, False
+        return None, [], bool(redirect)
+
+    def _match(self, node, segments, index, args, redirect):
+        """
+        Return the handler of the first URL pattern that matches segments from index on, or
+        None. Placeholder values are appended to args and a redirect candidate to redirect.
+        """
+        if index == len(segments):
+            if node.handler is None and not redirect:
+                child = node.static.get('')
+                if child is not None and child.handler is not None:
+                    redirect.append(child.handler)
+            return node.handler
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            handler = self._match(child, segments, index + 1, args, redirect)
+            if handler is not None:
+                return handler
+        if not segment:
+            return None
+        for (regex, child) in node.patterns:
+            match = regex.match(segment)
+            if match is not None:
+                size = len(args)
+                args.extend(match.groups())
+                handler = self._match(child, segments, index + 1, args, redirect)
+                if handler is not None:
+                    return handler
+                del args[size:]
+        if node.wildcard is not None:
+            args.append(segment)
+            handler = self._match(node.wildcard, segments, index + 1, args, redirect)
+            if handler is not None:
+                return handler
+            args.pop()
+        if node.catchall is not None and node.catchall.handler is not None:
+            args.append('/'.join(segments[index:]))
+            return node.catchall.handler
+        return None
@@ -0,0 +1,248 @@
+import mimetypes
+import os
+import stat
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from email.utils import formatdate, mktime_tz, parsedate_tz
+from weppy.handler import Handler
+from weppy.http import *
+
+try:
+    from urllib.parse import unquote
+except ImportError:
+    from urllib import unquote
+
+def _read_file(path, offset, length, block_size):
+    """
+    Yield length bytes of the file at path from offset on, in blocks of at most block_size
+    bytes. The file is only opened when the first block is requested.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while length > 0:
+            data = f.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+# maximum number of ranges of a Range header, beyond which the whole file is sent
+MAX_RANGES = 16
+
+def _parse_range(header, size):
+    """
+    Return a sorted list of tuples (first, last) with the byte positions of the satisfiable
+    ranges in a Range header, where overlapping and adjacent ranges are merged, or None if the
+    header is malformed or has more than MAX_RANGES ranges.
+    """
+    unit, sep, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not sep:
+        return None
+    parts = spec.split(',')
+    if len(parts) > MAX_RANGES:
+        return None
+    ranges = []
+    for part in parts:
+        first, sep, last = part.strip().partition('-')
+        if not sep or not (first or last) or not (first + last).isdigit():
+            return None
+        if not first:
+            if int(last) > 0 and size > 0:
+                ranges.append((max(size - int(last), 0), size - 1))
+        elif int(first) < size:
+            if last and int(last) < int(first):
+                return None
+            ranges.append((int(first), min(int(last), size - 1) if last else size - 1))
+    merged = []
+    for (first, last) in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+class FileResponse(HTTPResponse):
+    """
+    Response that streams a file, or a part of it, without reading it into memory. The whole
+    file is handed to the server's wsgi.file_wrapper if it provides one.
+    """
+
+    def __init__(self, path, offset=0, length=None, status=200,
+                 content_type='application/octet-stream', headerlist=None,
+                 block_size=64 * 1024, size=None):
+        """
+        path -- str that specifies the file path.
+        offset -- int that specifies the position of the first byte to send. 0 by default.
+        length -- int that specifies the number of bytes to send. None sends the rest of the
+                  file. None by default.
+        status -- int that specifies the status code. 200 by default.
+        content_type -- str that specifies the content type. 'application/octet-stream' by
+                        default.
+        headerlist -- list of tuples that specifies additional header values. None by default.
+        block_size -- int that specifies the size in bytes of the blocks read from the file.
+                      64 KB by default.
+        size -- int that specifies the size in bytes of the file, e.g. from a cached stat.
+                None gets it from the file system. None by default.
+        """
+        if size is None:
+            size = os.path.getsize(path)
+        if length is None:
+            length = size - offset
+        self._path = path
+        self._block_size = block_size
+        self._whole = offset == 0 and length == size
+        headerlist = [('Content-Type', content_type),
+                      ('Content-Length', str(length))] + list(headerlist or [])
+        body = _read_file(path, offset, length, block_size)
+        super(FileResponse, self).__init__(body, status, content_type, None, headerlist)
+
+    def __call__(self, environ, start_response):
+        """
+        WSGI application interface.
+
+        environ and start_response -- objects provided by the WSGI server.
+        """
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is None or not self._whole or environ['REQUEST_METHOD'] == 'HEAD':
+            return super(FileResponse, self).__call__(environ, start_response)
+        self.close()
+        f = open(self._path, 'rb')
+        start_response(self.status, self.headerlist)
+        return file_wrapper(f, self._block_size)
+
+class StaticFileHandler(Handler):
+    """
+    Serve the files of a directory under a URL prefix, with conditional and Range requests.
+    """
+
+    def __init__(self, url_prefix, directory, max_age=None, precompressed=False,
+                 stat_ttl=1.0, max_stats=10000, block_size=64 * 1024):
+        """
+        url_prefix -- str that specifies the URL prefix, e.g. '/static/'.
+        directory -- str that specifies the path of the directory to serve.
+        max_age -- int that specifies the 'max-age' of the 'Cache-Control' header in seconds.
+                   None does not set the header. None by default.
+        precompressed -- bool that specifies whether a '.gz' sibling of a file is served
+                         instead of it to clients that accept gzip. False by default.
+        stat_ttl -- float that specifies for how many seconds file stats are cached. 1.0 by
+                    default.
+        max_stats -- int that specifies the maximum number of cached file stats. 10000 by
+                     default.
+        block_size -- int that specifies the size in bytes of the blocks read from files.
+                      64 KB by default.
+        """
+        super(StaticFileHandler, self).__init__(url_prefix.rstrip('/') + '/*')
+        self._directory = os.path.abspath(directory)
+        self._max_age = max_age
+        self._precompressed = precompressed
+        self._stat_ttl = stat_ttl
+        self._max_stats = max_stats
+        self._block_size = block_size
+        self._stats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _stat(self, path):
+        """
+        Return a tuple (stat, etag) for the regular file at path, or (None, None) if there is
+        none, from the cache if it has not expired. The oldest stats are evicted first.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._stats.get(path)
+        if entry is None or entry[0] < now:
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is not None and not stat.S_ISREG(st.st_mode):
+                st = None
+            etag = None if st is None else '"%x-%x"' % (int(st.st_mtime * 1000), st.st_size)
+            entry = (now + self._stat_ttl, st, etag)
+            with self._lock:
+                self._stats.pop(path, None)
+                self._stats[path] = entry
+                while len(self._stats) > self._max_stats:
+                    self._stats.popitem(False)
+        return entry[1], entry[2]
+
+    def _not_modified(self, req, st, etag):
+        """
+        Return whether the client has the file according to the 'If-None-Match' or
+        'If-Modified-Since' header.
+        """
+        if req.if_none_match is not None:
+            return req.etag_matches(etag)
+        if_modified_since = req.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            since = parsedate_tz(if_modified_since)
+            return since is not None and int(st.st_mtime) <= mktime_tz(since)
+        return False
+
+    def get(self, req, path):
+        """
+        Return a response with the file at path, a part of it or a 304 response, or raise an
+        HTTPNotFound exception if it does not exist.
+        """
+        path = os.path.normpath(os.path.join(self._directory, unquote(path)))
+        if not path.startswith(self._directory + os.sep) or '\0' in path:
+            raise HTTPNotFound()
+        st, etag = self._stat(path)
+        if st is None:
+            raise HTTPNotFound()
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        headerlist = [('Accept-Ranges', 'bytes')]
+        if self._precompressed:
+            headerlist.append(('Vary', 'Accept-Encoding'))
+            if 'gzip' in req.accept_encoding:
+                gzip_st, gzip_etag = self._stat(path + '.gz')
+                if gzip_st is not None:
+                    path, st, etag = path + '.gz', gzip_st, gzip_etag
+                    headerlist.append(('Content-Encoding', 'gzip'))
+        headerlist.append(('ETag', etag))
+        headerlist.append(('Last-Modified', formatdate(st.st_mtime, usegmt=True)))
+        if self._max_age is not None:
+            headerlist.append(('Cache-Control', 'max-age=%d' % self._max_age))
+        if self._not_modified(req, st, etag):
+            return HTTPNotModified(headerlist)
+        ranges = None
+        if 'Range' in req.headers and req.headers.get('If-Range', etag) == etag:
+            ranges = _parse_range(req.headers['Range'], st.st_size)
+        if ranges is None:
+            return FileResponse(path, 0, st.st_size, 200, content_type, headerlist,
+                                self._block_size, st.st_size)
+        if not ranges:
+            return HTTPResponse(b'', 416, content_type, None,
+                                headerlist + [('Content-Range', 'bytes */%d' % st.st_size)])
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            headerlist.append(('Content-Range', 'bytes %d-%d/%d' % (first, last, st.st_size)))
+            return FileResponse(path, first, last - first + 1, 206, content_type, headerlist,
+                                self._block_size, st.st_size)
+        boundary = uuid.uuid4().hex
+        parts = []
+        length = 0
+        for (first, last) in ranges:
+            header = ('--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n' %
+                      (boundary, content_type, first, last, st.st_size)).encode('latin-1')
+            parts.append((header, first, last))
+            length += len(header) + last - first + 1 + 2
+        trailer = ('--%s--\r\n' % boundary).encode('latin-1')
+        length += len(trailer)
+        multipart_type = 'multipart/byteranges; boundary=%s' % boundary
+        headerlist = [('Content-Type', multipart_type),
+                      ('Content-Length', str(length))] + headerlist
+        return HTTPResponse(self._iter_parts(path, parts, trailer), 206, multipart_type, None,
+                            headerlist)
+
+    def _iter_parts(self, path, parts, trailer):
+        """
+        Yield the body of a multipart/byteranges response.
+        """
+        for (header, first, last) in parts:
+            yield header
+            for data in _read_file(path, first, last - first + 1, self._block_size):
+                yield data
+            yield b'\r\n'
+        yield trailer
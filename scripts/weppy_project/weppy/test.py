@@ -1,8 +1,18 @@
+import threading
+import time
+from timeit import default_timer
+from webob.compat import url_encode
 from weppy.http import *
 
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
 class Client(object):
     """
-    HTTP client adapted to WSGIApplication.
+    HTTP client adapted to WSGIApplication. Requests are finalized as soon as their response is
+    returned.
     """
 
     def __init__(self, app):
@@ -11,12 +21,19 @@ class Client(object):
 
     def set_cookies(self, res):
         """
-        Set cookies of an HTTPResponse to client.
+        Set cookies of an HTTPResponse to client, ignoring their attributes except for a
+        'Max-Age' of 0, which deletes them.
         """
-        cookie_header = dict(res.headerlist).get('Set-Cookie', '')
-        for cookie in cookie_header.split(';'):
-            if cookie:
-                key, value = cookie.strip().split('=')
+        for (name, header) in res.headerlist:
+            if name.lower() != 'set-cookie':
+                continue
+            attributes = header.split(';')
+            key, sep, value = attributes[0].strip().partition('=')
+            if not key:
+                continue
+            if any(attribute.strip().lower() == 'max-age=0' for attribute in attributes[1:]):
+                self._cookies.pop(key, None)
+            else:
                 self._cookies[key] = value
 
     def http_cookies(self):
@@ -32,6 +49,7 @@ class Client(object):
         """
         req = HTTPRequest.get(path_info=path, headers={'HTTP_COOKIE': self.http_cookies()})
         res = self._app.handle_request(req)
+        req.finalize()
         self.set_cookies(res)
         return res
 
@@ -43,6 +61,7 @@ class Client(object):
         req = HTTPRequest.post(path_info=path, params=params,
                                headers={'HTTP_COOKIE': self.http_cookies()})
         res = self._app.handle_request(req)
+        req.finalize()
         self.set_cookies(res)
         return res
 
@@ -54,6 +73,7 @@ class Client(object):
         req = HTTPRequest.put(path_info=path, params=params,
                               headers={'HTTP_COOKIE': self.http_cookies()})
         res = self._app.handle_request(req)
+        req.finalize()
         self.set_cookies(res)
         return res
 
@@ -64,6 +84,7 @@ class Client(object):
         """
         req = HTTPRequest.delete(path_info=path, headers={'HTTP_COOKIE': self.http_cookies()})
         res = self._app.handle_request(req)
+        req.finalize()
         self.set_cookies(res)
         return res
 
@@ -74,5 +95,261 @@ class Client(object):
         """
         req = HTTPRequest.head(path_info=path, headers={'HTTP_COOKIE': self.http_cookies()})
         res = self._app.handle_request(req)
+        req.finalize()
         self.set_cookies(res)
         return res
+
+    def route(self, path):
+        """
+        Return the URL pattern of the handler of path, or path if there is none.
+        """
+        handler = self._app._router.resolve(path)[0]
+        return handler._url_pattern if handler is not None else path
+
+class SocketClient(Client):
+    """
+    HTTP client with the interface of Client that sends requests to a running server over a
+    persistent connection.
+    """
+
+    def __init__(self, host, port, timeout=30):
+        """
+        host -- str that specifies the server address.
+        port -- int that specifies the server port.
+        timeout -- float that specifies the socket timeout in seconds. 30 by default.
+        """
+        super(SocketClient, self).__init__(None)
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, params=None):
+        """
+        Return an HTTPResponse for a request to the server and process its headers. The
+        connection is opened again if the server closed it.
+        """
+        headers = {'Cookie': self.http_cookies()}
+        body = None
+        if params is not None:
+            body = url_encode(params).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in (0, 1):
+            if self._conn is None:
+                self._conn = HTTPConnection(self._host, self._port, timeout=self._timeout)
+            try:
+                self._conn.request(method, path, body, headers)
+                response = self._conn.getresponse()
+                data = response.read()
+                break
+            except Exception:
+                self.close()
+                if attempt:
+                    raise
+        if response.getheader('connection', '').lower() == 'close':
+            self.close()
+        headerlist = [(name.title(), value) for (name, value) in response.getheaders()
+                      if name.lower() != 'content-length']
+        res = HTTPResponse(data, response.status, None, None, headerlist)
+        self.set_cookies(res)
+        return res
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def post(self, path, params=None):
+        return self.request('POST', path, params or {})
+
+    def put(self, path, params=None):
+        return self.request('PUT', path, params or {})
+
+    def delete(self, path):
+        return self.request('DELETE', path)
+
+    def head(self, path):
+        return self.request('HEAD', path)
+
+    def route(self, path):
+        return path
+
+def _percentile(latencies, percent):
+    """
+    Return the percentile of a sorted list of latencies with the nearest-rank method.
+    """
+    if not latencies:
+        return 0.0
+    rank = int(len(latencies) * percent / 100.0 + 0.999999)
+    return latencies[min(max(rank, 1), len(latencies)) - 1]
+
+class LoadReport(object):
+    """
+    Throughput and latency percentiles of a load run, overall and by route.
+    """
+
+    # percentiles reported by summary
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self, duration, latencies, errors):
+        """
+        duration -- float that specifies the duration of the run in seconds.
+        latencies -- dict of lists of latencies in seconds by route.
+        errors -- dict of numbers of failed requests by route.
+        """
+        self.duration = duration
+        self.latencies = dict((route, sorted(values)) for (route, values) in latencies.items())
+        self.errors = errors
+
+    requests = property(lambda self: sum(len(values) for values in self.latencies.values()))
+    throughput = property(lambda self: self.requests / self.duration if self.duration else 0.0)
+
+    def routes(self):
+        """
+        Return the sorted list of routes.
+        """
+        return sorted(set(self.latencies) | set(self.errors))
+
+    def percentile(self, percent, route=None):
+        """
+        Return a latency percentile in seconds, for a route or for all requests.
+
+        percent -- float that specifies the percentile, e.g. 99.9.
+        route -- str that specifies the route, e.g. 'GET /item/_/'. None by default.
+        """
+        if route is not None:
+            return _percentile(self.latencies.get(route, []), percent)
+        return _percentile(sorted(latency for values in self.latencies.values()
+                                  for latency in values), percent)
+
+    def summary(self):
+        """
+        Return a table of the number of requests and errors, throughput and latency
+        percentiles in milliseconds by route, as a str.
+        """
+        header = '%-40s %8s %6s %9s' % ('route', 'requests', 'errors', 'req/s')
+        header += ''.join(' %8s' % ('p%g' % percent) for percent in self.PERCENTILES)
+        lines = [header]
+        for route in self.routes() + [None]:
+            if route is None:
+                label, count, errors = 'total', self.requests, sum(self.errors.values())
+            else:
+                label = route
+                count = len(self.latencies.get(route, []))
+                errors = self.errors.get(route, 0)
+            throughput = count / self.duration if self.duration else 0.0
+            line = '%-40s %8d %6d %9.1f' % (label, count, errors, throughput)
+            line += ''.join(' %8.2f' % (self.percentile(percent, route) * 1e3)
+                            for percent in self.PERCENTILES)
+            lines.append(line)
+        return '\n'.join(lines)
+
+class LoadDriver(object):
+    """
+    Send a scripted mix of requests from concurrent clients, either at full speed or at a
+    target rate, and report their latencies by route.
+
+    Each thread has its own client, and the n-th request sent is the n-th of the script,
+    repeated as needed, so that the mix of requests is that of the script. At a target rate,
+    requests are scheduled at regular intervals and their latency is measured from their
+    scheduled time, so that a slow server is not hidden by requests being sent late.
+    """
+
+    def __init__(self, client_factory, script, concurrency=10, rate=None):
+        """
+        client_factory -- function that returns a Client or a SocketClient.
+        script -- list of tuples (method, path) or (method, path, params) that specifies the
+                  requests, e.g. [('GET', '/'), ('POST', '/items/', {'name': 'a'})].
+        concurrency -- int that specifies the number of concurrent clients. 10 by default.
+        rate -- float that specifies the target number of requests per second. None sends
+                requests as fast as possible. None by default.
+        """
+        self._client_factory = client_factory
+        self._script = [tuple(entry) for entry in script]
+        self._concurrency = concurrency
+        self._rate = rate
+
+    def _send(self, client, entry):
+        """
+        Send a request of the script and return its response, after iterating and closing its
+        body if it is streaming, so that its latency includes the generation of the body.
+        """
+        method = entry[0].lower()
+        if len(entry) > 2:
+            res = getattr(client, method)(entry[1], entry[2])
+        else:
+            res = getattr(client, method)(entry[1])
+        if res.streaming:
+            try:
+                for chunk in res.app_iter:
+                    pass
+            finally:
+                res.close()
+        return res
+
+    def run(self, requests=None, duration=None):
+        """
+        Send requests until the specified number was sent or the duration elapsed, and return
+        a LoadReport. Requests that raise an exception or return a 5xx status are errors.
+
+        requests -- int that specifies the number of requests. None by default.
+        duration -- float that specifies the duration in seconds. None by default.
+        """
+        if requests is None and duration is None:
+            raise ValueError('requests or duration must be specified')
+        lock = threading.Lock()
+        counter = [0]
+        latencies = {}
+        errors = {}
+        start = default_timer()
+        end = start + duration if duration is not None else None
+
+        def work():
+            client = self._client_factory()
+            thread_latencies = {}
+            thread_errors = {}
+            while True:
+                with lock:
+                    number = counter[0]
+                    counter[0] += 1
+                if requests is not None and number >= requests:
+                    break
+                scheduled = default_timer()
+                if self._rate is not None:
+                    scheduled = start + number / float(self._rate)
+                    delay = scheduled - default_timer()
+                    if delay > 0:
+                        time.sleep(delay)
+                if end is not None and max(scheduled, default_timer()) >= end:
+                    break
+                entry = self._script[number % len(self._script)]
+                route = '%s %s' % (entry[0].upper(), client.route(entry[1]))
+                try:
+                    res = self._send(client, entry)
+                except Exception:
+                    thread_errors[route] = thread_errors.get(route, 0) + 1
+                    continue
+                thread_latencies.setdefault(route, []).append(default_timer() - scheduled)
+                if res.status.startswith('5'):
+                    thread_errors[route] = thread_errors.get(route, 0) + 1
+            close = getattr(client, 'close', None)
+            if close is not None:
+                close()
+            with lock:
+                for (route, values) in thread_latencies.items():
+                    latencies.setdefault(route, []).extend(values)
+                for (route, count) in thread_errors.items():
+                    errors[route] = errors.get(route, 0) + count
+
+        threads = [threading.Thread(target=work) for i in range(self._concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return LoadReport(default_timer() - start, latencies, errors)
@@ -1,54 +1,471 @@
+import importlib
 import inspect
+import json
+import os
+import pkgutil
+import sys
+import threading
 import traceback
+import types
+from timeit import default_timer
 from weppy.handler import *
 from weppy.http import *
+from weppy.middleware import compose
+from weppy.router import Router
+
+def _profiled(profiler, handler):
+    """
+    Return a function that calls handler through profiler.
+    """
+    def call(req, *args):
+        return profiler(handler, req, args)
+    return call
+
+def _controller_mtime(name):
+    """
+    Return the modification time of the source file of a controller module, without importing
+    it, or None if it is not found.
+    """
+    try:
+        return os.path.getmtime(pkgutil.get_loader(name).get_filename(name))
+    except (AttributeError, ImportError, OSError, TypeError):
+        return None
+
+class _FinalizingBody(object):
+    """
+    WSGI response body that finalizes its request when the server closes it, after sending it.
+    """
+
+    def __init__(self, result, req):
+        self._result = result
+        self._req = req
+
+    def __iter__(self):
+        return iter(self._result)
+
+    def close(self):
+        try:
+            close = getattr(self._result, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._req.finalize()
+
+def _finalizing(result, req, environ):
+    """
+    Return the result of a WSGI application arranged to finalize req when the server closes
+    it. A result of the wsgi.file_wrapper of the server is returned itself, with the
+    finalization chained to its close method, so that the server can still send the file with
+    sendfile.
+    """
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if not inspect.isclass(file_wrapper) or not isinstance(result, file_wrapper):
+        return _FinalizingBody(result, req)
+    close = getattr(result, 'close', None)
+
+    def finalize():
+        try:
+            if close is not None:
+                close()
+        finally:
+            req.finalize()
+
+    result.close = finalize
+    return result
+
+# version of the format of route manifests
+MANIFEST_VERSION = 2
+
+class _LazyHandler(object):
+    """
+    Handler listed in a route manifest, whose controller module is imported on first use, when
+    it is replaced by the Handler instance in the application.
+    """
+
+    def __init__(self, app, url_pattern, module, name):
+        self._app = app
+        self._url_pattern = url_pattern
+        self._module = module
+        self._name = name
+
+    def _load(self):
+        """
+        Import the Handler instance and add it to the application in place of this one, or
+        raise a RuntimeError exception if the manifest is out of date.
+        """
+        handler = getattr(importlib.import_module(self._module), self._name, None)
+        if getattr(handler, '_url_pattern', None) != self._url_pattern:
+            raise RuntimeError('route manifest is out of date: %s.%s does not handle %r' %
+                               (self._module, self._name, self._url_pattern))
+        if self._app._handlers.get(self._url_pattern) is self:
+            self._app.add_handler(handler)
+        return handler
+
+    def __call__(self, req, *args):
+        return self._load()(req, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
 
 class WSGIApplication(object):
     """
     WSGI application interface.
+
+    Startup hooks run once per process before it serves requests, i.e. in each worker process
+    after it is forked, and shutdown hooks when it stops, before the pools of resources added
+    to the application are closed. Handlers borrow resources from the pools with
+    HTTPRequest.borrow.
     """
 
-    def __init__(self, debug, controllers=None):
+    def __init__(self, debug, controllers=None, cache=None, etag=None, compressor=None,
+                 metrics=None, profiler=None, middleware=None, rate_limiter=None, tasks=None,
+                 manifest=None):
         """
-        Inspect controller modules to find Handler instances.
+        Inspect controller modules to find Handler instances, or load their routes from a
+        route manifest.
+
+        debug -- bool that specifies whether it is a development environment.
+        controllers -- list of controller modules, or of their names, which are imported if
+                       the routes are not loaded from a manifest. None by default.
+        cache -- weppy.cache.ResponseCache that serves and stores responses. None does not
+                 cache responses. None by default.
+        etag -- str that specifies whether an 'ETag' header is computed for the buffered bodies
+                of all GET and HEAD responses, as with the etag attribute of handlers, which
+                defaults to it, and whether matching 'If-None-Match' headers are answered with
+                a 304 response, including for cached responses: 'strong', 'weak' or None. None
+                by default.
+        compressor -- weppy.compression.Compressor that compresses responses. None does not
+                      compress responses. None by default.
+        metrics -- weppy.metrics.Metrics that records the requests received through the WSGI
+                   interface. None does not record requests. None by default.
+        profiler -- weppy.profiler.Profiler that profiles a fraction of the calls of handlers.
+                    None does not profile handlers. None by default.
+        middleware -- list of weppy.middleware.Middleware instances applied to all requests,
+                      as with add_middleware. None by default.
+        rate_limiter -- weppy.ratelimit.RateLimiter that rejects requests with a 429 response
+                        before any other processing. None does not limit requests. None by
+                        default.
+        tasks -- weppy.tasks.TaskQueue that runs the functions scheduled by handlers with
+                 HTTPRequest.after_response, and is drained on shutdown. None runs them when
+                 requests are finalized. None by default.
+        manifest -- str that specifies the path of a route manifest written by
+                    write_manifest. If it exists, lists the same controllers, whose files have
+                    not been modified since, and debug is not set, the routes are loaded from
+                    it, and each controller module is only imported on the first request for
+                    one of its routes. An out of date manifest is reported on stderr and the
+                    controllers are imported. None by default.
         """
         self._debug = debug
-        self._routes = {}
-        for controller in controllers or []:
-            for name, obj in inspect.getmembers(controller):
+        self._cache = cache
+        self._etag = etag
+        self._compressor = compressor
+        self._metrics = metrics
+        self._profiler = profiler
+        self._rate_limiter = rate_limiter
+        self._tasks = tasks
+        self._router = Router()
+        self._handlers = {}
+        self._chains = {}
+        self._middlewares = []
+        self._pools = {}
+        self._startup_hooks = []
+        self._shutdown_hooks = []
+        self._started = None
+        self._call = self._handle_request if cache is None else self._handle_cached
+        self._controllers = [controller.__name__ if isinstance(controller, types.ModuleType)
+                             else controller for controller in controllers or []]
+        for item in middleware or []:
+            self.add_middleware(item)
+        if manifest is None or debug or not self._load_manifest(manifest):
+            for controller in controllers or []:
+                self._add_controller(controller)
+
+    def _add_controller(self, controller):
+        """
+        Add the Handler instances of a controller module, imported if it is a name.
+        """
+        if not isinstance(controller, types.ModuleType):
+            controller = importlib.import_module(controller)
+        for name, obj in sorted(vars(controller).items()):
+            if isinstance(obj, Handler):
+                self.add_handler(obj)
+
+    def _load_manifest(self, path):
+        """
+        Add the handlers of a route manifest as _LazyHandler instances and return True, or
+        return False if it does not exist, or is out of date: of another version, for other
+        controllers, or written before their files were modified.
+        """
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if (manifest.get('version') != MANIFEST_VERSION or
+                manifest.get('controllers') != self._controllers or
+                manifest.get('mtimes') != [_controller_mtime(controller)
+                                           for controller in self._controllers]):
+            sys.stderr.write('Route manifest %s is out of date, importing the controllers\n' %
+                             path)
+            sys.stderr.flush()
+            return False
+        handlers = {}
+        for (url_pattern, module, name) in manifest['handlers']:
+            handlers[url_pattern] = _LazyHandler(self, url_pattern, module, name)
+        self._router = Router.load(manifest['router'], handlers.__getitem__)
+        for handler in handlers.values():
+            self._handlers[handler._url_pattern] = handler
+            self._compose_handler(handler)
+        return True
+
+    def write_manifest(self, path):
+        """
+        Import the controller modules and write the route manifest of this application, which
+        lists the URL patterns, the import paths of their handlers, the trie of the router and
+        the modification times of the controller files, so that applications created with it
+        do not import the controllers at startup. Handlers added with add_handler are not
+        listed.
+
+        path -- str that specifies the path of the manifest, e.g. 'routes.json'.
+        """
+        handlers = {}
+        for controller in self._controllers:
+            module = importlib.import_module(controller)
+            for name, obj in sorted(vars(module).items()):
                 if isinstance(obj, Handler):
-                    self.add_handler(obj)
+                    handlers[obj._url_pattern] = [obj._url_pattern, controller, name]
+        router = Router()
+        for url_pattern in handlers:
+            router.add(url_pattern, url_pattern)
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'controllers': self._controllers,
+            'mtimes': [_controller_mtime(controller) for controller in self._controllers],
+            'handlers': [handlers[url_pattern] for url_pattern in sorted(handlers)],
+            'router': router.dump(lambda url_pattern: url_pattern),
+        }
+        temporary = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+        with open(temporary, 'w') as f:
+            json.dump(manifest, f, indent=1, separators=(',', ': '), sort_keys=True)
+            f.write('\n')
+        os.rename(temporary, path)
 
     def add_handler(self, handler):
         """
         Add a Handler instance to this application.
         """
-        self._routes[handler._url_regex] = handler
+        self._router.add(handler._url_pattern, handler)
+        self._handlers[handler._url_pattern] = handler
+        self._compose_handler(handler)
+
+    def add_middleware(self, middleware, prefix=None):
+        """
+        Add a Middleware instance to this application. Middleware added first is the outermost.
+
+        Middleware without a prefix is applied to all requests, around the response cache and
+        the routing of the request, before the compression of the response. Middleware
+        with a prefix is applied to the requests routed to handlers whose URL pattern starts
+        with prefix, around the call of the handler. The chains of hooks are composed when
+        middleware and handlers are added, not for each request.
+
+        middleware -- weppy.middleware.Middleware.
+        prefix -- str that specifies the start of the URL patterns of the handlers to which the
+                  middleware is applied, e.g. '/admin/'. None by default.
+        """
+        self._middlewares.append((prefix, middleware))
+        if prefix is None:
+            inner = self._handle_request if self._cache is None else self._handle_cached
+            self._call = compose([item for (scope, item) in self._middlewares
+                                  if scope is None], inner)
+        else:
+            for handler in self._handlers.values():
+                self._compose_handler(handler)
+
+    def add_pool(self, name, pool):
+        """
+        Add a pool of resources to this application, from which handlers borrow resources with
+        HTTPRequest.borrow. The pool is closed on shutdown.
+
+        name -- str that specifies the name of the pool, e.g. 'db'.
+        pool -- weppy.pool.Pool.
+        """
+        self._pools[name] = pool
+
+    def on_startup(self, hook):
+        """
+        Add a function called without arguments when a process starts serving this
+        application, and return it, so that it can be used as a decorator.
+        """
+        self._startup_hooks.append(hook)
+        return hook
+
+    def on_shutdown(self, hook):
+        """
+        Add a function called without arguments when a process stops serving this application,
+        and return it, so that it can be used as a decorator. Shutdown hooks are called in the
+        reverse order of their addition.
+        """
+        self._shutdown_hooks.append(hook)
+        return hook
+
+    def startup(self):
+        """
+        Call the startup hooks, unless they were already called in this process. Servers call
+        it before serving requests.
+        """
+        pid = os.getpid()
+        if self._started == pid:
+            return
+        self._started = pid
+        for hook in self._startup_hooks:
+            hook()
+
+    def shutdown(self):
+        """
+        Wait for the queued tasks, then call the shutdown hooks and close the pools, if the
+        startup hooks were called in this process. Servers call it after serving requests.
+        """
+        if self._started != os.getpid():
+            return
+        self._started = None
+        try:
+            if self._tasks is not None:
+                self._tasks.drain()
+            for hook in reversed(self._shutdown_hooks):
+                hook()
+        finally:
+            for pool in self._pools.values():
+                pool.close()
+
+    def _compose_handler(self, handler):
+        """
+        Compose the chain of the middleware whose prefix matches the URL pattern of handler
+        around the call of handler.
+        """
+        pattern = handler._url_pattern
+        call = handler if self._profiler is None else _profiled(self._profiler, handler)
+        self._chains[pattern] = compose([item for (scope, item) in self._middlewares
+                                         if scope is not None and pattern.startswith(scope)],
+                                        call)
 
     def handle_request(self, req):
         """
-        Return an HTTPResponse processed by the appropriate Handler instance or by catching an
-        exception, or redirect the request by appending a slash to its path.
+        Return an HTTPResponse from the response cache, if any, or processed by the appropriate
+        Handler instance or by catching an exception, or redirect the request by appending a
+        slash to its path. Requests are first checked by the rate limiter, if any, then pass
+        through the middleware, if any, and the response is compressed by the compressor, if
+        any. The request is not finalized.
         """
+        if self._pools:
+            req.environ['weppy.pools'] = self._pools
+        if self._tasks is not None:
+            req.environ['weppy.tasks'] = self._tasks
+        if self._etag is not None:
+            req.environ['weppy.etag'] = self._etag
         try:
-            for (url_regex, handler) in self._routes.items():
-                match = url_regex.match(req.path)
-                if match is not None:
-                    return handler(req, *match.groups())
-            for (url_regex, handler) in self._routes.items():
-                match = url_regex.match(req.path + '/')
-                if match is not None:
-                    return HTTPRedirect(req.path + '/')
-            raise HTTPNotFound()
+            if self._rate_limiter is not None:
+                self._check_rate(req)
+            res = self._call(req)
+            if self._etag is not None:
+                res = self._conditional(req, res)
         except Exception as error:
-            if not isinstance(error, HTTPError):
-                if self._debug:
-                    traceback.print_exc()
-                error = HTTPInternalServerError()
-            return HTTPResponse(str(error), status=error.status)
+            res = self._handle_error(error)
+        if self._compressor is not None:
+            res = self._compressor(req, res)
+        return res
+
+    def _check_rate(self, req):
+        """
+        Raise an HTTPTooManyRequests exception if the rate limiter rejects req. Rejected
+        requests are recorded with the '<limited>' route by the metrics.
+        """
+        try:
+            self._rate_limiter(req, self._route)
+        except HTTPTooManyRequests:
+            timing = req.environ.get('weppy.timing')
+            if timing is not None:
+                timing[0] = '<limited>'
+            raise
+
+    def _conditional(self, req, res):
+        """
+        Return an HTTPNotModified response if the 'ETag' header of res, which is computed for
+        the buffered body of a 200 GET response if it is missing, matches the 'If-None-Match'
+        header of req. Otherwise, return res. Responses from the cache are checked too.
+        """
+        method = req.method
+        if method == 'GET' or method == 'HEAD' and res.etag is not None:
+            return res.conditional(req, self._etag == 'weak')
+        return res
+
+    def _route(self, req):
+        """
+        Return the URL pattern of the handler of req, or None if there is none.
+        """
+        handler = self._router.resolve(req.path)[0]
+        return handler._url_pattern if handler is not None else None
+
+    def _handle_cached(self, req):
+        """
+        Return an HTTPResponse from the response cache or processed by _handle_request.
+        """
+        return self._cache(req, self._handle_request)
+
+    def _handle_request(self, req):
+        """
+        Return an HTTPResponse processed by the appropriate Handler instance, or redirect the
+        request by appending a slash to its path. Exceptions are raised to handle_request.
+        """
+        if self._metrics is None:
+            handler, args, redirect = self._router.resolve(req.path)
+        else:
+            start = default_timer()
+            handler, args, redirect = self._router.resolve(req.path)
+            timing = req.environ.get('weppy.timing')
+            if timing is not None:
+                timing[0] = handler._url_pattern if handler is not None else '<unmatched>'
+                timing[1] = default_timer() - start
+        if handler is not None:
+            return self._chains[handler._url_pattern](req, *args)
+        if redirect:
+            return HTTPRedirect(req.path + '/')
+        raise HTTPNotFound()
+
+    def _handle_error(self, error):
+        """
+        Return the HTTPResponse for an exception raised while processing a request.
+        """
+        if not isinstance(error, HTTPError):
+            if self._debug:
+                traceback.print_exc()
+            error = HTTPInternalServerError()
+        res = HTTPResponse(str(error), status=error.status)
+        res.headerlist.extend(error.headerlist)
+        return res
 
     def __call__(self, environ, start_response):
         """
         WSGI interface.
+
+        With metrics, the route matching phase of a request is timed, the handler phase covers
+        the rest of handle_request, and the serialisation phase the call of the response,
+        excluding the iteration of streaming bodies. Responses served from the cache are
+        recorded with the '<cached>' route, and requests that are not routed, e.g. answered
+        by middleware, with the '<unmatched>' route.
+
+        The request is finalized when the server closes the response body.
         """
-        return self.handle_request(HTTPRequest(environ))(environ, start_response)
+        if self._metrics is None:
+            req = HTTPRequest(environ)
+            result = self.handle_request(req)(environ, start_response)
+            return _finalizing(result, req, environ) if req.has_finalizers else result
+        timing = environ['weppy.timing'] = ['<unmatched>', 0.0]
+        start = default_timer()
+        req = HTTPRequest(environ)
+        res = self.handle_request(req)
+        handled = default_timer()
+        result = res(environ, start_response)
+        end = default_timer()
+        self._metrics.record(timing[0], req.method, res.status[:3], timing[1],
+                             handled - start - timing[1], end - handled)
+        return _finalizing(result, req, environ) if req.has_finalizers else result
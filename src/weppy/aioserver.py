@@ -0,0 +1,639 @@
+import asyncio
+import inspect
+import io
+import os
+import signal
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http.client import responses
+from urllib.parse import unquote_to_bytes
+
+# This module requires Python 3.7 or later.
+
+# maximum size in bytes of the unread rest of a request body that is discarded to keep the
+# connection open, beyond which the connection is closed instead
+_MAX_DRAIN = 64 * 1024
+
+class _BadRequest(Exception):
+    """
+    Malformed request, answered with the specified status before the connection is closed.
+    """
+
+    def __init__(self, status=400):
+        super(_BadRequest, self).__init__(status)
+        self.status = status
+
+class FileWrapper(object):
+    """
+    wsgi.file_wrapper whose files are sent with loop.sendfile.
+    """
+
+    def __init__(self, filelike, block_size=64 * 1024):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def __iter__(self):
+        return iter(lambda: self.filelike.read(self.block_size), b'')
+
+    def close(self):
+        """
+        Close the wrapped file.
+        """
+        self.filelike.close()
+
+class _Body(object):
+    """
+    Body of a request, read from the connection as it is consumed, with a Content-Length
+    header or the chunked transfer coding. A chunked body longer than the maximum size is
+    answered with 413.
+    """
+
+    def __init__(self, reader, length, chunked, timeout, max_size=None):
+        self._reader = reader
+        self._remaining = length or 0
+        self._chunked = chunked
+        self._timeout = timeout
+        self._max_size = max_size
+        self._size = 0
+        self.done = not chunked and not length
+
+    async def _read(self, coroutine):
+        try:
+            return await asyncio.wait_for(coroutine, self._timeout)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            raise _BadRequest()
+
+    async def read(self, size=64 * 1024):
+        """
+        Return the next chunk of the body, of at most size bytes, or b'' at its end.
+        """
+        if self.done:
+            return b''
+        if not self._chunked:
+            chunk = await self._read(self._reader.read(min(size, self._remaining)))
+            if not chunk:
+                raise _BadRequest()
+            self._remaining -= len(chunk)
+            self.done = not self._remaining
+            return chunk
+        if not self._remaining:
+            line = await self._read(self._reader.readuntil(b'\r\n'))
+            try:
+                self._remaining = int(line.split(b';', 1)[0], 16)
+            except ValueError:
+                raise _BadRequest()
+            self._size += self._remaining
+            if self._max_size is not None and self._size > self._max_size:
+                raise _BadRequest(413)
+            if not self._remaining:
+                while await self._read(self._reader.readuntil(b'\r\n')) != b'\r\n':
+                    pass
+                self.done = True
+                return b''
+        chunk = await self._read(self._reader.readexactly(min(size, self._remaining)))
+        self._remaining -= len(chunk)
+        if not self._remaining and await self._read(self._reader.readexactly(2)) != b'\r\n':
+            raise _BadRequest()
+        return chunk
+
+    async def drain(self, limit):
+        """
+        Read and discard the rest of the body in chunks, and return whether it ended within
+        limit bytes.
+        """
+        if not self._chunked and self._remaining > limit:
+            return False
+        while not self.done:
+            limit -= len(await self.read())
+            if limit < 0:
+                return False
+        return True
+
+    async def read_all(self):
+        """
+        Return the rest of the body.
+        """
+        chunks = []
+        while not self.done:
+            chunks.append(await self.read())
+        return b''.join(chunks)
+
+class _ResponseWriter(object):
+    """
+    Write a response to a connection, with the chunked transfer coding if it has no
+    Content-Length header and the client supports it. The head is held back to be written
+    with the first chunk of the body.
+    """
+
+    def __init__(self, writer, version, method, keep_alive):
+        self._writer = writer
+        self._version = version
+        self._method = method
+        self.keep_alive = keep_alive
+        self.started = False
+        self._head = None
+        self._chunked = False
+
+    def start(self, status, headers):
+        """
+        Prepare the head of the response.
+
+        status -- str that specifies the status, e.g. '200 OK'.
+        headers -- list of tuples (name, value) of str that specifies the headers.
+        """
+        names = set(name.lower() for (name, value) in headers)
+        if 'connection' in names:
+            for (name, value) in headers:
+                if name.lower() == 'connection' and value.lower() == 'close':
+                    self.keep_alive = False
+        body = self._method != 'HEAD' and status[:3] not in ('204', '304')
+        if body and 'content-length' not in names:
+            if self._version == 'HTTP/1.1':
+                self._chunked = True
+                headers = headers + [('Transfer-Encoding', 'chunked')]
+            else:
+                self.keep_alive = False
+        headers = headers + [('Date', formatdate(usegmt=True))]
+        if 'connection' not in names:
+            headers.append(('Connection', 'keep-alive' if self.keep_alive else 'close'))
+        lines = ['%s %s\r\n' % (self._version, status)]
+        lines.extend('%s: %s\r\n' % (name, value) for (name, value) in headers)
+        lines.append('\r\n')
+        self._head = ''.join(lines).encode('latin-1')
+        self.started = True
+
+    async def write(self, data):
+        """
+        Write a chunk of the body, with the head if it was not written yet.
+        """
+        buffers = []
+        if self._head is not None:
+            buffers.append(self._head)
+            self._head = None
+        if data and self._method != 'HEAD':
+            if self._chunked:
+                buffers.extend((b'%x\r\n' % len(data), data, b'\r\n'))
+            else:
+                buffers.append(data)
+        if buffers:
+            self._writer.writelines(buffers)
+            await self._writer.drain()
+
+    async def sendfile(self, f):
+        """
+        Write the rest of a file as the body, with the head if it was not written yet.
+        """
+        if self._chunked or self._method == 'HEAD':
+            for data in iter(lambda: f.read(64 * 1024), b''):
+                await self.write(data)
+            return
+        await self.write(b'')
+        offset = f.tell()
+        await asyncio.get_running_loop().sendfile(self._writer.transport, f, offset,
+                                                  os.fstat(f.fileno()).st_size - offset)
+
+    async def finish(self):
+        """
+        Write the end of the response.
+        """
+        if self._chunked:
+            self._chunked = False
+            await self.write(b'0\r\n\r\n')
+        else:
+            await self.write(b'')
+
+class AsyncioServer(object):
+    """
+    asyncio HTTP/1.1 server with persistent connections, pipelining and chunked request and
+    response bodies, that hosts a WSGI application, called in a pool of threads, or an ASGI
+    application.
+
+    SIGTERM or SIGINT shut the server down gracefully: it stops accepting connections, closes
+    idle ones, and waits for the requests in progress until a timeout.
+    """
+
+    def __init__(self, app, host, port, threads=None, reuse_port=False, header_timeout=10,
+                 body_timeout=30, keep_alive_timeout=5, max_header_size=64 * 1024,
+                 max_body_size=64 * 1024 * 1024, graceful_timeout=30):
+        """
+        app -- WSGI application, or ASGI application if its __call__ method is a coroutine
+               function.
+        host -- str that specifies the address to listen on.
+        port -- int that specifies the port to listen on.
+        threads -- int that specifies the number of threads calling a WSGI application. None
+                   uses the default of concurrent.futures.ThreadPoolExecutor. None by default.
+        reuse_port -- bool that specifies whether the SO_REUSEPORT option is set. False by
+                      default.
+        header_timeout -- float that specifies how many seconds a client has to send the head
+                          of a request. 10 by default.
+        body_timeout -- float that specifies how many seconds a client has to send each chunk
+                        of a request body. 30 by default.
+        keep_alive_timeout -- float that specifies how many seconds an idle persistent
+                              connection is kept open. 5 by default.
+        max_header_size -- int that specifies the maximum size in bytes of the head of a
+                           request. 64 KB by default.
+        max_body_size -- int that specifies the maximum size in bytes of a request body,
+                         which is read before a WSGI application is called. Larger bodies are
+                         answered with 413. None does not limit it. 64 MB by default.
+        graceful_timeout -- float that specifies how many seconds requests in progress have to
+                            finish after the server is shut down. 30 by default.
+        """
+        self._app = app
+        self._asgi = inspect.iscoroutinefunction(app) or inspect.iscoroutinefunction(
+            getattr(app, '__call__', None))
+        self._host = host
+        self._port = port
+        self._threads = threads
+        self._reuse_port = reuse_port
+        self._header_timeout = header_timeout
+        self._body_timeout = body_timeout
+        self._keep_alive_timeout = keep_alive_timeout
+        self._max_header_size = max_header_size
+        self._max_body_size = max_body_size
+        self._graceful_timeout = graceful_timeout
+        self._executor = None
+        self._server = None
+        self._lifespan = None
+        self._connections = {}
+        self._stopping = False
+        self.server_address = (host, port)
+
+    async def start(self):
+        """
+        Start listening, after running the startup hooks of the WSGI application or the
+        startup of the lifespan scope of the ASGI application.
+        """
+        if self._executor is None and not self._asgi:
+            self._executor = ThreadPoolExecutor(self._threads)
+        if self._asgi:
+            await self._start_lifespan()
+        elif getattr(self._app, 'startup', None) is not None:
+            self._app.startup()
+        self._server = await asyncio.start_server(self._serve_connection, self._host,
+                                                  self._port, reuse_port=self._reuse_port,
+                                                  limit=self._max_header_size)
+        self.server_address = self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        """
+        Stop listening, close idle connections, wait for the requests in progress, and run the
+        shutdown hooks of the WSGI application or the shutdown of the lifespan scope of the
+        ASGI application.
+        """
+        self._stopping = True
+        self._server.close()
+        await self._server.wait_closed()
+        for (task, idle) in list(self._connections.items()):
+            if idle:
+                task.cancel()
+        if self._connections:
+            await asyncio.wait(list(self._connections), timeout=self._graceful_timeout)
+        for task in list(self._connections):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if not self._asgi and getattr(self._app, 'shutdown', None) is not None:
+            self._app.shutdown()
+        if self._lifespan is not None:
+            await self._stop_lifespan()
+
+    async def _start_lifespan(self):
+        """
+        Start the lifespan scope of the ASGI application, if it supports it, and wait for its
+        startup.
+        """
+        messages = asyncio.Queue()
+        sent = asyncio.Queue()
+        task = asyncio.ensure_future(self._app(
+            {'type': 'lifespan', 'asgi': {'version': '3.0', 'spec_version': '2.0'}},
+            messages.get, sent.put))
+        self._lifespan = (task, messages, sent)
+        if await self._lifespan_message('lifespan.startup', 'lifespan.startup.complete'):
+            return
+        if not task.done() or task.exception() is None:
+            raise RuntimeError('the startup of the ASGI application failed')
+        self._lifespan = None
+
+    async def _stop_lifespan(self):
+        """
+        Ask the ASGI application to shut down and wait for it.
+        """
+        await self._lifespan_message('lifespan.shutdown', 'lifespan.shutdown.complete')
+        self._lifespan = None
+
+    async def _lifespan_message(self, message, reply):
+        """
+        Send a lifespan message and return whether the expected reply was received, or False
+        if the lifespan scope ended first.
+        """
+        task, messages, sent = self._lifespan
+        await messages.put({'type': message})
+        received = asyncio.ensure_future(sent.get())
+        await asyncio.wait([received, task], return_when=asyncio.FIRST_COMPLETED)
+        if not received.done():
+            received.cancel()
+            return False
+        return received.result()['type'] == reply
+
+    async def _serve(self):
+        """
+        Serve connections until SIGTERM or SIGINT is received.
+        """
+        await self.start()
+        loop = asyncio.get_running_loop()
+        stopped = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopped.set)
+        await stopped.wait()
+        await self.stop()
+
+    def serve_forever(self):
+        """
+        Serve connections until the server is shut down.
+        """
+        asyncio.run(self._serve())
+
+    async def _read_head(self, reader, idle_timeout):
+        """
+        Return a tuple (method, target, version, list of tuples (name, value) of headers) of
+        the next request, or None if the connection is closed before it starts. idle_timeout
+        applies until the first byte of the request is received, and header_timeout to the
+        rest of the head.
+        """
+        first = await asyncio.wait_for(reader.read(1), idle_timeout)
+        if not first:
+            return None
+        try:
+            head = first + await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                                                  self._header_timeout)
+        except asyncio.IncompleteReadError as error:
+            if (first + error.partial).strip():
+                raise _BadRequest()
+            return None
+        except asyncio.LimitOverrunError:
+            raise _BadRequest(431)
+        except ValueError:
+            raise _BadRequest(431)
+        lines = head.decode('latin-1').split('\r\n')
+        while lines and not lines[0]:
+            lines.pop(0)
+        try:
+            method, target, version = lines[0].split(' ')
+        except (IndexError, ValueError):
+            raise _BadRequest()
+        if not version.startswith('HTTP/1.'):
+            raise _BadRequest(505)
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if not sep or not name or name != name.strip():
+                raise _BadRequest()
+            headers.append((name, value.strip()))
+        return method, target, version, headers
+
+    async def _serve_connection(self, reader, writer):
+        """
+        Serve the requests of a connection until it is closed.
+        """
+        task = asyncio.current_task()
+        self._connections[task] = True
+        timeout = self._header_timeout
+        try:
+            while not self._stopping:
+                try:
+                    request = await self._read_head(reader, timeout)
+                except asyncio.TimeoutError:
+                    break
+                except _BadRequest as error:
+                    await self._send_error(writer, error.status)
+                    break
+                if request is None:
+                    break
+                self._connections[task] = False
+                if not await self._serve_request(reader, writer, *request):
+                    break
+                self._connections[task] = True
+                timeout = self._keep_alive_timeout
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        except Exception:
+            traceback.print_exc()
+        finally:
+            del self._connections[task]
+            writer.close()
+
+    async def _send_error(self, writer, status):
+        """
+        Write an error response and close the connection.
+        """
+        response = _ResponseWriter(writer, 'HTTP/1.1', 'GET', False)
+        response.start('%d %s' % (status, responses.get(status, '')),
+                       [('Content-Type', 'text/plain'), ('Content-Length', '0')])
+        try:
+            await response.finish()
+        except ConnectionError:
+            pass
+
+    async def _serve_request(self, reader, writer, method, target, version, headers):
+        """
+        Serve a request and return whether the connection can be reused.
+        """
+        fields = {}
+        for (name, value) in headers:
+            fields.setdefault(name.lower(), value)
+        connection = fields.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = 'close' not in connection
+        else:
+            keep_alive = 'keep-alive' in connection
+        chunked = 'chunked' in fields.get('transfer-encoding', '').lower()
+        try:
+            length = None if chunked else int(fields.get('content-length', 0))
+        except ValueError:
+            length = -1
+        if length is not None and length < 0:
+            await self._send_error(writer, 400)
+            return False
+        if length is not None and self._max_body_size is not None and (
+                length > self._max_body_size):
+            await self._send_error(writer, 413)
+            return False
+        if fields.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        body = _Body(reader, length, chunked, self._body_timeout, self._max_body_size)
+        response = _ResponseWriter(writer, version, method, keep_alive)
+        try:
+            if self._asgi:
+                await self._call_asgi(method, target, version, headers, body, response,
+                                      writer)
+            else:
+                await self._call_wsgi(method, target, version, headers, body, response,
+                                      writer)
+            if not await body.drain(_MAX_DRAIN):
+                return False
+        except _BadRequest as error:
+            if not response.started:
+                await self._send_error(writer, error.status)
+            return False
+        except (asyncio.TimeoutError, ConnectionError):
+            return False
+        except Exception:
+            traceback.print_exc()
+            if not response.started:
+                await self._send_error(writer, 500)
+            return False
+        return response.keep_alive
+
+    def _environ(self, method, target, version, headers, body, writer):
+        """
+        Return the WSGI environ of a request whose body was read.
+        """
+        path, sep, query = target.partition('?')
+        server = writer.get_extra_info('sockname') or self.server_address
+        client = writer.get_extra_info('peername') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': str(client[0]),
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': FileWrapper,
+        }
+        for (name, value) in headers:
+            name = name.upper().replace('-', '_')
+            if name == 'CONTENT_LENGTH' or name == 'TRANSFER_ENCODING':
+                continue
+            if name != 'CONTENT_TYPE':
+                name = 'HTTP_' + name
+            environ[name] = environ[name] + ',' + value if name in environ else value
+        return environ
+
+    def _start_wsgi(self, environ):
+        """
+        Call the WSGI application and return a tuple (status, headers, iterable, iterator over
+        the rest of the body or None, list of chunks to send first), iterating the body until
+        start_response is called.
+        """
+        state = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and state:
+                raise exc_info[1].with_traceback(exc_info[2])
+            state[:] = [status, headers]
+            return chunks.append
+
+        chunks = []
+        result = self._app(environ, start_response)
+        iterator = None
+        if isinstance(result, (list, tuple)):
+            chunks.extend(result)
+        elif not isinstance(result, FileWrapper) or not state:
+            iterator = iter(result)
+            while not state:
+                chunk = next(iterator, None)
+                if chunk is None:
+                    break
+                chunks.append(chunk)
+        if not state:
+            raise RuntimeError('start_response was not called')
+        return state[0], state[1], result, iterator, chunks
+
+    async def _call_wsgi(self, method, target, version, headers, body, response, writer):
+        """
+        Serve a request with the WSGI application.
+        """
+        environ = self._environ(method, target, version, headers, await body.read_all(),
+                                writer)
+        loop = asyncio.get_running_loop()
+        status, response_headers, result, iterator, chunks = await loop.run_in_executor(
+            self._executor, self._start_wsgi, environ)
+        try:
+            response.start(status, list(response_headers))
+            if iterator is None and isinstance(result, FileWrapper):
+                await response.sendfile(result.filelike)
+            elif iterator is None:
+                await response.write(b''.join(chunks))
+            else:
+                for chunk in chunks:
+                    await response.write(chunk)
+                while True:
+                    chunk = await loop.run_in_executor(self._executor, next, iterator, None)
+                    if chunk is None:
+                        break
+                    await response.write(chunk)
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self._executor, close)
+        await response.finish()
+
+    async def _call_asgi(self, method, target, version, headers, body, response, writer):
+        """
+        Serve a request with the ASGI application.
+        """
+        path, sep, query = target.partition('?')
+        raw_path = path.encode('latin-1')
+        server = writer.get_extra_info('sockname') or self.server_address
+        client = writer.get_extra_info('peername') or ('', 0)
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.1'},
+            'http_version': version[5:],
+            'method': method,
+            'scheme': 'http',
+            'path': unquote_to_bytes(raw_path).decode('utf-8', 'replace'),
+            'raw_path': raw_path,
+            'query_string': query.encode('latin-1'),
+            'root_path': '',
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for (name, value) in headers],
+            'server': tuple(server[:2]),
+            'client': tuple(client[:2]),
+        }
+        finished = asyncio.Event()
+        complete = []
+
+        async def receive():
+            if not body.done:
+                chunk = await body.read()
+                return {'type': 'http.request', 'body': chunk, 'more_body': not body.done}
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                response.start('%d %s' % (status, responses.get(status, '')),
+                               [(name.decode('latin-1'), value.decode('latin-1'))
+                                for (name, value) in message.get('headers', [])])
+            elif message['type'] == 'http.response.body':
+                await response.write(message.get('body', b''))
+                if not message.get('more_body', False):
+                    await response.finish()
+                    complete.append(True)
+                    finished.set()
+
+        try:
+            await self._app(scope, receive, send)
+        finally:
+            finished.set()
+        if not complete:
+            raise RuntimeError('the ASGI application did not complete the response')
@@ -0,0 +1,189 @@
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from weppy.http import HTTPResponse
+
+# content type prefixes of bodies that are already compressed
+INCOMPRESSIBLE_TYPES = ('image/', 'audio/', 'video/', 'font/woff', 'application/zip',
+                        'application/gzip', 'application/x-gzip', 'application/x-bzip2',
+                        'application/x-xz', 'application/x-7z-compressed',
+                        'application/x-rar-compressed', 'application/pdf',
+                        'application/octet-stream')
+
+# content types with an image/ prefix that are compressible
+COMPRESSIBLE_TYPES = ('image/svg+xml', 'image/x-icon', 'image/bmp')
+
+def _choose_encoding(header):
+    """
+    Return 'gzip' or 'deflate', whichever has the highest quality in an 'Accept-Encoding'
+    header, or None if neither is acceptable.
+    """
+    if not header:
+        return None
+    qualities = {}
+    for part in header.split(','):
+        params = part.strip().split(';')
+        name = params[0].strip().lower()
+        quality = 1.0
+        for param in params[1:]:
+            key, sep, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    default = qualities.get('*', 0.0)
+    gzip = qualities.get('gzip', qualities.get('x-gzip', default))
+    deflate = qualities.get('deflate', default)
+    if max(gzip, deflate) <= 0:
+        return None
+    return 'gzip' if gzip >= deflate else 'deflate'
+
+def _compressobj(encoding, level):
+    """
+    Return a zlib compression object for the specified content encoding.
+    """
+    wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+class Compressor(object):
+    """
+    Compress response bodies with the content encoding negotiated from the 'Accept-Encoding'
+    header of requests, gzip or deflate.
+
+    Small bodies, already compressed content types and responses with a 'Content-Encoding'
+    header are not compressed. Streaming bodies are compressed chunk by chunk, and compressed
+    buffered bodies can be cached by their digest. Responses to HEAD requests
+    get the headers of the matching compressed GET responses, without a 'Content-Length'
+    header, since their body is not compressed.
+    """
+
+    def __init__(self, min_size=1024, level=6, cache_entries=0, cache_bytes=16 * 1024 * 1024):
+        """
+        min_size -- int that specifies the minimum size in bytes of buffered bodies to
+                    compress. 1024 by default.
+        level -- int from 1 to 9 that specifies the compression level. 6 by default.
+        cache_entries -- int that specifies the maximum number of cached compressed bodies. 0
+                         disables the cache. 0 by default.
+        cache_bytes -- int that specifies the maximum total size in bytes of the cached
+                       compressed bodies. 16 MB by default.
+        """
+        self._min_size = min_size
+        self._level = level
+        self._cache_entries = cache_entries
+        self._cache_bytes = cache_bytes
+        self._cache = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _compressible(self, res):
+        """
+        Return whether the content type and headers of res allow to compress it.
+        """
+        content_type = (res.content_type or '').lower()
+        if (content_type.startswith(INCOMPRESSIBLE_TYPES) and
+                content_type not in COMPRESSIBLE_TYPES):
+            return False
+        for (name, value) in res.headerlist:
+            if name.lower() == 'content-encoding':
+                return False
+        return res.status[:3] not in ('204', '206', '304')
+
+    def _compress(self, body, encoding):
+        """
+        Return body compressed with encoding, from the cache if it is enabled. Cached bodies
+        are looked up by their digest, not by their entity tag, which validators of different
+        URLs can share.
+        """
+        if not self._cache_entries:
+            compressobj = _compressobj(encoding, self._level)
+            return compressobj.compress(body) + compressobj.flush()
+        key = (encoding, hashlib.sha1(body).digest())
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                del self._cache[key]
+                self._cache[key] = data
+                return data
+        compressobj = _compressobj(encoding, self._level)
+        data = compressobj.compress(body) + compressobj.flush()
+        if len(data) <= self._cache_bytes:
+            with self._lock:
+                if key not in self._cache:
+                    self._cache[key] = data
+                    self._bytes += len(data)
+                while (len(self._cache) > self._cache_entries or
+                       self._bytes > self._cache_bytes):
+                    self._bytes -= len(self._cache.pop(next(iter(self._cache))))
+        return data
+
+    def _iter_compressed(self, app_iter, encoding):
+        """
+        Yield the chunks of app_iter compressed with encoding, flushing the compressor after
+        each chunk so that none is held back.
+        """
+        compressobj = _compressobj(encoding, self._level)
+        try:
+            for chunk in app_iter:
+                data = compressobj.compress(chunk) + compressobj.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressobj.flush()
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                close()
+
+    def __call__(self, req, res):
+        """
+        Return res compressed with the content encoding accepted by req, or res itself if it
+        is not compressed.
+
+        req -- HTTPRequest.
+        res -- HTTPResponse.
+        """
+        if not self._compressible(res):
+            return res
+        head = req.method == 'HEAD'
+        streaming = res.streaming
+        if head:
+            size = res.content_length
+        else:
+            size = None if streaming else len(res.body)
+        if size is not None and size < self._min_size:
+            return res
+        headerlist = []
+        vary = None
+        etag = None
+        for (name, value) in res.headerlist:
+            lower = name.lower()
+            if lower == 'vary':
+                vary = value
+            elif lower == 'etag':
+                etag = value
+            elif lower != 'content-length':
+                headerlist.append((name, value))
+        if vary is None:
+            vary = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            vary += ', Accept-Encoding'
+        encoding = _choose_encoding(req.environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            res.headerlist[:] = [(name, value) for (name, value) in res.headerlist
+                                 if name.lower() != 'vary'] + [('Vary', vary)]
+            return res
+        headerlist.append(('Vary', vary))
+        headerlist.append(('Content-Encoding', encoding))
+        if etag is not None:
+            headerlist.append(('ETag', etag if etag.startswith('W/') else 'W/' + etag))
+        if head:
+            res.discard_body()
+            res.headerlist[:] = headerlist
+            return res
+        if streaming:
+            body = self._iter_compressed(res.app_iter, encoding)
+        else:
+            body = self._compress(res.body, encoding)
+        return HTTPResponse(body, res.status, None, None, headerlist)
@@ -1,14 +1,129 @@
+import cgi
+import functools
+import hashlib
 import io
+import itertools
+import json
 import sys
+import traceback
+import zlib
 from webob import Request, Response
-from webob.compat import url_encode
+from webob.compat import text_type, url_encode
 from webob.request import _encode_multipart
+from webob.util import status_reasons
+from weppy.multipart import MultipartError, MultipartParser
+from weppy.pool import PoolTimeout
+
+def _lazy(slot, parse):
+    """
+    Return a property that parses a value from the wrapped Request on first access and caches
+    it in the specified slot.
+    """
+    def get(self):
+        try:
+            return getattr(self, slot)
+        except AttributeError:
+            value = parse(self._req)
+            setattr(self, slot, value)
+            return value
+    return property(get)
+
+# reason phrase missing from older WebOb versions
+status_reasons.setdefault(429, 'Too Many Requests')
+status_reasons.setdefault(503, 'Service Unavailable')
+
+# encoder of the JSON bodies of JSONResponse objects, without whitespace
+_JSON_ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+def _encode_json(value):
+    """
+    Return value encoded as JSON.
+    """
+    return _JSON_ENCODER.encode(value)
+
+def _iter_json(rows, encoder, ndjson, chunk_size, batch_size=256):
+    """
+    Yield the rows encoded with encoder as a JSON array or, if ndjson is set, as lines of
+    NDJSON, in chunks of bytes of about chunk_size bytes. The rows of a JSON array are encoded
+    in lists of batch_size rows, whose brackets are removed, to reduce the number of calls of
+    encoder.
+    """
+    rows = iter(rows)
+    buffer = [] if ndjson else [b'[']
+    size = 0
+    first = True
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        if ndjson:
+            for row in batch:
+                data = encoder(row)
+                buffer.append(data.encode('utf-8') if isinstance(data, text_type) else data)
+                buffer.append(b'\n')
+                size += len(data) + 1
+        else:
+            data = encoder(batch)
+            if isinstance(data, text_type):
+                data = data.encode('utf-8')
+            if not data.endswith(b']'):
+                data = data.rstrip()
+            if not first:
+                buffer.append(b',')
+            first = False
+            buffer.append(data[1:-1])
+            size += len(data)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if not ndjson:
+        buffer.append(b']')
+    if buffer:
+        yield b''.join(buffer)
+
+def _json_headerlist(content_type, headerlist):
+    """
+    Return the header values of a JSON response, with its 'Content-Type' header.
+    """
+    return [('Content-Type', content_type)] + list(headerlist or [])
+
+def _load_session(req):
+    """
+    Return the session of the wrapped Request, loaded by the
+    weppy.sessions.SessionMiddleware of the application.
+    """
+    sessions = req.environ.get('weppy.sessions')
+    if sessions is None:
+        raise RuntimeError('sessions require a weppy.sessions.SessionMiddleware')
+    return sessions.load(req.environ, req.cookies)
+
+def _parse_etags(header):
+    """
+    Return the list of entity tags, without weak indicators, in an 'If-None-Match' header, or
+    None if there is no header.
+    """
+    if header is None:
+        return None
+    tags = []
+    for tag in header.split(','):
+        tag = tag.strip()
+        tags.append(tag[2:] if tag.startswith('W/') else tag)
+    return tags
 
 class HTTPRequest(object):
     """
-    Wrap WebOb's Request class.
+    Wrap WebOb's Request class. The query string, body, headers, cookies and Accept headers
+    are only parsed when they are accessed, and the session is only loaded when it is
+    accessed. Resources borrowed from the pools of the application are returned when the
+    request is finalized, after its response is sent.
     """
 
+    __slots__ = ('_req', '_GET', '_POST', '_headers', '_cookies', '_accept', '_accept_charset',
+                 '_accept_encoding', '_accept_language', '_if_none_match', '_session',
+                 '_borrowed', '_finalizers')
+
+    environ = property(lambda self: self._req.environ)
     method = property(lambda self: self._req.method.upper())
     http_version = property(lambda self: self._req.http_version)
     charset = property(lambda self: self._req.charset)
@@ -20,25 +135,168 @@ class HTTPRequest(object):
     url = property(lambda self: self._req.url)
     body = property(lambda self: self._req.body)
     text = property(lambda self: self._req.text)
-    GET = property(lambda self: self._GET)
-    POST = property(lambda self: self._POST)
-    headers = property(lambda self: self._headers)
-    cookies = property(lambda self: self._cookies)
-    accept = property(lambda self: self._accept)
-    accept_charset = property(lambda self: self._accept_charset)
-    accept_encoding = property(lambda self: self._accept_encoding)
-    accept_language = property(lambda self: self._accept_language)
+    content_length = property(lambda self: self._req.content_length)
+    GET = _lazy('_GET', lambda req: dict(req.GET.items()))
+    POST = _lazy('_POST', lambda req: dict(req.POST.items()))
+    headers = _lazy('_headers', lambda req: dict(req.headers.items()))
+    cookies = _lazy('_cookies', lambda req: dict(req.cookies.items()))
+    accept = _lazy('_accept', lambda req: list(req.accept))
+    accept_charset = _lazy('_accept_charset', lambda req: list(req.accept_charset))
+    accept_encoding = _lazy('_accept_encoding', lambda req: list(req.accept_encoding))
+    accept_language = _lazy('_accept_language', lambda req: list(req.accept_language))
+    if_none_match = _lazy('_if_none_match',
+                          lambda req: _parse_etags(req.environ.get('HTTP_IF_NONE_MATCH')))
+    session = _lazy('_session', _load_session)
+    has_finalizers = property(lambda self: bool(getattr(self, '_finalizers', None)))
 
     def __init__(self, environ):
         self._req = Request(environ)
-        self._GET = dict(self._req.GET.items())
-        self._POST = dict(self._req.POST.items())
-        self._headers = dict(self._req.headers.items())
-        self._cookies = dict(self._req.cookies.items())
-        self._accept = list(self._req.accept)
-        self._accept_charset = list(self._req.accept_charset)
-        self._accept_encoding = list(self._req.accept_encoding)
-        self._accept_language = list(self._req.accept_language)
+
+    def borrow(self, name, timeout=None):
+        """
+        Return a resource checked out from the weppy.pool.Pool added to the application with
+        the specified name, which is returned to the pool when the request is finalized, or
+        raise an HTTPServiceUnavailable exception if none is available before the timeout.
+        Borrowing the same name again during the request returns the same resource.
+
+        name -- str that specifies the name of the pool, e.g. 'db'.
+        timeout -- float that specifies how many seconds to wait for a resource. None uses
+                   the timeout of the pool. None by default.
+        """
+        try:
+            borrowed = self._borrowed
+        except AttributeError:
+            borrowed = self._borrowed = {}
+        if name in borrowed:
+            return borrowed[name]
+        pool = (self._req.environ.get('weppy.pools') or {}).get(name)
+        if pool is None:
+            raise KeyError('no pool named %r' % name)
+        try:
+            resource = pool.acquire(timeout)
+        except PoolTimeout:
+            raise HTTPServiceUnavailable(1)
+        borrowed[name] = resource
+        self.add_finalizer(pool.release, resource)
+        return resource
+
+    def after_response(self, func, *args, **kwargs):
+        """
+        Schedule a call of func with args and kwargs after the response is sent, e.g. to send
+        an email, on the weppy.tasks.TaskQueue of the application, or in the thread that
+        finalizes the request if there is none. Tasks must not use the resources borrowed by
+        the request, which are returned to their pools when it is finalized.
+        """
+        tasks = self._req.environ.get('weppy.tasks')
+        if tasks is None:
+            self.add_finalizer(functools.partial(func, *args, **kwargs))
+        else:
+            self.add_finalizer(functools.partial(tasks.submit, func, *args, **kwargs))
+
+    def add_finalizer(self, func, *args):
+        """
+        Register a function called with args when the request is finalized, after its response
+        is sent.
+        """
+        try:
+            self._finalizers.append((func, args))
+        except AttributeError:
+            self._finalizers = [(func, args)]
+
+    def finalize(self):
+        """
+        Call the registered functions once, in the order of their registration, printing the
+        traceback of their exceptions.
+        """
+        finalizers = getattr(self, '_finalizers', None) or []
+        self._finalizers = []
+        for (func, args) in finalizers:
+            try:
+                func(*args)
+            except Exception:
+                traceback.print_exc()
+
+    def etag_matches(self, etag):
+        """
+        Return whether etag matches the 'If-None-Match' header, using the weak comparison.
+
+        etag -- str that specifies the entity tag, e.g. '"abc"' or 'W/"abc"'.
+        """
+        tags = self.if_none_match
+        if not tags:
+            return False
+        return '*' in tags or (etag[2:] if etag.startswith('W/') else etag) in tags
+
+    def iter_body(self, chunk_size=64 * 1024, max_size=None):
+        """
+        Return an iterator over the body in chunks of bytes that reads it from the WSGI input
+        as it goes, or raise an HTTPRequestEntityTooLarge exception if the Content-Length
+        header exceeds max_size. The body can only be iterated once.
+
+        chunk_size -- int that specifies the maximum size of a chunk in bytes. 64 KB by
+                      default.
+        max_size -- int that specifies the maximum body size in bytes. None does not limit the
+                    body size. None by default.
+        """
+        length = self.content_length
+        if max_size is not None and length is not None and length > max_size:
+            raise HTTPRequestEntityTooLarge()
+        return self._iter_body(chunk_size, length, max_size)
+
+    def _iter_body(self, chunk_size, length, max_size):
+        """
+        Yield chunks of at most chunk_size bytes of the WSGI input until length bytes, or until
+        its end if length is None and the server terminates it, were read.
+        """
+        environ = self._req.environ
+        stream = environ.get('wsgi.input')
+        if stream is None or (length is None and not environ.get('wsgi.input_terminated')):
+            return
+        size = 0
+        while length is None or size < length:
+            chunk = stream.read(chunk_size if length is None else
+                                min(chunk_size, length - size))
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise HTTPRequestEntityTooLarge()
+            yield chunk
+
+    def iter_multipart(self, memory_threshold=1024 * 1024, chunk_size=64 * 1024,
+                       max_size=None):
+        """
+        Return an iterator over the fields of a multipart/form-data body that parses it as it
+        is read, or raise an HTTPBadRequest exception if the body is not multipart/form-data.
+        The iterator yields a tuple (name, value) for each field, where value is a str for
+        fields and a weppy.multipart.UploadedFile for files, and raises an HTTPBadRequest
+        exception if the body is malformed.
+
+        memory_threshold -- int that specifies the size in bytes above which files are spooled
+                            to temporary files. It is also the maximum size of a field value.
+                            1 MB by default.
+        chunk_size -- int that specifies the size in bytes of the chunks read from the body.
+                      64 KB by default.
+        max_size -- int that specifies the maximum body size in bytes. None does not limit the
+                    body size. None by default.
+        """
+        content_type, params = cgi.parse_header(self._req.environ.get('CONTENT_TYPE', ''))
+        if content_type != 'multipart/form-data' or not params.get('boundary'):
+            raise HTTPBadRequest()
+        parser = MultipartParser(self.iter_body(chunk_size, max_size),
+                                 params['boundary'].encode('latin-1'), self.charset or 'UTF-8',
+                                 memory_threshold)
+        return self._iter_multipart(parser)
+
+    def _iter_multipart(self, parser):
+        """
+        Yield the fields of parser and turn its errors into HTTPBadRequest exceptions.
+        """
+        try:
+            for field in parser:
+                yield field
+        except MultipartError:
+            raise HTTPBadRequest()
 
     @classmethod
     def get(cls, http_version='HTTP/1.1', server_name='localhost', server_port=8000,
@@ -276,6 +534,31 @@ class HTTPRequest(object):
         environ.update(headers or {})
         return cls(environ)
 
+class _StreamingBody(object):
+    """
+    WSGI iterable that encodes the str chunks of a response body as they are produced.
+    """
+
+    def __init__(self, iterable, charset):
+        self._iterable = iterable
+        self._charset = charset
+
+    def __iter__(self):
+        charset = self._charset
+        for chunk in self._iterable:
+            if isinstance(chunk, text_type):
+                chunk = chunk.encode(charset)
+            if chunk:
+                yield chunk
+
+    def close(self):
+        """
+        Close the wrapped iterable, if it supports it.
+        """
+        close = getattr(self._iterable, 'close', None)
+        if close is not None:
+            close()
+
 class HTTPResponse(object):
     """
     Wrap WebOb's Response class.
@@ -287,18 +570,84 @@ class HTTPResponse(object):
     status = property(lambda self: self._res.status)
     charset = property(lambda self: self._res.charset)
     headerlist = property(lambda self: self._res.headerlist)
+    app_iter = property(lambda self: self._res.app_iter)
+    streaming = property(lambda self: isinstance(self._res.app_iter, _StreamingBody))
+    etag = property(lambda self: self._res.headers.get('ETag'))
+    content_length = property(lambda self: self._res.content_length)
 
     def __init__(self, body='', status=200, content_type='text/html',
                  charset='UTF-8', headerlist=None):
         """
-        body -- str or bytes that specifies the body. Empty str by default.
+        body -- str or bytes that specifies the body, or iterable of str or bytes that
+                specifies the body in chunks to be sent as they are produced. A TypeError
+                exception is raised for other values. Empty str by default.
         status -- int that specifies the status code. 200 by default.
         content_type -- str that specifies the content_type. 'text/html' by default.
         charset -- str that specifies the charset. 'UTF-8' by default.
         headerlist -- list of tuples that specifies the header values. None by default.
         """
-        self._res = Response(body, status, headerlist, content_type=content_type,
-                             charset=charset)
+        if isinstance(body, (bytes, text_type)):
+            self._res = Response(body, status, headerlist, content_type=content_type,
+                                 charset=charset)
+        elif not hasattr(body, '__iter__') and not hasattr(body, '__aiter__'):
+            raise TypeError('response body must be str, bytes or an iterable, not %s' %
+                            type(body).__name__)
+        else:
+            self._res = Response(None, status, headerlist, _StreamingBody(body, charset),
+                                 content_type=content_type, charset=charset)
+
+    def close(self):
+        """
+        Close the body iterable without consuming it, e.g. when the body is not going to be
+        sent.
+        """
+        close = getattr(self._res.app_iter, 'close', None)
+        if close is not None:
+            close()
+
+    def discard_body(self):
+        """
+        Close the body iterable without consuming it and replace it with an empty body, keeping
+        the headers, e.g. for the response to a HEAD request. The 'Content-Length' header of a
+        buffered body is kept.
+        """
+        self.close()
+        content_length = self._res.content_length
+        self._res.app_iter = [b'']
+        self._res.content_length = content_length
+
+    def add_etag(self, weak=False):
+        """
+        Set the 'ETag' header from a digest of the body, which must not be streaming, unless it
+        is already set.
+
+        weak -- bool that specifies whether it is a weak entity tag, which is cheaper to
+                compute. False by default.
+        """
+        if self.etag is None:
+            body = self.body
+            if weak:
+                etag = 'W/"%x-%x"' % (len(body), zlib.crc32(body) & 0xffffffff)
+            else:
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+            self._res.headers['ETag'] = etag
+
+    def conditional(self, req, weak=False):
+        """
+        Return an HTTPNotModified response if the 'ETag' header, which is set for a 200
+        response with a buffered body if it is missing, matches the 'If-None-Match' header of
+        req. Otherwise, return this response.
+
+        req -- HTTPRequest.
+        weak -- bool that specifies whether a missing 'ETag' header is set to a weak entity
+                tag. False by default.
+        """
+        if self.etag is None and not self.streaming and self.status.startswith('200'):
+            self.add_etag(weak)
+        if self.etag is not None and req.etag_matches(self.etag):
+            self.close()
+            return HTTPNotModified([('ETag', self.etag)])
+        return self
 
     def cache_expires(self, seconds):
         """
@@ -373,21 +722,99 @@ class HTTPRedirect(HTTPResponse):
         super(HTTPRedirect, self).__init__(status=301 if permanent else 302,
                                            headerlist=[('Location', uri)])
 
+class HTTPNotModified(HTTPResponse):
+    """
+    HTTP 304 response.
+    """
+
+    def __init__(self, headerlist=None):
+        """
+        headerlist -- list of tuples that specifies the header values, e.g. the 'ETag' header.
+                      None by default.
+        """
+        super(HTTPNotModified, self).__init__(status=304, headerlist=list(headerlist or []))
+        self._res.content_length = None
+
+class JSONResponse(HTTPResponse):
+    """
+    HTTP response whose body is a value encoded as JSON.
+
+    The encoder is a function that returns the JSON encoding of a value as bytes, which is
+    used as the body without being copied, or as a str, which is encoded in UTF-8, e.g.
+    orjson.dumps or the encode method of a json.JSONEncoder with a default method for other
+    types. The encoder attribute, which subclasses set with staticmethod, is used if none is
+    specified.
+    """
+
+    encoder = staticmethod(_encode_json)
+
+    def __init__(self, value, status=200, headerlist=None, encoder=None,
+                 content_type='application/json'):
+        """
+        value -- value to encode as JSON.
+        status -- int that specifies the status code. 200 by default.
+        headerlist -- list of tuples that specifies additional header values. None by default.
+        encoder -- function that returns a value encoded as JSON, as bytes or str. None uses
+                   the encoder attribute. None by default.
+        content_type -- str that specifies the content type. 'application/json' by default.
+        """
+        body = (encoder or self.encoder)(value)
+        if isinstance(body, text_type):
+            body = body.encode('utf-8')
+        super(JSONResponse, self).__init__(body, status, content_type, None,
+                                           _json_headerlist(content_type, headerlist))
+
+    @classmethod
+    def stream(cls, rows, status=200, headerlist=None, encoder=None, ndjson=False,
+               chunk_size=64 * 1024):
+        """
+        Return a streaming HTTPResponse whose body is an iterable of rows encoded as a JSON
+        array or as NDJSON, one row per line. Rows are encoded as the body is sent, so neither
+        the list of rows nor the whole body needs to be held in memory. The rows of a JSON
+        array are passed to encoder in lists of up to 256 rows.
+
+        rows -- iterable of values to encode as JSON, e.g. a generator of database rows.
+        status -- int that specifies the status code. 200 by default.
+        headerlist -- list of tuples that specifies additional header values. None by default.
+        encoder -- function that returns a value encoded as JSON, as bytes or str. None uses
+                   the encoder attribute. None by default.
+        ndjson -- bool that specifies whether the body is NDJSON, with the
+                  'application/x-ndjson' content type, instead of a JSON array. False by
+                  default.
+        chunk_size -- int that specifies the size in bytes of the chunks of the body. 64 KB
+                      by default.
+        """
+        content_type = 'application/x-ndjson' if ndjson else 'application/json'
+        body = _iter_json(rows, encoder or cls.encoder, ndjson, chunk_size)
+        return HTTPResponse(body, status, content_type, None,
+                            _json_headerlist(content_type, headerlist))
+
 class HTTPError(Exception, object):
     """
     Base exception for HTTP errors.
     """
 
-    def __init__(self, status):
+    def __init__(self, status, headerlist=None):
         """
         status -- int that specifies the status code of response.
+        headerlist -- list of tuples that specifies additional header values of response. None
+                      by default.
         """
         super(HTTPError, self).__init__()
         self.status = status
+        self.headerlist = list(headerlist or [])
 
     def __str__(self):
         return 'Error %s' % str(self.status)
 
+class HTTPBadRequest(HTTPError):
+    """
+    HTTP 400 response.
+    """
+
+    def __init__(self):
+        super(HTTPBadRequest, self).__init__(400)
+
 class HTTPNotFound(HTTPError):
     """
     HTTP 404 response.
@@ -401,8 +828,34 @@ class HTTPMethodNotAllowed(HTTPError):
     HTTP 405 response.
     """
 
+    def __init__(self, allow=None):
+        """
+        allow -- str that specifies the 'Allow' header, e.g. 'GET, HEAD'. None does not set
+                 the header. None by default.
+        """
+        super(HTTPMethodNotAllowed, self).__init__(
+            405, [('Allow', allow)] if allow is not None else None)
+
+class HTTPRequestEntityTooLarge(HTTPError):
+    """
+    HTTP 413 response.
+    """
+
     def __init__(self):
-        super(HTTPMethodNotAllowed, self).__init__(405)
+        super(HTTPRequestEntityTooLarge, self).__init__(413)
+
+class HTTPTooManyRequests(HTTPError):
+    """
+    HTTP 429 response.
+    """
+
+    def __init__(self, retry_after=None):
+        """
+        retry_after -- int that specifies the 'Retry-After' header in seconds. None does not
+                       set the header. None by default.
+        """
+        super(HTTPTooManyRequests, self).__init__(
+            429, [('Retry-After', str(retry_after))] if retry_after is not None else None)
 
 class HTTPInternalServerError(HTTPError):
     """
@@ -411,3 +864,16 @@ class HTTPInternalServerError(HTTPError):
 
     def __init__(self):
         super(HTTPInternalServerError, self).__init__(500)
+
+class HTTPServiceUnavailable(HTTPError):
+    """
+    HTTP 503 response.
+    """
+
+    def __init__(self, retry_after=None):
+        """
+        retry_after -- int that specifies the 'Retry-After' header in seconds. None does not
+                       set the header. None by default.
+        """
+        super(HTTPServiceUnavailable, self).__init__(
+            503, [('Retry-After', str(retry_after))] if retry_after is not None else None)
@@ -0,0 +1,213 @@
+import bisect
+import glob
+import marshal
+import os
+import threading
+import time
+import weakref
+from weppy.handler import Handler
+from weppy.http import HTTPResponse
+
+# upper bounds in seconds of the buckets of latency histograms
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# phases of a request whose latency is measured
+PHASES = ('match', 'handler', 'serialise')
+
+def _escape(value):
+    """
+    Return value escaped for a label of the Prometheus text format.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _merge(counts, histograms, table):
+    """
+    Add the request counts and latency histograms of a table to counts and histograms.
+    """
+    table_counts, table_histograms = table
+    for (key, count) in list(table_counts.items()):
+        counts[key] = counts.get(key, 0) + count
+    for (key, histogram) in list(table_histograms.items()):
+        total = histograms.get(key)
+        histograms[key] = (list(histogram) if total is None else
+                           [a + b for (a, b) in zip(total, histogram)])
+
+class Metrics(object):
+    """
+    Request counters by route pattern, method and status code, and latency histograms by
+    route pattern and method of the route matching, handler and response serialisation
+    phases of requests, in the Prometheus text format.
+
+    Each thread records its requests in its own tables without locking, which are merged when
+    the metrics are rendered. The tables of threads that ended are folded into a single table
+    when a thread starts recording or the metrics are rendered. Worker processes sharing a
+    directory write their tables to it periodically, so that the metrics rendered by any of
+    them include all of them.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, directory=None, flush_interval=5.0):
+        """
+        buckets -- tuple of float that specifies the upper bounds in seconds of the buckets of
+                   latency histograms, in increasing order. DEFAULT_BUCKETS by default.
+        directory -- str that specifies the directory where worker processes write their
+                     tables. None does not share tables. None by default.
+        flush_interval -- float that specifies how often, in seconds, tables are written to
+                          directory. 5.0 by default.
+        """
+        self._buckets = tuple(buckets)
+        self._directory = directory
+        self._flush_interval = flush_interval
+        self._next_flush = 0
+        self._local = threading.local()
+        self._tables = []
+        self._folded = ({}, {})
+        self._lock = threading.Lock()
+
+    def _table(self):
+        """
+        Return the tables of the current thread, a tuple (dict of request counts by (route,
+        method, status), dict of latency histograms by (route, method)).
+        """
+        table = ({}, {})
+        self._local.table = table
+        with self._lock:
+            self._fold()
+            self._tables.append((weakref.ref(threading.current_thread()), table))
+        return table
+
+    def _fold(self):
+        """
+        Merge the tables of the threads that ended into the folded table and forget them,
+        while holding the lock.
+        """
+        tables = []
+        for (ref, table) in self._tables:
+            thread = ref()
+            if thread is None or not thread.is_alive():
+                _merge(self._folded[0], self._folded[1], table)
+            else:
+                tables.append((ref, table))
+        self._tables = tables
+
+    def record(self, route, method, status, match, handler, serialise):
+        """
+        Record a request.
+
+        route -- str that specifies the route pattern.
+        method -- str that specifies the request method.
+        status -- str that specifies the status code.
+        match, handler and serialise -- float that specifies the duration in seconds of each
+                                        phase of the request.
+        """
+        try:
+            counts, histograms = self._local.table
+        except AttributeError:
+            counts, histograms = self._table()
+        key = (route, method, status)
+        counts[key] = counts.get(key, 0) + 1
+        key = (route, method)
+        histogram = histograms.get(key)
+        buckets = self._buckets
+        size = len(buckets) + 2
+        if histogram is None:
+            histogram = histograms[key] = [0] * (size * len(PHASES))
+        histogram[bisect.bisect_left(buckets, match)] += 1
+        histogram[size - 1] += match
+        histogram[size + bisect.bisect_left(buckets, handler)] += 1
+        histogram[2 * size - 1] += handler
+        histogram[2 * size + bisect.bisect_left(buckets, serialise)] += 1
+        histogram[3 * size - 1] += serialise
+        if self._directory is not None and time.time() >= self._next_flush:
+            self.flush()
+
+    def snapshot(self):
+        """
+        Return the merged tables of all the threads of this process.
+        """
+        counts = {}
+        histograms = {}
+        with self._lock:
+            self._fold()
+            _merge(counts, histograms, self._folded)
+            tables = [table for (thread, table) in self._tables]
+        for table in tables:
+            _merge(counts, histograms, table)
+        return counts, histograms
+
+    def flush(self):
+        """
+        Write the tables of this process to the directory, if any.
+        """
+        if self._directory is None:
+            return
+        self._next_flush = time.time() + self._flush_interval
+        path = os.path.join(self._directory, 'metrics-%d.marshal' % os.getpid())
+        temporary = '%s.%d.tmp' % (path, threading.current_thread().ident)
+        with open(temporary, 'wb') as f:
+            marshal.dump(self.snapshot(), f)
+        os.rename(temporary, path)
+
+    def collect(self):
+        """
+        Return the merged tables of all the threads of this process, and of the other
+        processes sharing the directory, if any.
+        """
+        if self._directory is None:
+            return self.snapshot()
+        self.flush()
+        counts = {}
+        histograms = {}
+        for path in glob.glob(os.path.join(self._directory, 'metrics-*.marshal')):
+            try:
+                with open(path, 'rb') as f:
+                    table = marshal.load(f)
+            except (IOError, OSError, EOFError, ValueError, TypeError):
+                continue
+            _merge(counts, histograms, table)
+        return counts, histograms
+
+    def render(self):
+        """
+        Return the metrics in the Prometheus text format.
+        """
+        counts, histograms = self.collect()
+        lines = ['# HELP weppy_requests_total Requests by route pattern, method and status.',
+                 '# TYPE weppy_requests_total counter']
+        for ((route, method, status), count) in sorted(counts.items()):
+            lines.append('weppy_requests_total{route="%s",method="%s",status="%s"} %d' %
+                         (_escape(route), _escape(method), _escape(status), count))
+        lines.append('# HELP weppy_request_duration_seconds Duration of the phases of '
+                     'requests by route pattern and method.')
+        lines.append('# TYPE weppy_request_duration_seconds histogram')
+        size = len(self._buckets) + 2
+        bounds = ['%g' % bound for bound in self._buckets] + ['+Inf']
+        for ((route, method), histogram) in sorted(histograms.items()):
+            for (i, phase) in enumerate(PHASES):
+                labels = 'route="%s",method="%s",phase="%s"' % (_escape(route),
+                                                                _escape(method), phase)
+                count = 0
+                for (j, bound) in enumerate(bounds):
+                    count += histogram[i * size + j]
+                    lines.append('weppy_request_duration_seconds_bucket{%s,le="%s"} %d' %
+                                 (labels, bound, count))
+                lines.append('weppy_request_duration_seconds_sum{%s} %r' %
+                             (labels, float(histogram[i * size + size - 1])))
+                lines.append('weppy_request_duration_seconds_count{%s} %d' % (labels, count))
+        return '\n'.join(lines) + '\n'
+
+class MetricsHandler(Handler):
+    """
+    Serve metrics in the Prometheus text format.
+    """
+
+    def __init__(self, metrics, url_pattern='/metrics'):
+        """
+        metrics -- Metrics to serve.
+        url_pattern -- str that specifies the URL pattern. '/metrics' by default.
+        """
+        super(MetricsHandler, self).__init__(url_pattern)
+        self._metrics = metrics
+
+    def get(self, req):
+        return HTTPResponse(self._metrics.render(), content_type='text/plain')
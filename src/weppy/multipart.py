@@ -0,0 +1,147 @@
+import cgi
+import io
+import tempfile
+
+class MultipartError(ValueError):
+    """
+    Malformed or oversize multipart/form-data body.
+    """
+
+class UploadedFile(object):
+    """
+    File part of a multipart/form-data body.
+    """
+
+    def __init__(self, filename, content_type, file, size):
+        """
+        filename -- str that specifies the name of the file on the client.
+        content_type -- str that specifies the content type of the file.
+        file -- file object, rewound, that holds the file content in memory or on disk.
+        size -- int that specifies the file size in bytes.
+        """
+        self.filename = filename
+        self.content_type = content_type
+        self.file = file
+        self.size = size
+
+    def read(self, size=-1):
+        """
+        Read and return at most size bytes of the file content, or all of it if size is
+        negative.
+        """
+        return self.file.read(size)
+
+    def close(self):
+        """
+        Close the file, which removes it from disk if it was spooled.
+        """
+        self.file.close()
+
+class MultipartParser(object):
+    """
+    Incremental multipart/form-data parser that never holds more than a chunk, a part header
+    or a field value in memory.
+    """
+
+    def __init__(self, chunks, boundary, charset='UTF-8', memory_threshold=1024 * 1024,
+                 max_header_size=16 * 1024):
+        """
+        chunks -- iterable of bytes that specifies the body.
+        boundary -- bytes that specifies the boundary in the Content-Type header.
+        charset -- str that specifies the charset of field values. 'UTF-8' by default.
+        memory_threshold -- int that specifies the size in bytes above which file parts are
+                            spooled to a temporary file. It is also the maximum size of a field
+                            value. 1 MB by default.
+        max_header_size -- int that specifies the maximum size in bytes of the headers of a
+                           part. 16 KB by default.
+        """
+        self._chunks = iter(chunks)
+        self._delimiter = b'\r\n--' + boundary
+        self._charset = charset
+        self._memory_threshold = memory_threshold
+        self._max_header_size = max_header_size
+
+    def _read(self, buf):
+        """
+        Return buf with the next chunk of the body appended, or raise a MultipartError
+        exception if the body ended.
+        """
+        chunk = next(self._chunks, b'')
+        if not chunk:
+            raise MultipartError('Unexpected end of multipart body')
+        return buf + chunk
+
+    def _parse_headers(self, data):
+        """
+        Return a dict of the part headers in data with lowercase names.
+        """
+        headers = {}
+        for line in data.split(b'\r\n'):
+            name, sep, value = line.decode('latin-1').partition(':')
+            if not sep:
+                raise MultipartError('Malformed multipart header')
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+    def __iter__(self):
+        """
+        Yield a tuple (name, value) for each part of the body, where value is a str for fields
+        and an UploadedFile for file parts.
+        """
+        delimiter = self._delimiter
+        keep = len(delimiter) - 1
+        buf = b'\r\n'
+        while True:
+            index = buf.find(delimiter)
+            if index >= 0:
+                buf = buf[index + len(delimiter):]
+                break
+            buf = self._read(buf[-keep:])
+        while True:
+            while len(buf) < 2:
+                buf = self._read(buf)
+            if buf[:2] == b'--':
+                return
+            if buf[:2] != b'\r\n':
+                raise MultipartError('Malformed multipart boundary')
+            buf = buf[2:]
+            while True:
+                index = buf.find(b'\r\n\r\n')
+                if index >= 0:
+                    break
+                if len(buf) > self._max_header_size:
+                    raise MultipartError('Multipart header too large')
+                buf = self._read(buf)
+            if index > self._max_header_size:
+                raise MultipartError('Multipart header too large')
+            headers = self._parse_headers(buf[:index])
+            buf = buf[index + 4:]
+            disposition, params = cgi.parse_header(headers.get('content-disposition', ''))
+            if disposition != 'form-data' or 'name' not in params:
+                raise MultipartError('Malformed multipart Content-Disposition header')
+            is_file = 'filename' in params
+            if is_file:
+                target = tempfile.SpooledTemporaryFile(max_size=self._memory_threshold)
+            else:
+                target = io.BytesIO()
+            size = 0
+            while True:
+                index = buf.find(delimiter)
+                end = index if index >= 0 else max(len(buf) - keep, 0)
+                if end:
+                    size += end
+                    if not is_file and size > self._memory_threshold:
+                        raise MultipartError('Multipart field too large')
+                    target.write(buf[:end])
+                if index >= 0:
+                    buf = buf[index + len(delimiter):]
+                    break
+                buf = self._read(buf[end:])
+            if is_file:
+                target.seek(0)
+                value = UploadedFile(params['filename'],
+                                     headers.get('content-type', 'application/octet-stream'),
+                                     target, size)
+            else:
+                value = target.getvalue().decode(self._charset)
+            yield params['name'], value
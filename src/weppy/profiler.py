@@ -0,0 +1,202 @@
+import cProfile
+import os
+import pstats
+import random
+import re
+import signal
+import tempfile
+import threading
+import time
+from weppy.handler import Handler
+from weppy.http import HTTPResponse
+
+def _label(func):
+    """
+    Return the frame label of a function (filename, line number, name) in collapsed stacks.
+    """
+    filename, lineno, name = func
+    if filename == '~':
+        label = name
+    else:
+        label = '%s (%s:%d)' % (name, os.path.basename(filename), lineno)
+    return label.replace(';', ',')
+
+def collapse(stats, root=None, max_depth=64, min_time=1e-6):
+    """
+    Return a list of str lines 'frame;frame;... microseconds' of collapsed stacks, the input
+    format of flame graph tools, estimated from the caller graph of a pstats.Stats object.
+    The time of a function is split between its callers in proportion to the time spent in
+    it when called by each of them.
+
+    stats -- pstats.Stats.
+    root -- str that specifies a frame prepended to every stack. None by default.
+    max_depth -- int that specifies the maximum stack depth. 64 by default.
+    min_time -- float that specifies the time in seconds below which a stack is dropped.
+                1e-6 by default.
+    """
+    entries = stats.stats
+    children = {}
+    for (func, (cc, nc, tt, ct, callers)) in entries.items():
+        for (caller, value) in callers.items():
+            children.setdefault(caller, []).append((func, value[3]))
+    times = {}
+
+    def walk(func, stack, funcs, scale):
+        tt, ct = entries[func][2:4]
+        stack = stack + (_label(func),)
+        funcs = funcs | set([func])
+        if tt * scale >= min_time:
+            key = ';'.join(stack)
+            times[key] = times.get(key, 0.0) + tt * scale
+        if len(stack) >= max_depth:
+            return
+        for (child, child_time) in children.get(func, []):
+            child_ct = entries[child][3]
+            if child in funcs or child_time * scale < min_time or not child_ct:
+                continue
+            walk(child, stack, funcs, scale * child_time / child_ct)
+
+    for (func, entry) in entries.items():
+        if not entry[4]:
+            walk(func, (root,) if root is not None else (), frozenset(), 1.0)
+    return ['%s %d' % (stack, round(seconds * 1e6)) for (stack, seconds) in
+            sorted(times.items()) if round(seconds * 1e6)]
+
+class Profiler(object):
+    """
+    Profile a fraction of the calls of handlers with cProfile and accumulate the statistics
+    by route pattern, to be dumped as pstats files and collapsed stacks for flame graphs.
+
+    Requests that are not sampled only draw a random number. Only the call of the handler is
+    profiled, so the body of streaming responses, produced after it returns, is not.
+    """
+
+    def __init__(self, rate=0.01, patterns=None, methods=None, directory=None):
+        """
+        rate -- float from 0 to 1 that specifies the fraction of requests profiled. 0.01 by
+                default.
+        patterns -- list of str that specifies the URL patterns of the handlers profiled. None
+                    profiles all handlers. None by default.
+        methods -- list of str that specifies the request methods profiled, e.g. ['POST']. None
+                   profiles all methods. None by default.
+        directory -- str that specifies the directory files are dumped to. None uses a
+                     'weppy-profile-<pid>' directory in the temporary directory. None by
+                     default.
+        """
+        self.rate = rate
+        self._patterns = frozenset(patterns) if patterns is not None else None
+        self._methods = frozenset(method.upper() for method in methods) if methods else None
+        self._directory = directory
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, handler, req, args):
+        """
+        Return the HTTPResponse of handler for req, profiled if the request is sampled.
+
+        handler -- Handler.
+        req -- HTTPRequest.
+        args -- list of str that specifies the arguments extracted from the URL.
+        """
+        if (random.random() >= self.rate or
+                (self._patterns is not None and handler._url_pattern not in self._patterns) or
+                (self._methods is not None and req.method not in self._methods)):
+            return handler(req, *args)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return handler(req, *args)
+        finally:
+            profile.disable()
+            self._add(handler._url_pattern, profile)
+
+    def _add(self, pattern, profile):
+        """
+        Add the statistics of a profile to those of a route pattern.
+        """
+        with self._lock:
+            stats = self._stats.get(pattern)
+            if stats is None:
+                self._stats[pattern] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+    def patterns(self):
+        """
+        Return the sorted list of the route patterns with statistics.
+        """
+        with self._lock:
+            return sorted(self._stats)
+
+    def collapse(self):
+        """
+        Return the collapsed stacks of all route patterns, whose root frames are the route
+        patterns, as a str.
+        """
+        lines = []
+        with self._lock:
+            for (pattern, stats) in sorted(self._stats.items()):
+                lines.extend(collapse(stats, pattern.replace(';', ',')))
+        return ''.join(line + '\n' for line in lines)
+
+    def dump(self, directory=None):
+        """
+        Write a '.pstats' file and a '.folded' file of collapsed stacks for each route pattern
+        and return their paths.
+
+        directory -- str that specifies the directory. None uses the directory of the profiler.
+                     None by default.
+        """
+        directory = directory or self._directory or os.path.join(
+            tempfile.gettempdir(), 'weppy-profile-%d' % os.getpid())
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        prefix = time.strftime('%Y%m%d-%H%M%S')
+        paths = []
+        with self._lock:
+            for (pattern, stats) in sorted(self._stats.items()):
+                name = '%s-%s' % (prefix, re.sub(r'[^A-Za-z0-9_.-]+', '_', pattern).strip('_'))
+                path = os.path.join(directory, name + '.pstats')
+                stats.dump_stats(path)
+                paths.append(path)
+                path = os.path.join(directory, name + '.folded')
+                with open(path, 'w') as f:
+                    f.write(''.join(line + '\n' for line in collapse(stats)))
+                paths.append(path)
+        return paths
+
+    def reset(self):
+        """
+        Discard the accumulated statistics.
+        """
+        with self._lock:
+            self._stats = {}
+
+    def install_signal(self, signum=signal.SIGUSR2):
+        """
+        Dump the statistics, in a thread, when the process receives a signal.
+
+        signum -- int that specifies the signal. SIGUSR2 by default.
+        """
+        signal.signal(signum, lambda signum, frame: threading.Thread(target=self.dump).start())
+
+class ProfilerHandler(Handler):
+    """
+    Serve the collapsed stacks of a Profiler on GET, and dump its statistics and return the
+    paths of the files on POST.
+    """
+
+    def __init__(self, profiler, url_pattern='/profile'):
+        """
+        profiler -- Profiler to serve.
+        url_pattern -- str that specifies the URL pattern. '/profile' by default.
+        """
+        super(ProfilerHandler, self).__init__(url_pattern)
+        self._profiler = profiler
+
+    def get(self, req):
+        return HTTPResponse(self._profiler.collapse(), content_type='text/plain')
+
+    def post(self, req):
+        return HTTPResponse(''.join(path + '\n' for path in self._profiler.dump()),
+                            content_type='text/plain')
@@ -0,0 +1,151 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import struct
+import tempfile
+import threading
+import time
+from weppy.http import HTTPTooManyRequests
+
+# slot of the table of token buckets: key hash, number of tokens and time of last update
+_SLOT = struct.Struct('<Qdd')
+
+# first bytes of a key digest
+_HASH = struct.Struct('<Q')
+
+def _hash(key):
+    """
+    Return the non-zero 64-bit hash of a key.
+    """
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8')
+    return _HASH.unpack_from(hashlib.md5(key).digest())[0] or 1
+
+class RateLimiter(object):
+    """
+    Limit the rate of requests by client or route with token buckets.
+
+    The buckets are stored in a fixed-size hash table in a memory-mapped file, locked with
+    fcntl, so that the worker processes forked from the process that created the rate limiter,
+    or processes opening the same file, enforce a single limit. When the slots where a key can
+    be stored are all taken, the least recently used one is reused.
+    """
+
+    def __init__(self, rate, burst=None, key='address', slots=65536, path=None, probes=8):
+        """
+        rate -- float that specifies the number of requests per second allowed by key.
+        burst -- int that specifies the maximum number of requests allowed at once by key.
+                 None allows rate requests, or at least 1. None by default.
+        key -- str or function that specifies what requests are limited by: 'address' for the
+               remote address, 'route' for the URL pattern of the handler, 'header:<name>'
+               for the value of a header, e.g. 'header:X-Api-Key', falling back to the remote
+               address, or a function that returns the key of an HTTPRequest, or None not to
+               limit it. 'address' by default.
+        slots -- int that specifies the number of buckets of the table. 65536 by default.
+        path -- str that specifies the file of the table, shared by the processes opening it.
+                None uses an anonymous temporary file, shared with forked processes. None by
+                default.
+        probes -- int that specifies the number of slots where a key can be stored. 8 by
+                  default.
+        """
+        self._rate = float(rate)
+        self._burst = float(burst if burst is not None else max(rate, 1))
+        self._key = key
+        self._header = None
+        if not callable(key) and key.startswith('header:'):
+            self._header = 'HTTP_' + key[7:].strip().upper().replace('-', '_')
+        elif not callable(key) and key not in ('address', 'route'):
+            raise ValueError('invalid key %r' % key)
+        self._slots = slots
+        self._probes = min(probes, slots)
+        if path is None:
+            self._file = tempfile.TemporaryFile()
+        else:
+            self._file = open(path, 'a+b')
+        size = slots * _SLOT.size
+        fcntl.lockf(self._file, fcntl.LOCK_EX)
+        try:
+            self._file.seek(0, 2)
+            if self._file.tell() < size:
+                self._file.truncate(size)
+        finally:
+            fcntl.lockf(self._file, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._lock = threading.Lock()
+
+    def acquire(self, key, now=None):
+        """
+        Take a token from the bucket of key and return 0, or return how many seconds to wait
+        for a token if the bucket is empty.
+
+        key -- str that specifies the key.
+        now -- float that specifies the current time. None uses time.time(). None by default.
+        """
+        if now is None:
+            now = time.time()
+        key_hash = _hash(key)
+        start = key_hash % self._slots
+        rate = self._rate
+        burst = self._burst
+        table = self._map
+        with self._lock:
+            fcntl.lockf(self._file, fcntl.LOCK_EX)
+            try:
+                oldest = None
+                for i in range(self._probes):
+                    offset = (start + i) % self._slots * _SLOT.size
+                    slot_hash, tokens, updated = _SLOT.unpack_from(table, offset)
+                    if slot_hash == key_hash:
+                        tokens = min(burst, tokens + max(now - updated, 0) * rate)
+                        break
+                    if slot_hash == 0:
+                        tokens = burst
+                        break
+                    if oldest is None or updated < oldest[1]:
+                        oldest = (offset, updated)
+                else:
+                    offset = oldest[0]
+                    tokens = burst
+                if tokens >= 1:
+                    tokens -= 1
+                    wait = 0
+                else:
+                    wait = (1 - tokens) / rate
+                _SLOT.pack_into(table, offset, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(self._file, fcntl.LOCK_UN)
+        return wait
+
+    def __call__(self, req, route=None):
+        """
+        Take a token for req, or raise an HTTPTooManyRequests exception with the number of
+        seconds to wait if there is none.
+
+        req -- HTTPRequest.
+        route -- function that returns the URL pattern of the handler of an HTTPRequest, or
+                 None. None uses the path of req. None by default.
+        """
+        environ = req.environ
+        if callable(self._key):
+            key = self._key(req)
+            if key is None:
+                return
+        elif self._key == 'address':
+            key = environ.get('REMOTE_ADDR', '')
+        elif self._key == 'route':
+            key = route(req) if route is not None else req.path
+            if key is None:
+                return
+        else:
+            key = environ.get(self._header) or environ.get('REMOTE_ADDR', '')
+        wait = self.acquire(key)
+        if wait:
+            raise HTTPTooManyRequests(int(math.ceil(wait)))
+
+    def close(self):
+        """
+        Unmap the table and close its file.
+        """
+        self._map.close()
+        self._file.close()
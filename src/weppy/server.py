@@ -0,0 +1,397 @@
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from wsgiref import simple_server
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+def _call_hook(app, name):
+    """
+    Call the startup or shutdown method of a WSGI application, if it has one.
+    """
+    hook = getattr(app, name, None)
+    if hook is not None:
+        hook()
+
+class ServerHandler(simple_server.ServerHandler):
+    """
+    Run a WSGI application for a request and send files returned through wsgi.file_wrapper
+    with os.sendfile where it is available.
+    """
+
+    def sendfile(self):
+        """
+        Send the wrapped file with os.sendfile and return True, or return False if it is not
+        possible.
+        """
+        sendfile = getattr(os, 'sendfile', None)
+        if sendfile is None:
+            return False
+        try:
+            filelike = self.result.filelike
+            in_fd = filelike.fileno()
+            out_fd = self.stdout.fileno()
+            offset = filelike.tell()
+        except Exception:
+            return False
+        length = self.headers.get('Content-Length') if self.headers is not None else None
+        remaining = (int(length) if length is not None else
+                     os.fstat(in_fd).st_size - offset)
+        if not self.headers_sent:
+            self.send_headers()
+        self._flush()
+        while remaining > 0:
+            sent = sendfile(out_fd, in_fd, offset, remaining)
+            if not sent:
+                break
+            offset += sent
+            remaining -= sent
+            self.bytes_sent += sent
+        return True
+
+class WSGIRequestHandler(simple_server.WSGIRequestHandler):
+    """
+    Handle an HTTP request with ServerHandler.
+    """
+
+    def handle(self):
+        """
+        Handle a single HTTP request.
+        """
+        self.raw_requestline = self.rfile.readline(65537)
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+        handler = ServerHandler(self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
+                                multithread=self.server.multithread,
+                                multiprocess=self.server.multiprocess)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+class WSGIServer(simple_server.WSGIServer):
+    """
+    Single-threaded WSGI server whose listening socket can be shared by several processes.
+    """
+
+    multithread = False
+    multiprocess = False
+
+    def __init__(self, server_address, RequestHandlerClass, reuse_port=False):
+        """
+        server_address -- tuple (host, port) that specifies the address to listen on.
+        RequestHandlerClass -- class that handles requests.
+        reuse_port -- bool that specifies whether the SO_REUSEPORT option is set, so that
+                      several processes can listen on the same port. False by default.
+        """
+        self.reuse_port = reuse_port
+        simple_server.WSGIServer.__init__(self, server_address, RequestHandlerClass)
+
+    def serve_forever(self, poll_interval=0.5):
+        """
+        Run the startup hooks of the application, serve requests until shutdown is called,
+        then run its shutdown hooks.
+
+        poll_interval -- float that specifies how many seconds to wait for shutdown between
+                         checks. 0.5 by default.
+        """
+        _call_hook(self.get_app(), 'startup')
+        try:
+            simple_server.WSGIServer.serve_forever(self, poll_interval)
+        finally:
+            _call_hook(self.get_app(), 'shutdown')
+
+    def server_bind(self):
+        """
+        Bind the listening socket, with the SO_REUSEPORT option if reuse_port is set.
+        """
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        simple_server.WSGIServer.server_bind(self)
+
+    def get_request(self):
+        """
+        Accept a connection and return a tuple (socket, address) in blocking mode, even if the
+        listening socket is not.
+        """
+        conn, address = self.socket.accept()
+        conn.setblocking(True)
+        return conn, address
+
+class ThreadPoolWSGIServer(WSGIServer):
+    """
+    WSGI server that handles connections in a bounded pool of threads. Accepted connections
+    wait in a bounded queue, and no connection is accepted while it is full, so that the
+    kernel backlog, or other processes sharing the socket, hold them instead.
+
+    The threads are started when the first connection is accepted, so that the server can be
+    created before forking.
+    """
+
+    multithread = True
+
+    def __init__(self, server_address, RequestHandlerClass, reuse_port=False, threads=8,
+                 max_queue=64):
+        """
+        server_address -- tuple (host, port) that specifies the address to listen on.
+        RequestHandlerClass -- class that handles requests.
+        reuse_port -- bool that specifies whether the SO_REUSEPORT option is set. False by
+                      default.
+        threads -- int that specifies the number of threads. 8 by default.
+        max_queue -- int that specifies the maximum number of accepted connections waiting
+                     for a thread. 64 by default.
+        """
+        WSGIServer.__init__(self, server_address, RequestHandlerClass, reuse_port)
+        self._threads = threads
+        self._queue = Queue(max_queue)
+        self._workers = []
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    in_flight = property(lambda self: self._in_flight)
+    queued = property(lambda self: self._queue.qsize())
+
+    def _work(self):
+        """
+        Handle queued connections until a None sentinel is dequeued.
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            request, client_address = item
+            with self._lock:
+                self._in_flight += 1
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._lock:
+                    self._in_flight -= 1
+
+    def process_request(self, request, client_address):
+        """
+        Queue an accepted connection for the pool of threads, starting them if needed, and
+        wait while the queue is full.
+        """
+        if not self._workers:
+            for i in range(self._threads):
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._workers.append(thread)
+        self._queue.put((request, client_address))
+
+    def server_close(self):
+        """
+        Close the listening socket, and wait for the threads to handle the queued connections.
+        """
+        WSGIServer.server_close(self)
+        for thread in self._workers:
+            self._queue.put(None)
+        for thread in self._workers:
+            thread.join()
+        self._workers = []
+
+def parse_bind(bind):
+    """
+    Return a tuple (host, port) from a str 'host:port', ':port' or 'port'.
+
+    bind -- str that specifies the address to listen on.
+    """
+    host, sep, port = bind.rpartition(':')
+    return host.strip('[]') or '0.0.0.0', int(port)
+
+def make_server(host, port, app, reuse_port=False, threads=1, max_queue=64):
+    """
+    Return a WSGI server for app listening on host and port, single-threaded or with a pool
+    of threads.
+
+    host -- str that specifies the address to listen on.
+    port -- int that specifies the port to listen on.
+    app -- WSGI application.
+    reuse_port -- bool that specifies whether the SO_REUSEPORT option is set. False by
+                  default.
+    threads -- int that specifies the number of threads handling connections. 1 by default.
+    max_queue -- int that specifies the maximum number of accepted connections waiting for a
+                 thread, if threads is greater than 1. 64 by default.
+    """
+    if threads > 1:
+        server = ThreadPoolWSGIServer((host, port), WSGIRequestHandler, reuse_port, threads,
+                                      max_queue)
+    else:
+        server = WSGIServer((host, port), WSGIRequestHandler, reuse_port)
+    server.set_app(app)
+    return server
+
+class PreforkServer(object):
+    """
+    Master process that forks worker processes serving a WSGI application, loaded once before
+    forking, and respawns them when they exit.
+
+    SIGTERM or SIGINT shut the server down gracefully: workers stop accepting connections,
+    finish the request in progress and exit, and are killed after a timeout.
+    """
+
+    def __init__(self, app, host, port, workers, reuse_port=False, graceful_timeout=30,
+                 threads=1, max_queue=64):
+        """
+        app -- WSGI application.
+        host -- str that specifies the address to listen on.
+        port -- int that specifies the port to listen on.
+        workers -- int that specifies the number of worker processes.
+        reuse_port -- bool that specifies whether each worker binds its own socket with the
+                      SO_REUSEPORT option, so that the kernel balances connections between
+                      them, instead of sharing the socket bound by the master. False by
+                      default.
+        graceful_timeout -- int that specifies how many seconds workers have to exit after the
+                            server is shut down before they are killed. 30 by default.
+        threads -- int that specifies the number of threads handling connections in each
+                   worker process. 1 by default.
+        max_queue -- int that specifies the maximum number of accepted connections waiting for
+                     a thread in each worker process. 64 by default.
+        """
+        self._app = app
+        self._workers = workers
+        self._reuse_port = reuse_port
+        self._graceful_timeout = graceful_timeout
+        self._threads = threads
+        self._max_queue = max_queue
+        self._server = None if reuse_port else make_server(host, port, app, False, threads,
+                                                           max_queue)
+        self.server_address = (host, port) if reuse_port else self._server.server_address
+        self._pids = {}
+        self._stopping = False
+        self._deadline = None
+
+    def make_worker_server(self):
+        """
+        Return the WSGI server of a worker process.
+        """
+        if self._server is not None:
+            server = self._server
+        else:
+            server = make_server(self.server_address[0], self.server_address[1], self._app,
+                                 True, self._threads, self._max_queue)
+        server.multiprocess = True
+        return server
+
+    def run_worker(self):
+        """
+        Serve requests in a worker process until it receives SIGTERM, after running the
+        startup hooks of the application, and run its shutdown hooks before exiting.
+        """
+        running = [True]
+
+        def stop(signum, frame):
+            running[0] = False
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        server = self.make_worker_server()
+        server.socket.setblocking(False)
+        server.timeout = 0.5
+        _call_hook(self._app, 'startup')
+        try:
+            while running[0]:
+                server.handle_request()
+            server.server_close()
+        finally:
+            _call_hook(self._app, 'shutdown')
+
+    def _spawn(self):
+        """
+        Fork a worker process, which does not inherit the signal handlers and the worker
+        table of the master process.
+        """
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            self._pids = {}
+            status = 0
+            try:
+                self.run_worker()
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                sys.stderr.flush()
+                os._exit(status)
+        self._pids[pid] = time.time()
+
+    def _stop(self, signum, frame):
+        """
+        Start shutting down the server.
+        """
+        if not self._stopping:
+            self._stopping = True
+            self._deadline = time.time() + self._graceful_timeout
+            for pid in list(self._pids):
+                self._kill(pid, signal.SIGTERM)
+
+    def _kill(self, pid, signum):
+        """
+        Send a signal to a worker process, which may have exited already.
+        """
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+
+    def _reap(self):
+        """
+        Collect the worker processes that exited and return the lifetimes of those that
+        exited.
+        """
+        lifetimes = []
+        while self._pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError:
+                break
+            if pid == 0:
+                break
+            started = self._pids.pop(pid, None)
+            if started is not None:
+                lifetimes.append(time.time() - started)
+        return lifetimes
+
+    def serve_forever(self, poll_interval=0.1):
+        """
+        Fork the worker processes and supervise them until the server is shut down.
+
+        poll_interval -- float that specifies how often, in seconds, worker processes are
+                         checked. 0.1 by default.
+        """
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for i in range(self._workers):
+            self._spawn()
+        while self._pids:
+            lifetimes = self._reap()
+            if self._stopping:
+                if time.time() > self._deadline:
+                    for pid in list(self._pids):
+                        self._kill(pid, signal.SIGKILL)
+            elif lifetimes:
+                if min(lifetimes) < 1:
+                    time.sleep(1)
+                while len(self._pids) < self._workers and not self._stopping:
+                    self._spawn()
+            time.sleep(poll_interval)
+        if self._server is not None:
+            self._server.server_close()
@@ -0,0 +1,408 @@
+import binascii
+import hashlib
+import hmac
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from weppy.middleware import Middleware
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# session ids, 32 hexadecimal digits
+_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# cookie values, a session id and its signature
+_COOKIE = re.compile(r'^([0-9a-f]{32})\.([0-9a-f]{64})$')
+
+def _new_id():
+    """
+    Return a new random session id.
+    """
+    return binascii.hexlify(os.urandom(16)).decode('ascii')
+
+def _signature(secret, session_id):
+    """
+    Return the HMAC-SHA256 signature of a session id as hexadecimal digits.
+    """
+    return hmac.new(secret, session_id.encode('ascii'), hashlib.sha256).hexdigest()
+
+class Session(dict):
+    """
+    Dict of the values of a session, which records whether it was modified. Values that are
+    modified in place, e.g. appending to a list, are only saved if dirty is set.
+    """
+
+    def __init__(self, session_id=None, data=None):
+        """
+        session_id -- str that specifies the id of a stored session. None is a new session.
+                      None by default.
+        data -- dict that specifies the values. None by default.
+        """
+        super(Session, self).__init__(data or {})
+        self.id = session_id
+        self.dirty = False
+        self.invalidated = False
+
+    def __setitem__(self, key, value):
+        self.dirty = True
+        super(Session, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.dirty = True
+        super(Session, self).__delitem__(key)
+
+    def clear(self):
+        self.dirty = True
+        super(Session, self).clear()
+
+    def pop(self, *args):
+        self.dirty = True
+        return super(Session, self).pop(*args)
+
+    def popitem(self):
+        self.dirty = True
+        return super(Session, self).popitem()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.dirty = True
+        return super(Session, self).setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self.dirty = True
+        super(Session, self).update(*args, **kwargs)
+
+    def invalidate(self):
+        """
+        Remove the values and delete the stored session. Values set afterwards are saved in a
+        session with a new id.
+        """
+        self.clear()
+        self.invalidated = True
+
+class MemoryStore(object):
+    """
+    Store sessions in memory, evicting the least recently used ones. Sessions are not shared
+    between processes, so this store only suits servers with a single worker process.
+    """
+
+    def __init__(self, max_entries=10000):
+        """
+        max_entries -- int that specifies the maximum number of sessions. 10000 by default.
+        """
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id, now):
+        """
+        Return the dict of values of a session, or None if it does not exist or expired.
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is None or entry[0] <= now:
+                return None
+            self._entries[session_id] = entry
+        return dict(entry[1])
+
+    def save(self, session_id, data, expires):
+        """
+        Store the dict of values of a session until the specified time.
+        """
+        with self._lock:
+            self._entries.pop(session_id, None)
+            self._entries[session_id] = (expires, dict(data))
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(False)
+
+    def delete(self, session_id):
+        """
+        Delete a session.
+        """
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def sweep(self, now):
+        """
+        Delete the expired sessions and return how many were deleted.
+        """
+        with self._lock:
+            expired = [session_id for (session_id, (expires, data)) in self._entries.items()
+                       if expires <= now]
+            for session_id in expired:
+                del self._entries[session_id]
+        return len(expired)
+
+class FileStore(object):
+    """
+    Store sessions in a directory, one file per session whose modification time is its
+    expiration time. Files are replaced atomically, so processes can share the directory.
+    """
+
+    def __init__(self, directory):
+        """
+        directory -- str that specifies the directory, which is created if it does not exist.
+        """
+        self._directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def load(self, session_id, now):
+        """
+        Return the dict of values of a session, or None if it does not exist or expired.
+        """
+        try:
+            with open(os.path.join(self._directory, session_id), 'rb') as f:
+                if os.fstat(f.fileno()).st_mtime <= now:
+                    return None
+                return pickle.load(f)
+        except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+
+    def save(self, session_id, data, expires):
+        """
+        Store the dict of values of a session until the specified time.
+        """
+        path = os.path.join(self._directory, session_id)
+        temporary = os.path.join(self._directory, '.%s.%d.%d' % (
+            session_id, os.getpid(), threading.current_thread().ident))
+        with open(temporary, 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.utime(temporary, (expires, expires))
+        os.rename(temporary, path)
+
+    def delete(self, session_id):
+        """
+        Delete a session.
+        """
+        try:
+            os.remove(os.path.join(self._directory, session_id))
+        except OSError:
+            pass
+
+    def sweep(self, now):
+        """
+        Delete the expired sessions and return how many were deleted. Temporary files left by
+        interrupted writes are deleted after an hour.
+        """
+        count = 0
+        for name in os.listdir(self._directory):
+            path = os.path.join(self._directory, name)
+            try:
+                if name.startswith('.'):
+                    if os.stat(path).st_ctime < now - 3600:
+                        os.remove(path)
+                elif _ID.match(name) and os.stat(path).st_mtime <= now:
+                    os.remove(path)
+                    count += 1
+            except OSError:
+                pass
+        return count
+
+class SQLiteStore(object):
+    """
+    Store sessions in a SQLite database, in write-ahead logging mode so that reads do not
+    wait for writes. Each thread of each process uses its own connection, so processes can
+    share the database.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        """
+        path -- str that specifies the path of the database file, which is created if it does
+                not exist.
+        timeout -- float that specifies how many seconds a connection waits for a lock held by
+                   another one. 5.0 by default.
+        """
+        self._path = path
+        self._timeout = timeout
+        self._local = threading.local()
+        conn = sqlite3.connect(path, timeout=timeout)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions '
+                         '(id TEXT PRIMARY KEY, expires REAL NOT NULL, data BLOB NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connection(self):
+        """
+        Return the connection of the current thread, which is opened on first use and again
+        in a forked process.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=self._timeout, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, session_id, now):
+        """
+        Return the dict of values of a session, or None if it does not exist or expired.
+        """
+        row = self._connection().execute(
+            'SELECT data FROM sessions WHERE id = ? AND expires > ?',
+            (session_id, now)).fetchone()
+        return pickle.loads(bytes(row[0])) if row is not None else None
+
+    def save(self, session_id, data, expires):
+        """
+        Store the dict of values of a session until the specified time.
+        """
+        self._connection().execute(
+            'INSERT OR REPLACE INTO sessions (id, expires, data) VALUES (?, ?, ?)',
+            (session_id, expires, sqlite3.Binary(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))))
+
+    def delete(self, session_id):
+        """
+        Delete a session.
+        """
+        self._connection().execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+
+    def sweep(self, now):
+        """
+        Delete the expired sessions and return how many were deleted.
+        """
+        return self._connection().execute('DELETE FROM sessions WHERE expires <= ?',
+                                          (now,)).rowcount
+
+class SessionMiddleware(Middleware):
+    """
+    Give handlers a session in req.session, loaded from a store on first access and
+    identified by a cookie that holds its id and an HMAC signature of it.
+
+    A session is only saved when it is dirty, and its cookie is only set when it is saved, so
+    requests that do not modify their session do not write to the store. Sessions and their
+    cookies expire max_age seconds after they were last saved, and a background thread of
+    each process deletes the expired sessions from the store, printing its errors to stderr.
+    Sessions are not saved if the handler raises an exception.
+    """
+
+    def __init__(self, store, secret, cookie_name='session', max_age=14 * 24 * 3600, path='/',
+                 domain=None, secure=False, httponly=True, sweep_interval=600):
+        """
+        store -- MemoryStore, FileStore or SQLiteStore that stores the sessions.
+        secret -- str or bytes that specifies the key signing session ids.
+        cookie_name -- str that specifies the cookie name. 'session' by default.
+        max_age -- int that specifies how many seconds sessions are kept after they were last
+                   saved, and the 'Max-Age' attribute of cookies. 14 days by default.
+        path -- str that specifies the 'Path' attribute of cookies. '/' by default.
+        domain -- str that specifies the 'Domain' attribute of cookies. None by default.
+        secure -- bool that specifies whether cookies have the 'secure' flag. False by default.
+        httponly -- bool that specifies whether cookies have the 'HttpOnly' flag. True by
+                    default.
+        sweep_interval -- float that specifies how often, in seconds, expired sessions are
+                          deleted. None does not delete them in the background. 600 by
+                          default.
+        """
+        self._store = store
+        self._secret = secret.encode('utf-8') if not isinstance(secret, bytes) else secret
+        self._cookie_name = cookie_name
+        self._max_age = max_age
+        self._path = path
+        self._domain = domain
+        self._secure = secure
+        self._httponly = httponly
+        self._sweep_interval = sweep_interval
+        self._sweeper = None
+        self._lock = threading.Lock()
+
+    def sign(self, session_id):
+        """
+        Return the cookie value of a session id.
+        """
+        return '%s.%s' % (session_id, _signature(self._secret, session_id))
+
+    def unsign(self, value):
+        """
+        Return the session id of a cookie value, or None if its signature is not valid.
+        """
+        match = _COOKIE.match(value or '')
+        if match is None:
+            return None
+        session_id, signature = str(match.group(1)), str(match.group(2))
+        if not hmac.compare_digest(signature, str(_signature(self._secret, session_id))):
+            return None
+        return session_id
+
+    def load(self, environ, cookies):
+        """
+        Return the Session of a request, which is empty if the cookie does not identify a
+        stored session.
+
+        environ -- dict that specifies the WSGI environment of the request.
+        cookies -- dict that specifies the cookies of the request.
+        """
+        self._start_sweeper()
+        session_id = self.unsign(cookies.get(self._cookie_name))
+        data = None
+        if session_id is not None:
+            data = self._store.load(session_id, time.time())
+        session = Session(session_id if data is not None else None, data)
+        environ['weppy.session'] = session
+        return session
+
+    def before(self, req):
+        req.environ['weppy.sessions'] = self
+
+    def after(self, req, res):
+        session = req.environ.get('weppy.session')
+        if session is None:
+            return res
+        if session.invalidated and session.id is not None:
+            self._store.delete(session.id)
+            if not session:
+                res.delete_cookie(self._cookie_name, self._path, self._domain)
+                return res
+            session.id = None
+        if session.dirty and (session or session.id is not None):
+            if session.id is None:
+                session.id = _new_id()
+            self._store.save(session.id, dict(session), time.time() + self._max_age)
+            res.set_cookie(self._cookie_name, self.sign(session.id), self._max_age,
+                           self._path, self._domain, self._secure, self._httponly)
+        return res
+
+    def sweep(self):
+        """
+        Delete the expired sessions from the store and return how many were deleted.
+        """
+        return self._store.sweep(time.time())
+
+    def _start_sweeper(self):
+        """
+        Start the thread deleting expired sessions in this process, if it is not running.
+        """
+        if self._sweep_interval is None:
+            return
+        sweeper = self._sweeper
+        if sweeper is not None and sweeper.is_alive():
+            return
+        with self._lock:
+            if self._sweeper is None or not self._sweeper.is_alive():
+                self._sweeper = threading.Thread(target=self._sweep_forever)
+                self._sweeper.daemon = True
+                self._sweeper.start()
+
+    def _sweep_forever(self):
+        """
+        Delete the expired sessions every sweep_interval seconds.
+        """
+        while True:
+            time.sleep(self._sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                sys.stderr.write('Session sweep failed:\n')
+                traceback.print_exc()
+                sys.stderr.flush()
@@ -0,0 +1,137 @@
+import os
+import sys
+import threading
+import time
+import traceback
+
+try:
+    from queue import Full, Queue
+except ImportError:
+    from Queue import Full, Queue
+
+def _name(func):
+    """
+    Return the name of a task function in error messages.
+    """
+    func = getattr(func, 'func', func)
+    module = getattr(func, '__module__', None)
+    name = getattr(func, '__name__', None) or repr(func)
+    return '%s.%s' % (module, name) if module else name
+
+class TaskQueue(object):
+    """
+    Run functions in the background with a bounded pool of threads per process, e.g. the
+    functions scheduled by handlers with HTTPRequest.after_response.
+
+    Tasks wait in a bounded queue. When it is full, new tasks are dropped, or wait for room
+    with the 'block' policy. The exceptions of tasks are printed to stderr. The threads are
+    started when the first task is submitted, so that the queue can be created before
+    forking, and the tasks queued in the parent process are not run by its children.
+    """
+
+    def __init__(self, threads=2, max_queue=1024, policy='drop', block_timeout=None):
+        """
+        threads -- int that specifies the number of threads. 2 by default.
+        max_queue -- int that specifies the maximum number of tasks waiting for a thread.
+                     1024 by default.
+        policy -- str that specifies what happens to a task submitted while the queue is full:
+                  'drop' drops it and 'block' waits for room. 'drop' by default.
+        block_timeout -- float that specifies how many seconds a task waits for room with the
+                         'block' policy before it is dropped. None waits indefinitely. None by
+                         default.
+        """
+        if policy not in ('drop', 'block'):
+            raise ValueError('invalid policy %r' % policy)
+        self._threads = threads
+        self._max_queue = max_queue
+        self._policy = policy
+        self._block_timeout = block_timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    pending = property(lambda self: self._pending)
+    dropped = property(lambda self: self._dropped)
+    failed = property(lambda self: self._failed)
+
+    def _reset(self):
+        """
+        Create the queue and forget the threads and the counts of this process.
+        """
+        self._pid = os.getpid()
+        self._queue = Queue(self._max_queue)
+        self._workers = []
+        self._pending = 0
+        self._dropped = 0
+        self._failed = 0
+
+    def _work(self):
+        """
+        Run queued tasks until a None sentinel is dequeued.
+        """
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            func, args, kwargs = task
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                sys.stderr.write('Task %s failed:\n' % _name(func))
+                traceback.print_exc()
+                sys.stderr.flush()
+                with self._lock:
+                    self._failed += 1
+            finally:
+                with self._lock:
+                    self._pending -= 1
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a call of func with args and kwargs, starting the threads if needed, and return
+        whether it was queued or dropped because the queue is full.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if not self._workers:
+                for i in range(self._threads):
+                    thread = threading.Thread(target=self._work)
+                    thread.daemon = True
+                    thread.start()
+                    self._workers.append(thread)
+            self._pending += 1
+        try:
+            if self._policy == 'block':
+                self._queue.put((func, args, kwargs), True, self._block_timeout)
+            else:
+                self._queue.put_nowait((func, args, kwargs))
+        except Full:
+            with self._lock:
+                self._pending -= 1
+                self._dropped += 1
+            return False
+        return True
+
+    def drain(self, timeout=None):
+        """
+        Wait for the queued tasks to be run and stop the threads, and return whether they all
+        finished. Tasks submitted later start the threads again.
+
+        timeout -- float that specifies how many seconds to wait. None waits indefinitely.
+                   None by default.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            workers = self._workers
+            self._workers = []
+        deadline = time.time() + timeout if timeout is not None else None
+        try:
+            for thread in workers:
+                self._queue.put(None, True, None if deadline is None else
+                                max(deadline - time.time(), 0.001))
+        except Full:
+            return False
+        for thread in workers:
+            thread.join(None if deadline is None else max(deadline - time.time(), 0))
+        return not any(thread.is_alive() for thread in workers)
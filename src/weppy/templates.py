@@ -0,0 +1,328 @@
+import ast
+import hashlib
+import marshal
+import os
+import platform
+import re
+import sys
+import threading
+from webob.compat import text_type
+
+# tags of templates: {{ expression }}, {{! expression }}, {% statement %} and {# comment #}
+_TAG = re.compile(r'(\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\})', re.S)
+
+# statements that open a block closed by {% end %}
+_BLOCKS = ('for', 'if', 'while', 'with', 'try')
+
+# statements that continue the block of the previous statement
+_CONTINUATIONS = ('elif', 'else', 'except', 'finally')
+
+# tag of the compiled code objects cached on disk, which are specific to the interpreter
+_CACHE_TAG = '%s-%d%d' % (platform.python_implementation().lower(), sys.version_info[0],
+                          sys.version_info[1])
+
+class TemplateSyntaxError(Exception):
+    """
+    Exception raised when a template cannot be compiled.
+    """
+
+    def __init__(self, message, name, line):
+        super(TemplateSyntaxError, self).__init__('%s, in %s at line %d' %
+                                                  (message, name, line))
+        self.name = name
+        self.line = line
+
+class Markup(text_type):
+    """
+    str that is not escaped when it is output by a template, e.g. HTML built by a helper.
+    """
+
+def escape(value):
+    """
+    Return value as a str with the HTML special characters escaped, unless it is Markup.
+    """
+    if isinstance(value, Markup):
+        return value
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    elif not isinstance(value, text_type):
+        value = text_type(value)
+    return (value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            .replace('"', '&quot;').replace("'", '&#39;'))
+
+def _text(value):
+    """
+    Return value as a str without escaping it.
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value if isinstance(value, text_type) else text_type(value)
+
+def compile_template(source, name='<template>', autoescape=True):
+    """
+    Return the code object of a template, which defines a generator function _render that
+    yields the output of the template in pieces, or raise a TemplateSyntaxError exception.
+
+    {{ expression }} outputs a Python expression, escaped if autoescape is set, and
+    {{! expression }} outputs it without escaping. {% statement %} runs a for, if, while, with
+    or try statement, whose block ends with {% end %}, or a continuation of it, e.g.
+    {% else %}. {% set name = expression %} assigns a variable of the rendering, which can be
+    a variable of the context, and {% include expression %} outputs another template of the
+    same loader. {# comment #} is ignored. A newline right after a statement is removed.
+
+    source -- str that specifies the template.
+    name -- str that specifies the name of the template in error messages and tracebacks.
+            '<template>' by default.
+    autoescape -- bool that specifies whether {{ expression }} is escaped. True by default.
+    """
+    if isinstance(source, bytes):
+        source = source.decode('utf-8')
+    lines = ['def _render():', '    if 0: yield']
+    # template line of each line of the generated code, to report Python syntax errors
+    sources = [1, 1]
+    # variables assigned by {% set %}, declared global so that they are kept in the namespace
+    names = set()
+    indent = 1
+    line = 1
+    trim = False
+    for token in _TAG.split(source):
+        if trim and token.startswith('\n'):
+            token = token[1:]
+            line += 1
+        trim = False
+        if not token:
+            continue
+        prefix = '    ' * indent
+        emitted = len(lines)
+        if token.startswith('{{') and token.endswith('}}'):
+            if token.startswith('{{!'):
+                lines.append('%syield _text(%s)' % (prefix, token[3:-2].strip()))
+            else:
+                lines.append('%syield %s(%s)' % (prefix, '_escape' if autoescape else '_text',
+                                                token[2:-2].strip()))
+        elif token.startswith('{%') and token.endswith('%}'):
+            statement = token[2:-2].strip()
+            keyword = statement.split(None, 1)[0] if statement else ''
+            if keyword == 'end':
+                if indent == 1:
+                    raise TemplateSyntaxError('unexpected {% end %}', name, line)
+                indent -= 1
+            elif keyword in _CONTINUATIONS:
+                if indent == 1:
+                    raise TemplateSyntaxError('unexpected {%% %s %%}' % keyword, name, line)
+                lines.append('%s%s:' % ('    ' * (indent - 1), statement.rstrip(':')))
+                lines.append('%spass' % prefix)
+            elif keyword in _BLOCKS:
+                lines.append('%s%s:' % (prefix, statement.rstrip(':')))
+                indent += 1
+                lines.append('%spass' % ('    ' * indent))
+            elif keyword == 'set':
+                try:
+                    tree = ast.parse(statement[3:].strip())
+                except SyntaxError as error:
+                    raise TemplateSyntaxError('invalid Python: %s' % error.msg, name, line)
+                names.update(node.id for node in ast.walk(tree)
+                             if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store))
+                lines.append('%s%s' % (prefix, statement[3:].strip()))
+            elif keyword == 'include':
+                lines.append('%sfor _chunk in _include(%s):' % (prefix, statement[7:].strip()))
+                lines.append('%s    yield _chunk' % prefix)
+            else:
+                raise TemplateSyntaxError('unknown statement %r' % statement, name, line)
+            trim = True
+        elif not (token.startswith('{#') and token.endswith('#}')):
+            lines.append('%syield %r' % (prefix, token))
+        sources.extend([line] * sum(piece.count('\n') + 1 for piece in lines[emitted:]))
+        line += token.count('\n')
+    if indent != 1:
+        raise TemplateSyntaxError('missing {% end %}', name, line)
+    if names:
+        lines.insert(1, '    global %s' % ', '.join(sorted(names)))
+        sources.insert(1, 1)
+    try:
+        return compile('\n'.join(lines) + '\n', name, 'exec')
+    except SyntaxError as error:
+        if error.lineno and error.lineno <= len(sources):
+            line = sources[error.lineno - 1]
+        raise TemplateSyntaxError('invalid Python: %s' % error.msg, name, line)
+
+def _coalesce(pieces, chunk_size):
+    """
+    Yield the pieces joined in chunks of about chunk_size characters.
+    """
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+class Template(object):
+    """
+    Template compiled to a Python code object.
+    """
+
+    def __init__(self, code, loader=None, chunk_size=8 * 1024, mtime=None):
+        """
+        code -- code object returned by compile_template, or str that specifies the source of
+                the template, which is compiled.
+        loader -- TemplateLoader that loads the templates included by this one. None by
+                  default.
+        chunk_size -- int that specifies the size in characters of the chunks yielded by
+                      generate. 8 KB by default.
+        mtime -- float that specifies the modification time of the source file. None by
+                 default.
+        """
+        if not hasattr(code, 'co_code'):
+            code = compile_template(code)
+        self._code = code
+        self._loader = loader
+        self._chunk_size = chunk_size
+        self.mtime = mtime
+
+    def _generate(self, namespace):
+        """
+        Return the generator of the pieces of the output of this template, whose variables are
+        looked up in namespace.
+        """
+        namespace = dict(namespace)
+        exec(self._code, namespace)
+        return namespace['_render']()
+
+    def _namespace(self, context):
+        """
+        Return the namespace of a rendering with the variables of context.
+        """
+        namespace = {'_escape': escape, '_text': _text}
+        namespace.update(context)
+        if self._loader is not None:
+            loader = self._loader
+            namespace['_include'] = lambda name: loader.get(name)._generate(namespace)
+        return namespace
+
+    def generate(self, **context):
+        """
+        Return an iterator over the output of this template in chunks of str, which can be the
+        body of a streaming HTTPResponse, or be returned by a handler method.
+
+        context -- variables of the template.
+        """
+        return _coalesce(self._generate(self._namespace(context)), self._chunk_size)
+
+    def render(self, **context):
+        """
+        Return the output of this template as a str.
+
+        context -- variables of the template.
+        """
+        return ''.join(self._generate(self._namespace(context)))
+
+class TemplateLoader(object):
+    """
+    Load the templates of a directory.
+
+    Compiled templates are kept in memory and, if there is a cache directory, written to it as
+    marshalled code objects, so that other worker processes and later runs do not compile them
+    again. In debug mode, templates are compiled again when their file is modified.
+    """
+
+    def __init__(self, directory, debug=False, cache_directory=None, autoescape=True,
+                 chunk_size=8 * 1024):
+        """
+        directory -- str that specifies the directory of the templates.
+        debug -- bool that specifies whether the modification times of template files are
+                 checked on each load. False by default.
+        cache_directory -- str that specifies the directory of the compiled templates, which is
+                           created if it does not exist. None does not cache them on disk.
+                           None by default.
+        autoescape -- bool that specifies whether {{ expression }} is escaped. True by default.
+        chunk_size -- int that specifies the size in characters of the chunks yielded by
+                      streaming templates. 8 KB by default.
+        """
+        self._directory = os.path.abspath(directory)
+        self._debug = debug
+        self._cache_directory = cache_directory
+        self._autoescape = autoescape
+        self._chunk_size = chunk_size
+        self._templates = {}
+        self._lock = threading.Lock()
+        if cache_directory is not None and not os.path.isdir(cache_directory):
+            os.makedirs(cache_directory)
+
+    def _path(self, name):
+        """
+        Return the path of the template file with the specified name, or raise a ValueError
+        exception if it is outside the directory.
+        """
+        path = os.path.normpath(os.path.join(self._directory, name))
+        if not path.startswith(self._directory + os.sep):
+            raise ValueError('template %r is outside %s' % (name, self._directory))
+        return path
+
+    def get(self, name):
+        """
+        Return the Template with the specified name, e.g. 'index.html', or raise an OSError
+        exception if it does not exist.
+        """
+        template = self._templates.get(name)
+        if template is not None and not self._debug:
+            return template
+        path = self._path(name)
+        mtime = os.path.getmtime(path)
+        if template is not None and template.mtime == mtime:
+            return template
+        with self._lock:
+            template = self._templates.get(name)
+            if template is None or template.mtime != mtime:
+                code = self._load(name, path, mtime)
+                template = Template(code, self, self._chunk_size, mtime)
+                self._templates[name] = template
+        return template
+
+    def _load(self, name, path, mtime):
+        """
+        Return the code object of a template, from the cache directory if it is up to date.
+        """
+        cache_path = None
+        if self._cache_directory is not None:
+            digest = hashlib.sha1(('%s:%s' % (path, self._autoescape)).encode('utf-8'))
+            cache_path = os.path.join(self._cache_directory, '%s.%s.cache' % (
+                digest.hexdigest(), _CACHE_TAG))
+            try:
+                with open(cache_path, 'rb') as f:
+                    cached_mtime, code = marshal.load(f)
+                if cached_mtime == mtime:
+                    return code
+            except (IOError, OSError, EOFError, ValueError, TypeError):
+                pass
+        with open(path, 'rb') as f:
+            code = compile_template(f.read(), name, self._autoescape)
+        if cache_path is not None:
+            temporary = '%s.%d.%d.tmp' % (cache_path, os.getpid(),
+                                         threading.current_thread().ident)
+            with open(temporary, 'wb') as f:
+                marshal.dump((mtime, code), f)
+            os.rename(temporary, cache_path)
+        return code
+
+    def render(self, name, **context):
+        """
+        Return the output of the template with the specified name as a str.
+
+        context -- variables of the template.
+        """
+        return self.get(name).render(**context)
+
+    def generate(self, name, **context):
+        """
+        Return an iterator over the output of the template with the specified name in chunks
+        of str.
+
+        context -- variables of the template.
+        """
+        return self.get(name).generate(**context)
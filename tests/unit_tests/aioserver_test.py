@@ -0,0 +1,198 @@
+import asyncio
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from weppy.aioserver import *
+from weppy.asgi import *
+from weppy.handler import *
+from weppy.http import *
+from weppy.static import *
+from weppy.wsgi import *
+
+### Handlers ###
+
+@url('/echo/')
+class EchoHandler:
+    def get(self, req):
+        return 'get %s' % req.query_string
+
+    def post(self, req):
+        return HTTPResponse(req.body, content_type='application/octet-stream')
+
+@url('/stream/')
+class StreamHandler:
+    def get(self, req):
+        for i in range(3):
+            yield 'chunk %d\n' % i
+
+### Tests ###
+
+class AsyncioServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'data.bin'), 'wb') as f:
+            f.write(b'0123456789' * 10000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def start(self, app, **kwargs):
+        """
+        Start an AsyncioServer for app in a thread.
+        """
+        for handler in (EchoHandler, StreamHandler,
+                        StaticFileHandler('/static/', self.directory)):
+            app.add_handler(handler)
+        self.server = AsyncioServer(app, '127.0.0.1', 0, **kwargs)
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.server.start())
+        thread = threading.Thread(target=self.loop.run_forever)
+        thread.start()
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            thread.join()
+            self.loop.close()
+
+        self.addCleanup(stop)
+
+    def connect(self):
+        """
+        Return a socket connected to the server, and a file to read its responses.
+        """
+        conn = socket.create_connection(self.server.server_address)
+        conn.settimeout(5)
+        self.addCleanup(conn.close)
+        return conn, conn.makefile('rb')
+
+    def read_response(self, f):
+        """
+        Return a tuple (status, dict of headers, body) read from f.
+        """
+        status = f.readline().decode('latin-1').split(' ', 2)[1]
+        headers = {}
+        for line in iter(f.readline, b'\r\n'):
+            name, sep, value = line.decode('latin-1').partition(':')
+            headers[name.lower()] = value.strip()
+        if 'content-length' in headers:
+            body = f.read(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            body = b''
+            while True:
+                size = int(f.readline(), 16)
+                chunk = f.read(size + 2)[:-2]
+                if not size:
+                    break
+                body += chunk
+        else:
+            body = f.read()
+        return status, headers, body
+
+    def test_keep_alive(self):
+        self.start(WSGIApplication(False))
+        conn, f = self.connect()
+        for i in range(3):
+            conn.sendall(b'GET /echo/?%d HTTP/1.1\r\nHost: localhost\r\n\r\n' % i)
+            status, headers, body = self.read_response(f)
+            self.assertEqual((status, body), ('200', b'get %d' % i))
+            self.assertEqual(headers['connection'], 'keep-alive')
+
+    def test_pipelining(self):
+        self.start(WSGIApplication(False))
+        conn, f = self.connect()
+        conn.sendall(b'GET /echo/?1 HTTP/1.1\r\n\r\n'
+                     b'POST /echo/ HTTP/1.1\r\nContent-Length: 4\r\n\r\ndata'
+                     b'GET /echo/?3 HTTP/1.1\r\nConnection: close\r\n\r\n')
+        self.assertEqual(self.read_response(f)[2], b'get 1')
+        self.assertEqual(self.read_response(f)[2], b'data')
+        status, headers, body = self.read_response(f)
+        self.assertEqual((body, headers['connection']), (b'get 3', 'close'))
+        self.assertEqual(f.read(), b'')
+
+    def test_chunked(self):
+        self.start(WSGIApplication(False))
+        conn, f = self.connect()
+        conn.sendall(b'POST /echo/ HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                     b'4\r\ndata\r\n5;ext=1\r\n12345\r\n0\r\n\r\n'
+                     b'GET /stream/ HTTP/1.1\r\n\r\n')
+        self.assertEqual(self.read_response(f)[2], b'data12345')
+        status, headers, body = self.read_response(f)
+        self.assertEqual(headers['transfer-encoding'], 'chunked')
+        self.assertEqual(body, b'chunk 0\nchunk 1\nchunk 2\n')
+
+    def test_http10(self):
+        self.start(WSGIApplication(False))
+        conn, f = self.connect()
+        conn.sendall(b'GET /stream/ HTTP/1.0\r\n\r\n')
+        status, headers, body = self.read_response(f)
+        self.assertEqual(headers['connection'], 'close')
+        self.assertEqual(body, b'chunk 0\nchunk 1\nchunk 2\n')
+
+    def test_file(self):
+        self.start(WSGIApplication(False))
+        conn, f = self.connect()
+        conn.sendall(b'GET /static/data.bin HTTP/1.1\r\n\r\nGET /echo/ HTTP/1.1\r\n\r\n')
+        self.assertEqual(self.read_response(f)[2], b'0123456789' * 10000)
+        self.assertEqual(self.read_response(f)[2], b'get ')
+
+    def test_header_timeout(self):
+        self.start(WSGIApplication(False), header_timeout=0.2)
+        conn, f = self.connect()
+        conn.sendall(b'GET /echo/ HTTP/1.1\r\n')
+        self.assertEqual(f.read(), b'')
+
+    def test_keep_alive_timeout(self):
+        self.start(WSGIApplication(False), header_timeout=5, keep_alive_timeout=0.2)
+        conn, f = self.connect()
+        conn.sendall(b'GET /echo/?1 HTTP/1.1\r\n\r\n')
+        self.assertEqual(self.read_response(f)[2], b'get 1')
+        conn.sendall(b'GET /echo/?2 HTTP/1.1\r\n')
+        time.sleep(0.4)
+        conn.sendall(b'\r\n')
+        self.assertEqual(self.read_response(f)[2], b'get 2')
+        time.sleep(0.4)
+        self.assertEqual(f.read(), b'')
+
+    def test_bad_request(self):
+        self.start(WSGIApplication(False))
+        conn, f = self.connect()
+        conn.sendall(b'GET\r\n\r\n')
+        self.assertEqual(self.read_response(f)[0], '400')
+
+    def test_max_body_size(self):
+        self.start(WSGIApplication(False), max_body_size=8)
+        conn, f = self.connect()
+        conn.sendall(b'POST /echo/ HTTP/1.1\r\nContent-Length: 8\r\n\r\n12345678')
+        self.assertEqual(self.read_response(f)[2], b'12345678')
+        conn.sendall(b'POST /echo/ HTTP/1.1\r\nContent-Length: 9\r\n\r\n123456789')
+        self.assertEqual(self.read_response(f)[0], '413')
+        conn, f = self.connect()
+        conn.sendall(b'POST /echo/ HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                     b'5\r\n12345\r\n5\r\n67890\r\n0\r\n\r\n')
+        self.assertEqual(self.read_response(f)[0], '413')
+
+    def test_asgi(self):
+        self.start(ASGIApplication(False))
+        conn, f = self.connect()
+        conn.sendall(b'POST /echo/ HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                     b'4\r\ndata\r\n0\r\n\r\n'
+                     b'GET /stream/ HTTP/1.1\r\n\r\n')
+        self.assertEqual(self.read_response(f)[2], b'data')
+        self.assertEqual(self.read_response(f)[2], b'chunk 0\nchunk 1\nchunk 2\n')
+
+    def test_unread_body(self):
+        self.start(ASGIApplication(False))
+        conn, f = self.connect()
+        conn.sendall(b'GET /echo/?1 HTTP/1.1\r\nContent-Length: 4\r\n\r\ndata'
+                     b'GET /echo/?2 HTTP/1.1\r\nContent-Length: 1000000\r\n\r\ndata')
+        self.assertEqual(self.read_response(f)[2], b'get 1')
+        self.assertEqual(self.read_response(f)[2], b'get 2')
+        self.assertEqual(f.read(), b'')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import unittest
+from weppy.asgi import *
+from weppy.handler import *
+from weppy.http import *
+
+### Handlers ###
+
+@url('/')
+class RootHandler:
+    async def get(self, req):
+        await asyncio.sleep(0)
+        return HTTPResponse('get')
+
+    def post(self, req):
+        return HTTPResponse('post %s %s' % (req.body.decode('ascii'),
+                                            threading.current_thread().name))
+
+@url('/upload/')
+class UploadHandler:
+    async def post(self, req):
+        return HTTPResponse('%d' % len(await read_body(req, max_size=10)))
+
+@url('/stream/')
+class StreamHandler:
+    def get(self, req):
+        for i in range(3):
+            yield 'chunk %d\n' % i
+
+    async def post(self, req):
+        async def body():
+            async for chunk in iter_body(req):
+                yield chunk.upper()
+        return body()
+
+@url('/arg/_/')
+class ArgHandler:
+    etag = 'strong'
+
+    async def get(self, req, arg):
+        return 'get %s' % arg
+
+finalized = []
+
+@url('/finalize/')
+class FinalizeHandler:
+    async def get(self, req):
+        req.after_response(lambda: finalized.append(threading.current_thread().name))
+        return 'finalize'
+
+### Tests ###
+
+def request(app, method, path, chunks=(), headers=()):
+    """
+    Return a tuple (status, headers, list of body chunks) of the response of an ASGI
+    application.
+    """
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'path': path,
+             'query_string': b'', 'headers': [(name.lower().encode('latin-1'),
+                                               value.encode('latin-1'))
+                                              for (name, value) in headers]}
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': True}
+                for chunk in chunks] + [{'type': 'http.request', 'body': b''}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    headers = dict((name.decode('latin-1'), value.decode('latin-1'))
+                   for (name, value) in sent[0]['headers'])
+    return sent[0]['status'], headers, [message['body'] for message in sent[1:]]
+
+class ASGIApplicationTest(unittest.TestCase):
+    def setUp(self):
+        self.app = ASGIApplication(False, threads=2)
+        for handler in (RootHandler, UploadHandler, StreamHandler, ArgHandler,
+                        FinalizeHandler):
+            self.app.add_handler(handler)
+
+    def test_async(self):
+        self.assertEqual(request(self.app, 'GET', '/'), (200, {
+            'content-type': 'text/html; charset=UTF-8', 'content-length': '3'}, [b'get']))
+
+    def test_sync(self):
+        status, headers, body = request(self.app, 'POST', '/', [b'da', b'ta'])
+        self.assertEqual(status, 200)
+        self.assertTrue(body[0].startswith(b'post data '))
+        self.assertNotEqual(body[0], ('post data %s' % threading.current_thread().name)
+                            .encode('ascii'))
+
+    def test_read_body(self):
+        self.assertEqual(request(self.app, 'POST', '/upload/', [b'01234', b'56789'])[2],
+                         [b'10'])
+        self.assertEqual(request(self.app, 'POST', '/upload/', [b'0123456789', b'0'])[0],
+                         413)
+
+    def test_stream(self):
+        self.assertEqual(request(self.app, 'GET', '/stream/')[2],
+                         [b'chunk 0\n', b'chunk 1\n', b'chunk 2\n', b''])
+        self.assertEqual(request(self.app, 'POST', '/stream/', [b'a', b'b'])[2],
+                         [b'A', b'B', b''])
+
+    def test_head(self):
+        status, headers, body = request(self.app, 'HEAD', '/')
+        self.assertEqual((status, body), (200, [b'']))
+        self.assertEqual(headers['content-length'], '3')
+
+    def test_etag(self):
+        status, headers, body = request(self.app, 'GET', '/arg/a/')
+        etag = headers['etag']
+        headers = [('If-None-Match', etag)]
+        self.assertEqual(request(self.app, 'GET', '/arg/a/', headers=headers)[0], 304)
+
+    def test_errors(self):
+        self.assertEqual(request(self.app, 'GET', '/none/')[0], 404)
+        self.assertEqual(request(self.app, 'GET', '/upload/')[0], 405)
+        self.assertEqual(request(self.app, 'GET', '/arg/a')[0], 302)
+
+    def test_finalize(self):
+        del finalized[:]
+        self.assertEqual(request(self.app, 'GET', '/finalize/')[2], [b'finalize'])
+        self.assertEqual(len(finalized), 1)
+        self.assertNotEqual(finalized[0], threading.current_thread().name)
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+if __name__ == '__main__':
+    unittest.main()
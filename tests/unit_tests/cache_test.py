@@ -0,0 +1,160 @@
+import unittest
+import weppy.cache
+from weppy.cache import *
+from weppy.handler import *
+from weppy.http import *
+from weppy.wsgi import *
+
+### Handlers ###
+
+calls = []
+
+@url('/cached/_/')
+class CachedHandler:
+    def get(self, req, name):
+        calls.append(name)
+        res = HTTPResponse('cached %s %d' % (name, len(calls)))
+        res.cache_expires(60)
+        return res
+
+@url('/vary/')
+class VaryHandler:
+    def get(self, req):
+        calls.append('vary')
+        return HTTPResponse(req.headers.get('Accept-Language', ''),
+                            headerlist=[('Cache-Control', 'max-age=60'),
+                                        ('Vary', 'Accept-Language')])
+
+@url('/uncached/')
+class UncachedHandler:
+    def get(self, req):
+        calls.append('uncached')
+        return HTTPResponse('uncached')
+
+@url('/cookie/')
+class CookieHandler:
+    def get(self, req):
+        calls.append('cookie')
+        res = HTTPResponse('cookie')
+        res.cache_expires(60)
+        res.set_cookie('abc', 'def')
+        return res
+
+### Tests ###
+
+class FakeTime(object):
+    now = 1000.0
+
+    @classmethod
+    def time(cls):
+        return cls.now
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        del calls[:]
+        self.cache = ResponseCache(max_entries=3)
+        self.app = WSGIApplication(False, cache=self.cache)
+        for handler in (CachedHandler, VaryHandler, UncachedHandler, CookieHandler):
+            self.app.add_handler(handler)
+
+    def tearDown(self):
+        weppy.cache.time = __import__('time')
+
+    def get(self, path, headers=None):
+        return self.app.handle_request(HTTPRequest.get(path_info=path, headers=headers))
+
+    def test_hit(self):
+        self.assertEqual(self.get('/cached/a/').text, 'cached a 1')
+        res = self.get('/cached/a/')
+        self.assertEqual(res.text, 'cached a 1')
+        self.assertIn(('Cache-Control', 'max-age=60'), res.headerlist)
+        self.assertIn(('Content-Length', '10'), res.headerlist)
+        self.assertEqual(calls, ['a'])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        self.assertEqual(self.get('/cached/a/', {'QUERY_STRING': 'x=1'}).text, 'cached a 2')
+        self.app.handle_request(HTTPRequest.post(path_info='/cached/a/'))
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_head(self):
+        req = HTTPRequest.head(path_info='/cached/a/')
+        self.assertIn(('Content-Length', '10'), self.app.handle_request(req).headerlist)
+        self.assertEqual(len(self.cache), 0)
+        self.get('/cached/a/')
+        res = self.app.handle_request(HTTPRequest.head(path_info='/cached/a/'))
+        self.assertEqual(res.body, b'')
+        self.assertIn(('Content-Length', '10'), res.headerlist)
+        self.assertEqual(calls, ['a', 'a'])
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_etag(self):
+        app = WSGIApplication(False, cache=self.cache, etag='weak')
+        app.add_handler(CachedHandler)
+        etag = app.handle_request(HTTPRequest.get(path_info='/cached/a/')).etag
+        self.assertTrue(etag.startswith('W/"'))
+        headers = {'HTTP_IF_NONE_MATCH': etag}
+        res = app.handle_request(HTTPRequest.get(path_info='/cached/a/', headers=headers))
+        self.assertEqual(res.status, '304 Not Modified')
+        self.assertEqual(self.cache.hits, 1)
+        res = app.handle_request(HTTPRequest.head(path_info='/cached/a/'))
+        self.assertEqual(res.etag, etag)
+        res = app.handle_request(HTTPRequest.head(path_info='/cached/a/', headers=headers))
+        self.assertEqual(res.status, '304 Not Modified')
+        self.assertEqual(calls, ['a'])
+
+    def test_host(self):
+        self.assertEqual(self.get('/cached/a/', {'HTTP_HOST': 'one.test'}).text, 'cached a 1')
+        self.assertEqual(self.get('/cached/a/', {'HTTP_HOST': 'two.test'}).text, 'cached a 2')
+        self.assertEqual(self.get('/cached/a/', {'HTTP_HOST': 'one.test'}).text, 'cached a 1')
+
+    def test_vary(self):
+        self.assertEqual(self.get('/vary/', {'HTTP_ACCEPT_LANGUAGE': 'en'}).body, b'en')
+        self.assertEqual(self.get('/vary/', {'HTTP_ACCEPT_LANGUAGE': 'de'}).body, b'de')
+        self.assertEqual(self.get('/vary/', {'HTTP_ACCEPT_LANGUAGE': 'en'}).body, b'en')
+        self.assertEqual(calls, ['vary', 'vary'])
+
+    def test_uncacheable(self):
+        self.get('/uncached/')
+        self.get('/uncached/')
+        self.get('/cookie/')
+        self.get('/cookie/')
+        self.get('/cached/a/', {'HTTP_AUTHORIZATION': 'Basic abc'})
+        self.get('/cached/a/', {'HTTP_AUTHORIZATION': 'Basic abc'})
+        self.assertEqual(calls, ['uncached', 'uncached', 'cookie', 'cookie', 'a', 'a'])
+        self.assertEqual(len(self.cache), 0)
+
+    def test_expiry(self):
+        weppy.cache.time = FakeTime
+        self.get('/cached/a/')
+        FakeTime.now += 30
+        self.assertIn(('Age', '30'), self.get('/cached/a/').headerlist)
+        FakeTime.now += 31
+        self.assertEqual(self.get('/cached/a/').text, 'cached a 2')
+
+    def test_eviction(self):
+        for name in ('a', 'b', 'c', 'a', 'd'):
+            self.get('/cached/%s/' % name)
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual(self.cache.evictions, 1)
+        self.get('/cached/a/')
+        self.get('/cached/b/')
+        self.assertEqual(calls, ['a', 'b', 'c', 'd', 'b'])
+
+        cache = ResponseCache(max_bytes=150)
+        app = WSGIApplication(False, cache=cache)
+        app.add_handler(CachedHandler)
+        for name in ('a', 'b', 'c'):
+            app.handle_request(HTTPRequest.get(path_info='/cached/%s/' % name))
+        self.assertTrue(len(cache) < 3)
+        self.assertTrue(cache.evictions > 0)
+
+    def test_invalidate(self):
+        self.get('/cached/a/')
+        self.get('/vary/')
+        self.cache.invalidate('/cached/')
+        self.assertEqual(len(self.cache), 1)
+        self.get('/cached/a/')
+        self.assertEqual(calls, ['a', 'vary', 'a'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import gzip
+import io
+import unittest
+import zlib
+from weppy.compression import *
+from weppy.http import *
+
+BODY = b'{"abc": "def"}' * 200
+
+def gunzip(data):
+    return gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+
+class CompressorTest(unittest.TestCase):
+    def setUp(self):
+        self.compressor = Compressor()
+
+    def request(self, accept_encoding):
+        return HTTPRequest.get(headers={'HTTP_ACCEPT_ENCODING': accept_encoding})
+
+    def test_gzip(self):
+        res = self.compressor(self.request('gzip, deflate'), HTTPResponse(BODY))
+        headers = dict(res.headerlist)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(headers['Content-Length']), len(res.body))
+        self.assertEqual(gunzip(res.body), BODY)
+
+    def test_deflate(self):
+        res = self.compressor(self.request('gzip;q=0.5, deflate'), HTTPResponse(BODY))
+        self.assertEqual(dict(res.headerlist)['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(res.body), BODY)
+
+    def test_not_accepted(self):
+        for accept_encoding in ('', 'identity', 'gzip;q=0, deflate;q=0', 'br'):
+            res = self.compressor(self.request(accept_encoding), HTTPResponse(BODY))
+            self.assertEqual(res.body, BODY)
+            self.assertNotIn('Content-Encoding', dict(res.headerlist))
+            self.assertEqual(dict(res.headerlist)['Vary'], 'Accept-Encoding')
+
+        res = self.compressor(self.request('*'), HTTPResponse(BODY))
+        self.assertEqual(dict(res.headerlist)['Content-Encoding'], 'gzip')
+
+    def test_skip(self):
+        req = self.request('gzip')
+        res = self.compressor(req, HTTPResponse(b'small'))
+        self.assertEqual(res.body, b'small')
+
+        res = self.compressor(req, HTTPResponse(BODY, content_type='image/png'))
+        self.assertEqual(res.body, BODY)
+
+        res = self.compressor(req, HTTPResponse(BODY, headerlist=[('Content-Encoding', 'br')]))
+        self.assertEqual(res.body, BODY)
+
+    def test_head(self):
+        req = HTTPRequest.head(headers={'HTTP_ACCEPT_ENCODING': 'gzip'})
+        res = HTTPResponse(BODY)
+        res.add_etag()
+        res.discard_body()
+        res = self.compressor(req, res)
+        headers = dict(res.headerlist)
+        self.assertEqual((headers['Content-Encoding'], headers['Vary']),
+                         ('gzip', 'Accept-Encoding'))
+        self.assertTrue(headers['ETag'].startswith('W/'))
+        self.assertNotIn('Content-Length', headers)
+        self.assertEqual(res.body, b'')
+
+        res = HTTPResponse(b'small')
+        res.discard_body()
+        self.assertNotIn('Content-Encoding', dict(self.compressor(req, res).headerlist))
+        res = HTTPResponse(iter(['chunk']))
+        res.discard_body()
+        res = self.compressor(req, res)
+        self.assertEqual(dict(res.headerlist)['Content-Encoding'], 'gzip')
+
+    def test_streaming(self):
+        closed = []
+
+        def body():
+            try:
+                for i in range(100):
+                    yield 'chunk %d\n' % i
+            finally:
+                closed.append(True)
+
+        res = self.compressor(self.request('gzip'), HTTPResponse(body()))
+        self.assertTrue(res.streaming)
+        self.assertNotIn('Content-Length', dict(res.headerlist))
+        chunks = list(res.app_iter)
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(gunzip(b''.join(chunks)),
+                         ''.join('chunk %d\n' % i for i in range(100)).encode('ascii'))
+        self.assertEqual(closed, [True])
+
+    def test_etag(self):
+        res = HTTPResponse(BODY)
+        res.add_etag()
+        etag = res.etag
+        res = self.compressor(self.request('gzip'), res)
+        self.assertEqual(res.etag, 'W/' + etag)
+
+    def test_cache(self):
+        compressor = Compressor(cache_entries=1)
+        first = compressor(self.request('gzip'), HTTPResponse(BODY)).body
+        second = compressor(self.request('gzip'), HTTPResponse(BODY)).body
+        self.assertIs(first, second)
+        compressor(self.request('deflate'), HTTPResponse(BODY))
+        third = compressor(self.request('gzip'), HTTPResponse(BODY)).body
+        self.assertIsNot(first, third)
+        self.assertEqual(first, third)
+
+        compressor = Compressor(cache_entries=100)
+        for body in (b'A' * 2000, b'B' * 2000):
+            res = HTTPResponse(body, headerlist=[('ETag', '"1"')])
+            self.assertEqual(gunzip(compressor(self.request('gzip'), res).body), body)
+
+if __name__ == '__main__':
+    unittest.main()
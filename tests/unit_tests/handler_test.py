@@ -30,6 +30,59 @@ class StrHandler:
     def post(self, req):
         return 'post'
 
+@url('/stream/')
+class StreamHandler:
+    def get(self, req):
+        return (chunk for chunk in ['get', ' ', 'stream'])
+
+@url('/json/')
+class JSONHandler:
+    def get(self, req):
+        return {'items': [1, 2]}
+
+    def post(self, req):
+        return ['a', 'b']
+
+@url('/etag/')
+class ETagHandler:
+    etag = 'strong'
+
+    def get(self, req):
+        return 'etag'
+
+generated = []
+
+@url('/export/')
+class ExportHandler:
+    def get(self, req):
+        for i in range(3):
+            generated.append(i)
+            yield 'row %d\n' % i
+
+@url('/head/')
+class HeadHandler:
+    def get(self, req):
+        return 'get'
+
+    def head(self, req):
+        return HTTPResponse('', headerlist=[('X-Size', '42')])
+
+    def delete(self, req):
+        return 'delete'
+
+versions = []
+
+@url('/validator/_/')
+class ValidatorHandler:
+    etag = 'weak'
+
+    def validator(self, req, name):
+        return '%s-1' % name
+
+    def get(self, req, name):
+        versions.append(name)
+        return 'validator %s' % name
+
 ### Tests ###
 
 class HandlerTest(unittest.TestCase):
@@ -63,6 +116,18 @@ class HandlerTest(unittest.TestCase):
         self.assertEqual(res.content_type, 'text/html')
         self.assertEqual(res.charset, 'UTF-8')
 
+        res = StreamHandler(HTTPRequest.get())
+        self.assertTrue(res.streaming)
+        self.assertEqual(res.text, 'get stream')
+        self.assertEqual(res.status, '200 OK')
+
+    def test_json(self):
+        res = JSONHandler(HTTPRequest.get())
+        self.assertEqual(res.content_type, 'application/json')
+        self.assertEqual(res.body.replace(b' ', b''), b'{"items":[1,2]}')
+        self.assertEqual(JSONHandler(HTTPRequest.post()).body.replace(b' ', b''),
+                         b'["a","b"]')
+
     def test_post(self):
         res = RootHandler(HTTPRequest.post())
         self.assertEqual(res.text, 'post')
@@ -100,10 +165,65 @@ class HandlerTest(unittest.TestCase):
         self.assertEqual(res.status, '200 OK')
         self.assertEqual(res.content_type, 'text/html')
         self.assertEqual(res.charset, 'UTF-8')
+        self.assertIn(('Content-Length', '3'), res.headerlist)
+
+    def test_head_streaming(self):
+        del generated[:]
+        res = ExportHandler(HTTPRequest.head())
+        self.assertEqual(res.body, b'')
+        self.assertEqual(generated, [])
+        self.assertEqual(ExportHandler(HTTPRequest.get()).text, 'row 0\nrow 1\nrow 2\n')
+        self.assertEqual(generated, [0, 1, 2])
+
+    def test_head_method(self):
+        res = HeadHandler(HTTPRequest.head())
+        self.assertEqual(res.body, b'')
+        self.assertIn(('X-Size', '42'), res.headerlist)
+
+    def test_options(self):
+        req = HTTPRequest.get()
+        req.environ['REQUEST_METHOD'] = 'OPTIONS'
+        res = RootHandler(req)
+        self.assertEqual(res.status, '200 OK')
+        self.assertIn(('Allow', 'GET, HEAD, POST, OPTIONS'), res.headerlist)
+        res = HeadHandler(req)
+        self.assertIn(('Allow', 'GET, HEAD, DELETE, OPTIONS'), res.headerlist)
+
+    def test_etag(self):
+        res = ETagHandler(HTTPRequest.get())
+        etag = res.etag
+        self.assertTrue(etag.startswith('"'))
+        self.assertEqual(res.text, 'etag')
+
+        res = ETagHandler(HTTPRequest.get(headers={'HTTP_IF_NONE_MATCH': etag}))
+        self.assertEqual(res.status, '304 Not Modified')
+        self.assertEqual(res.body, b'')
+        self.assertEqual(res.etag, etag)
+
+        res = RootHandler(HTTPRequest.get(headers={'HTTP_IF_NONE_MATCH': etag}))
+        self.assertEqual(res.etag, None)
+
+    def test_validator(self):
+        del versions[:]
+        res = ValidatorHandler(HTTPRequest.get(), 'a')
+        self.assertEqual(res.etag, 'W/"a-1"')
+        self.assertEqual(res.text, 'validator a')
+
+        res = ValidatorHandler(HTTPRequest.get(headers={'HTTP_IF_NONE_MATCH': 'W/"a-1"'}), 'a')
+        self.assertEqual(res.status, '304 Not Modified')
+        self.assertEqual(versions, ['a'])
+
+        res = ValidatorHandler(HTTPRequest.get(headers={'HTTP_IF_NONE_MATCH': 'W/"a-1"'}), 'b')
+        self.assertEqual(res.status, '200 OK')
+        self.assertEqual(versions, ['a', 'b'])
 
     def test_method_not_allowed(self):
         self.assertRaises(HTTPMethodNotAllowed, RootHandler, HTTPRequest.put())
         self.assertRaises(HTTPMethodNotAllowed, RootHandler, HTTPRequest.delete())
+        try:
+            StreamHandler(HTTPRequest.post())
+        except HTTPMethodNotAllowed as error:
+            self.assertEqual(error.headerlist, [('Allow', 'GET, HEAD, OPTIONS')])
 
 class urlTest(unittest.TestCase):
     def test_decorator(self):
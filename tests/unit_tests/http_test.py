@@ -1,4 +1,5 @@
 import cgi
+import json
 import unittest
 from weppy.http import *
 
@@ -142,6 +143,55 @@ class HTTPRequestTest(unittest.TestCase):
         req = HTTPRequest.get(headers={'HTTP_ACCEPT_LANGUAGE': 'en-US,en;q=0.8,de;q=0.6'})
         self.assertEqual(req.accept_language, ['en-US', 'en', 'de'])
 
+    def test_if_none_match(self):
+        req = HTTPRequest.get()
+        self.assertEqual(req.if_none_match, None)
+        self.assertFalse(req.etag_matches('"abc"'))
+
+        req = HTTPRequest.get(headers={'HTTP_IF_NONE_MATCH': '"abc", W/"def"'})
+        self.assertEqual(req.if_none_match, ['"abc"', '"def"'])
+        self.assertTrue(req.etag_matches('"abc"'))
+        self.assertTrue(req.etag_matches('W/"abc"'))
+        self.assertTrue(req.etag_matches('"def"'))
+        self.assertFalse(req.etag_matches('"ghi"'))
+
+        req = HTTPRequest.get(headers={'HTTP_IF_NONE_MATCH': '*'})
+        self.assertTrue(req.etag_matches('"ghi"'))
+
+    def test_iter_body(self):
+        body = HTTPRequest.post(params={'abc': 'def', '123': '456'}).body
+        req = HTTPRequest.post(params={'abc': 'def', '123': '456'})
+        self.assertEqual(b''.join(req.iter_body(chunk_size=3)), body)
+
+        req = HTTPRequest.post(params={'abc': 'def'})
+        self.assertEqual(list(req.iter_body(chunk_size=3)), [b'abc', b'=de', b'f'])
+
+        req = HTTPRequest.post(params={'abc': 'def'})
+        self.assertRaises(HTTPRequestEntityTooLarge, req.iter_body, max_size=6)
+
+        req = HTTPRequest.get()
+        self.assertEqual(list(req.iter_body()), [])
+
+    def test_iter_multipart(self):
+        req = HTTPRequest.post(params={'abc': 'def', 'file': ('filename', b'content')})
+        fields = dict(req.iter_multipart(chunk_size=5))
+        self.assertEqual(fields['abc'], 'def')
+        self.assertEqual(fields['file'].filename, 'filename')
+        self.assertEqual(fields['file'].read(), b'content')
+
+        req = HTTPRequest.post(params={'abc': 'def'})
+        self.assertRaises(HTTPBadRequest, req.iter_multipart)
+
+        req = HTTPRequest.post(params={'file': ('filename', b'content')})
+        self.assertRaises(HTTPRequestEntityTooLarge, req.iter_multipart, max_size=10)
+
+    def test_lazy(self):
+        req = HTTPRequest.post(params={'abc': 'def'})
+        self.assertEqual(req.path, '')
+        self.assertEqual(req._req.environ['wsgi.input'].tell(), 0)
+        self.assertIs(req.POST, req.POST)
+        self.assertFalse(hasattr(req, '__dict__'))
+
 class HTTPResponseTest(unittest.TestCase):
     def test_body(self):
         res = HTTPResponse(body='abc123')
@@ -150,6 +200,40 @@ class HTTPResponseTest(unittest.TestCase):
         res = HTTPResponse(body=b'abc123')
         self.assertEqual(res.body, b'abc123')
 
+        self.assertRaises(TypeError, HTTPResponse, None)
+        self.assertRaises(TypeError, HTTPResponse, 123)
+
+    def test_streaming(self):
+        closed = []
+
+        def body():
+            try:
+                yield 'abc'
+                yield b'123'
+                yield u'\xe9'
+            finally:
+                closed.append(True)
+
+        res = HTTPResponse(body=body())
+        self.assertTrue(res.streaming)
+        self.assertNotIn('Content-Length', dict(res.headerlist))
+        app_iter = res.app_iter
+        self.assertEqual(list(app_iter), [b'abc', b'123', b'\xc3\xa9'])
+        self.assertEqual(closed, [True])
+
+        res = HTTPResponse(body=body())
+        app_iter = iter(res.app_iter)
+        self.assertEqual(next(app_iter), b'abc')
+        res.close()
+        self.assertEqual(closed, [True, True])
+
+        res = HTTPResponse(body=['abc', '123'])
+        self.assertTrue(res.streaming)
+        self.assertEqual(res.body, b'abc123')
+
+        res = HTTPResponse(body='abc123')
+        self.assertFalse(res.streaming)
+
     def test_text(self):
         res = HTTPResponse(body='abc123')
         self.assertEqual(res.text, 'abc123')
@@ -185,6 +269,34 @@ class HTTPResponseTest(unittest.TestCase):
                                           ('Cache-Control', 'max-age=60'),
                                           ('Content-Length', '0')])
 
+    def test_add_etag(self):
+        res = HTTPResponse('abc123')
+        res.add_etag()
+        self.assertEqual(res.etag, '"e99a18c428cb38d5f260853678922e03"')
+
+        res = HTTPResponse('abc123')
+        res.add_etag(weak=True)
+        self.assertEqual(res.etag, 'W/"6-cf02bb5c"')
+
+        res = HTTPResponse('abc123', headerlist=[('ETag', '"v1"')])
+        res.add_etag()
+        self.assertEqual(res.etag, '"v1"')
+
+    def test_conditional(self):
+        req = HTTPRequest.get(headers={'HTTP_IF_NONE_MATCH': 'W/"6-cf02bb5c"'})
+        res = HTTPResponse('abc123').conditional(req, weak=True)
+        self.assertEqual(res.status, '304 Not Modified')
+        self.assertEqual(res.etag, 'W/"6-cf02bb5c"')
+
+        res = HTTPResponse('abc456').conditional(req, weak=True)
+        self.assertEqual(res.status, '200 OK')
+
+        res = HTTPResponse('abc123', status=404).conditional(req, weak=True)
+        self.assertEqual(res.etag, None)
+
+        res = HTTPResponse(iter(['abc123'])).conditional(req, weak=True)
+        self.assertEqual(res.etag, None)
+
     def test_cache_expires(self):
         res = HTTPResponse()
         res.cache_expires(5)
@@ -218,12 +330,55 @@ class HTTPRedirectTest(unittest.TestCase):
         self.assertEqual(res.status, '301 Moved Permanently')
         self.assertIn(('Location', 'http://www.google.com'), res.headerlist)
 
+class HTTPNotModifiedTest(unittest.TestCase):
+    def test(self):
+        res = HTTPNotModified([('ETag', '"abc"')])
+        self.assertEqual(res.status, '304 Not Modified')
+        self.assertEqual(res.body, b'')
+        self.assertIn(('ETag', '"abc"'), res.headerlist)
+        self.assertNotIn('Content-Length', dict(res.headerlist))
+
+class JSONResponseTest(unittest.TestCase):
+    def test(self):
+        value = {'a': [1, 2.5, None], 'b': u'\xe9'}
+        res = JSONResponse(value, headerlist=[('X-A', 'b')])
+        self.assertEqual(json.loads(res.body.decode('utf-8')), value)
+        self.assertEqual(res.content_type, 'application/json')
+        self.assertIn(('X-A', 'b'), res.headerlist)
+        self.assertEqual(res.status, '200 OK')
+
+        res = JSONResponse([1], 201, encoder=lambda value: b'[1 ]')
+        self.assertEqual(res.body, b'[1 ]')
+        self.assertEqual(res.status, '201 Created')
+
+    def test_stream(self):
+        rows = ({'id': i} for i in range(1000))
+        res = JSONResponse.stream(rows, chunk_size=100)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res.content_type, 'application/json')
+        chunks = list(res.app_iter)
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(b''.join(chunks).decode('utf-8')),
+                         [{'id': i} for i in range(1000)])
+        self.assertEqual(JSONResponse.stream(iter([])).body, b'[]')
+
+        res = JSONResponse.stream(iter([1, 'a', [2]]), ndjson=True)
+        self.assertEqual(res.content_type, 'application/x-ndjson')
+        self.assertEqual(res.body, b'1\n"a"\n[2]\n')
+        self.assertEqual(JSONResponse.stream(iter([]), ndjson=True).body, b'')
+
 class HTTPErrorTest(unittest.TestCase):
     def test(self):
         error = HTTPError(404)
         self.assertEqual(error.status, 404)
         self.assertEqual(str(error), 'Error 404')
 
+class HTTPBadRequestTest(unittest.TestCase):
+    def test(self):
+        error = HTTPBadRequest()
+        self.assertEqual(error.status, 400)
+        self.assertEqual(str(error), 'Error 400')
+
 class HTTPNotFoundTest(unittest.TestCase):
     def test(self):
         error = HTTPNotFound()
@@ -236,6 +391,19 @@ class HTTPMethodNotAllowedTest(unittest.TestCase):
         self.assertEqual(error.status, 405)
         self.assertEqual(str(error), 'Error 405')
 
+class HTTPRequestEntityTooLargeTest(unittest.TestCase):
+    def test(self):
+        error = HTTPRequestEntityTooLarge()
+        self.assertEqual(error.status, 413)
+        self.assertEqual(str(error), 'Error 413')
+
+class HTTPTooManyRequestsTest(unittest.TestCase):
+    def test(self):
+        error = HTTPTooManyRequests(3)
+        self.assertEqual(error.status, 429)
+        self.assertEqual(str(error), 'Error 429')
+        self.assertEqual(error.headerlist, [('Retry-After', '3')])
+
 class HTTPInternalServerErrorTest(unittest.TestCase):
     def test(self):
         error = HTTPInternalServerError()
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from weppy.cache import ResponseCache
+from weppy.handler import *
+from weppy.http import *
+from weppy.metrics import *
+from weppy.middleware import Middleware
+from weppy.wsgi import *
+
+### Handlers ###
+
+@url('/arg/_/')
+class ArgHandler:
+    def get(self, req, arg):
+        return HTTPResponse('get %s' % arg)
+
+@url('/cached/')
+class CachedHandler:
+    def get(self, req):
+        res = HTTPResponse('cached')
+        res.cache_expires(60)
+        return res
+
+class ForbiddenMiddleware(Middleware):
+    def before(self, req):
+        if req.path == '/forbidden/':
+            return HTTPResponse('forbidden', status=403)
+
+### Tests ###
+
+def call(app, path):
+    """
+    Call app through the WSGI interface and return its body.
+    """
+    return b''.join(app(HTTPRequest.get(path_info=path).environ, lambda status, headers: None))
+
+class MetricsTest(unittest.TestCase):
+    def test_record(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        metrics.record('/', 'GET', '200', 0.05, 0.5, 2.0)
+        metrics.record('/', 'GET', '404', 0.05, 0.05, 0.05)
+        text = metrics.render()
+        for status in ('200', '404'):
+            line = 'weppy_requests_total{route="/",method="GET",status="%s"} 1\n' % status
+            self.assertTrue(line in text)
+        labels = 'route="/",method="GET",phase="handler"'
+        for line in ['weppy_request_duration_seconds_bucket{%s,le="0.1"} 1' % labels,
+                     'weppy_request_duration_seconds_bucket{%s,le="1"} 2' % labels,
+                     'weppy_request_duration_seconds_bucket{%s,le="+Inf"} 2' % labels,
+                     'weppy_request_duration_seconds_sum{%s} 0.55' % labels,
+                     'weppy_request_duration_seconds_count{%s} 2' % labels]:
+            self.assertTrue(line + '\n' in text, line)
+
+    def test_threads(self):
+        metrics = Metrics()
+        for i in range(3):
+            thread = threading.Thread(target=metrics.record,
+                                      args=('/', 'GET', '200', 0.0, 0.0, 0.0))
+            thread.start()
+            thread.join()
+        metrics.record('/', 'GET', '200', 0.0, 0.0, 0.0)
+        self.assertEqual(len(metrics._tables), 1)
+        self.assertTrue('weppy_requests_total{route="/",method="GET",status="200"} 4\n'
+                        in metrics.render())
+        self.assertEqual(metrics.snapshot()[0], {('/', 'GET', '200'): 4})
+
+    def test_application(self):
+        metrics = Metrics()
+        app = WSGIApplication(False, metrics=metrics)
+        app.add_handler(ArgHandler)
+        app.add_handler(MetricsHandler(metrics))
+        self.assertEqual(call(app, '/arg/a/'), b'get a')
+        call(app, '/arg/b/')
+        call(app, '/none/')
+        text = call(app, '/metrics').decode('ascii')
+        self.assertTrue('weppy_requests_total{route="/arg/_/",method="GET",status="200"} 2\n'
+                        in text)
+        self.assertTrue('weppy_requests_total{route="<unmatched>",method="GET",'
+                        'status="404"} 1\n' in text)
+        self.assertTrue('weppy_request_duration_seconds_count{route="/arg/_/",method="GET",'
+                        'phase="match"} 2\n' in text)
+
+    def test_routes(self):
+        metrics = Metrics()
+        app = WSGIApplication(False, cache=ResponseCache(), metrics=metrics,
+                              middleware=[ForbiddenMiddleware()])
+        app.add_handler(CachedHandler)
+        app.add_handler(MetricsHandler(metrics))
+        call(app, '/forbidden/')
+        call(app, '/cached/')
+        call(app, '/cached/')
+        text = call(app, '/metrics').decode('ascii')
+        for (route, status) in (('<unmatched>', '403'), ('/cached/', '200'),
+                                ('<cached>', '200')):
+            self.assertIn('weppy_requests_total{route="%s",method="GET",status="%s"} 1\n' %
+                          (route, status), text)
+
+    def test_processes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            metrics = Metrics(directory=directory)
+            pid = os.fork()
+            if pid == 0:
+                metrics.record('/', 'GET', '200', 0.0, 0.0, 0.0)
+                os._exit(0)
+            os.waitpid(pid, 0)
+            metrics.record('/', 'GET', '200', 0.0, 0.0, 0.0)
+            self.assertTrue('weppy_requests_total{route="/",method="GET",status="200"} 2\n'
+                            in metrics.render())
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from weppy.handler import *
+from weppy.http import *
+from weppy.middleware import *
+from weppy.wsgi import *
+
+### Handlers ###
+
+@url('/')
+class RootHandler:
+    def get(self, req):
+        return HTTPResponse('root')
+
+@url('/admin/_/')
+class AdminHandler:
+    def get(self, req, name):
+        return HTTPResponse('admin %s' % name)
+
+@url('/admin/error/')
+class AdminErrorHandler:
+    def get(self, req):
+        raise ValueError('admin')
+
+class TraceMiddleware(Middleware):
+    def __init__(self, name, trace):
+        self.name = name
+        self.trace = trace
+
+    def before(self, req):
+        self.trace.append('before %s' % self.name)
+
+    def after(self, req, res):
+        self.trace.append('after %s' % self.name)
+        res.headerlist.append(('X-Trace', self.name))
+        return res
+
+class DenyMiddleware(Middleware):
+    def before(self, req):
+        if 'HTTP_X_TOKEN' not in req.environ:
+            return HTTPResponse('denied', status=403)
+
+class RecoverMiddleware(Middleware):
+    def exception(self, req, error):
+        if isinstance(error, ValueError):
+            return HTTPResponse('recovered %s' % error, status=503)
+
+### Tests ###
+
+class ComposeTest(unittest.TestCase):
+    def test_order(self):
+        trace = []
+
+        def call(req, arg):
+            trace.append('call %s' % arg)
+            return HTTPResponse('')
+
+        chain = compose([TraceMiddleware('a', trace), TraceMiddleware('b', trace)], call)
+        res = chain(HTTPRequest.get(path_info='/'), 'x')
+        self.assertEqual(trace, ['before a', 'before b', 'call x', 'after b', 'after a'])
+        self.assertEqual([value for (name, value) in res.headerlist if name == 'X-Trace'],
+                         ['b', 'a'])
+
+    def test_no_hooks(self):
+        def call(req):
+            return HTTPResponse('')
+
+        self.assertTrue(compose([Middleware()], call) is call)
+
+    def test_exception(self):
+        def call(req):
+            raise KeyError('key')
+
+        chain = compose([RecoverMiddleware()], call)
+        self.assertRaises(KeyError, chain, HTTPRequest.get(path_info='/'))
+
+class ApplicationMiddlewareTest(unittest.TestCase):
+    def setUp(self):
+        self.trace = []
+        self.app = WSGIApplication(False, middleware=[TraceMiddleware('app', self.trace)])
+        self.app.add_handler(RootHandler)
+        self.app.add_handler(AdminHandler)
+        self.app.add_handler(AdminErrorHandler)
+
+    def test_app(self):
+        res = self.app.handle_request(HTTPRequest.get(path_info='/'))
+        self.assertEqual(res.text, 'root')
+        self.assertIn(('X-Trace', 'app'), res.headerlist)
+        res = self.app.handle_request(HTTPRequest.get(path_info='/missing/'))
+        self.assertEqual(res.status, '404 Not Found')
+        self.assertEqual(self.trace, ['before app', 'after app', 'before app'])
+
+    def test_prefix(self):
+        self.app.add_middleware(DenyMiddleware(), '/admin/')
+        res = self.app.handle_request(HTTPRequest.get(path_info='/admin/gold/'))
+        self.assertEqual(res.status, '403 Forbidden')
+        self.assertEqual(self.trace, ['before app', 'after app'])
+        req = HTTPRequest.get(path_info='/admin/gold/', headers={'HTTP_X_TOKEN': 'secret'})
+        self.assertEqual(self.app.handle_request(req).text, 'admin gold')
+        self.assertEqual(self.app.handle_request(HTTPRequest.get(path_info='/')).text, 'root')
+
+    def test_exception(self):
+        res = self.app.handle_request(HTTPRequest.get(path_info='/admin/error/'))
+        self.assertEqual(res.status, '500 Internal Server Error')
+        self.app.add_middleware(RecoverMiddleware(), '/admin/')
+        res = self.app.handle_request(HTTPRequest.get(path_info='/admin/error/'))
+        self.assertEqual(res.status, '503 Service Unavailable')
+        self.assertEqual(res.text, 'recovered admin')
+        self.assertIn(('X-Trace', 'app'), res.headerlist)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from weppy.multipart import *
+
+BODY = (b'preamble\r\n'
+        b'--xyz\r\n'
+        b'Content-Disposition: form-data; name="abc"\r\n'
+        b'\r\n'
+        b'def\r\n'
+        b'--xyz\r\n'
+        b'Content-Disposition: form-data; name="file"; filename="a.txt"\r\n'
+        b'Content-Type: text/plain\r\n'
+        b'\r\n'
+        b'line 1\r\n--xy line 2\r\n'
+        b'--xyz--\r\n')
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+class MultipartParserTest(unittest.TestCase):
+    def test_parse(self):
+        for size in (1, 2, 3, 7, 64, len(BODY)):
+            fields = list(MultipartParser(chunks(BODY, size), b'xyz'))
+            self.assertEqual(len(fields), 2)
+            self.assertEqual(fields[0], ('abc', 'def'))
+            name, upload = fields[1]
+            self.assertEqual(name, 'file')
+            self.assertEqual(upload.filename, 'a.txt')
+            self.assertEqual(upload.content_type, 'text/plain')
+            self.assertEqual(upload.size, 19)
+            self.assertEqual(upload.read(), b'line 1\r\n--xy line 2')
+
+    def test_spool(self):
+        fields = list(MultipartParser(chunks(BODY, 4), b'xyz', memory_threshold=8))
+        upload = fields[1][1]
+        self.assertTrue(upload.file._rolled)
+        self.assertEqual(upload.read(), b'line 1\r\n--xy line 2')
+        upload.close()
+
+    def test_field_too_large(self):
+        parser = MultipartParser(chunks(BODY, 4), b'xyz', memory_threshold=2)
+        self.assertRaises(MultipartError, list, parser)
+
+    def test_truncated(self):
+        parser = MultipartParser(chunks(BODY[:-20], 4), b'xyz')
+        self.assertRaises(MultipartError, list, parser)
+
+    def test_malformed(self):
+        body = b'--xyz\r\nContent-Disposition: attachment\r\n\r\nabc\r\n--xyz--'
+        self.assertRaises(MultipartError, list, MultipartParser([body], b'xyz'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import threading
+import time
+import unittest
+from wsgiref.util import FileWrapper
+from weppy.handler import *
+from weppy.http import *
+from weppy.pool import *
+from weppy.static import FileResponse
+from weppy.test import Client
+from weppy.wsgi import *
+
+### Handlers ###
+
+@url('/')
+class RootHandler:
+    def get(self, req):
+        conn = req.borrow('db')
+        return HTTPResponse('%d %s' % (conn.execute('SELECT 1').fetchone()[0],
+                                       req.borrow('db') is conn))
+
+@url('/stream/')
+class StreamHandler:
+    def get(self, req):
+        conn = req.borrow('db')
+        return HTTPResponse(str(row[0]) for row in conn.execute('SELECT 1 UNION SELECT 2'))
+
+@url('/file/')
+class FileHandler:
+    def get(self, req):
+        req.borrow('db')
+        return FileResponse(__file__)
+
+### Tests ###
+
+class Resource(object):
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+class PoolTest(unittest.TestCase):
+    def test_acquire(self):
+        pool = Pool(Resource, size=2, timeout=0.05)
+        a = pool.acquire()
+        b = pool.acquire()
+        self.assertRaises(PoolTimeout, pool.acquire)
+        pool.release(a)
+        self.assertIs(pool.acquire(), a)
+        pool.release(b, discard=True)
+        self.assertTrue(b.closed)
+        c = pool.acquire()
+        self.assertFalse(c is b)
+        self.assertEqual((pool.count, pool.idle), (2, 0))
+
+    def test_wait(self):
+        pool = Pool(Resource, size=1)
+        resource = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, [resource])
+        timer.start()
+        self.assertIs(pool.acquire(timeout=1), resource)
+        timer.join()
+
+    def test_check(self):
+        pool = Pool(Resource, check=lambda resource: resource.healthy, check_interval=0)
+        a = pool.acquire()
+        pool.release(a)
+        a.healthy = False
+        b = pool.acquire()
+        self.assertFalse(b is a)
+        self.assertTrue(a.closed)
+        self.assertEqual(pool.count, 1)
+
+    def test_reset_and_max_idle(self):
+        def reset(resource):
+            if not resource.healthy:
+                raise ValueError()
+
+        pool = Pool(Resource, reset=reset, max_idle=0.01)
+        a = pool.acquire()
+        a.healthy = False
+        pool.release(a)
+        self.assertTrue(a.closed)
+        b = pool.acquire()
+        pool.release(b)
+        time.sleep(0.02)
+        self.assertFalse(pool.acquire() is b)
+        self.assertTrue(b.closed)
+
+    def test_connection(self):
+        pool = Pool(Resource)
+        with pool.connection() as resource:
+            pass
+        self.assertEqual(pool.idle, 1)
+        try:
+            with pool.connection() as resource:
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertTrue(resource.closed)
+        self.assertEqual((pool.count, pool.idle), (0, 0))
+
+    def test_close(self):
+        pool = Pool(Resource)
+        a = pool.acquire()
+        b = pool.acquire()
+        pool.release(a)
+        pool.close()
+        self.assertTrue(a.closed)
+        pool.release(b)
+        self.assertTrue(b.closed)
+        self.assertRaises(RuntimeError, pool.acquire)
+
+    def test_fork(self):
+        pool = Pool(Resource, size=1, timeout=0)
+        resource = pool.acquire()
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write, b'1' if pool.acquire() is not resource else b'0')
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(read, 1), b'1')
+        self.assertFalse(resource.closed)
+        os.close(read)
+        os.close(write)
+
+class ApplicationPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = Pool(lambda: sqlite3.connect(':memory:', check_same_thread=False),
+                         size=1, timeout=0)
+        self.app = WSGIApplication(False)
+        self.app.add_pool('db', self.pool)
+        self.app.add_handler(RootHandler)
+        self.app.add_handler(StreamHandler)
+        self.app.add_handler(FileHandler)
+
+    def test_borrow(self):
+        self.assertEqual(Client(self.app).get('/').text, '1 True')
+        self.assertEqual(Client(self.app).get('/').text, '1 True')
+        self.assertEqual((self.pool.count, self.pool.idle), (1, 1))
+
+    def test_call(self):
+        def start_response(status, headers, exc_info=None):
+            pass
+
+        environ = HTTPRequest.get(path_info='/stream/')._req.environ
+        result = self.app(environ, start_response)
+        self.assertEqual(self.pool.idle, 0)
+        res = self.app.handle_request(HTTPRequest.get(path_info='/'))
+        self.assertEqual(res.status, '503 Service Unavailable')
+        self.assertIn(('Retry-After', '1'), res.headerlist)
+        self.assertEqual(b''.join(result), b'12')
+        result.close()
+        self.assertEqual(self.pool.idle, 1)
+
+    def test_file_wrapper(self):
+        def start_response(status, headers, exc_info=None):
+            pass
+
+        environ = HTTPRequest.get(path_info='/file/')._req.environ
+        environ['wsgi.file_wrapper'] = FileWrapper
+        result = self.app(environ, start_response)
+        self.assertTrue(isinstance(result, FileWrapper))
+        self.assertEqual(self.pool.idle, 0)
+        result.close()
+        self.assertTrue(result.filelike.closed)
+        self.assertEqual(self.pool.idle, 1)
+
+    def test_shutdown(self):
+        self.app.startup()
+        Client(self.app).get('/')
+        self.app.shutdown()
+        self.assertRaises(RuntimeError, self.pool.acquire)
+
+if __name__ == '__main__':
+    unittest.main()
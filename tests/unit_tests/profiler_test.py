@@ -0,0 +1,83 @@
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+from weppy.handler import *
+from weppy.http import *
+from weppy.profiler import *
+from weppy.test import Client
+from weppy.wsgi import *
+
+### Handlers ###
+
+def fibonacci(n):
+    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+def compute():
+    return sum(fibonacci(15) for i in range(3))
+
+@url('/compute/')
+class ComputeHandler:
+    def get(self, req):
+        return HTTPResponse('%d' % compute())
+
+    def post(self, req):
+        return HTTPResponse('%d' % compute())
+
+### Tests ###
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def client(self, profiler):
+        app = WSGIApplication(False, profiler=profiler)
+        app.add_handler(ComputeHandler)
+        app.add_handler(ProfilerHandler(profiler))
+        return Client(app)
+
+    def test_sample(self):
+        profiler = Profiler(rate=1.0, patterns=['/compute/'], directory=self.directory)
+        client = self.client(profiler)
+        self.assertEqual(client.get('/compute/').body, b'1830')
+        self.assertEqual(profiler.patterns(), ['/compute/'])
+        stacks = client.get('/profile').text
+        self.assertTrue(';get (profiler_test.py:' in stacks)
+        self.assertTrue(';compute (profiler_test.py:' in stacks)
+        paths = client.post('/profile').text.split()
+        self.assertEqual([os.path.splitext(path)[1] for path in paths], ['.pstats', '.folded'])
+        stats = pstats.Stats(paths[0])
+        self.assertTrue(any(func[2] == 'fibonacci' for func in stats.stats))
+
+    def test_filters(self):
+        profiler = Profiler(rate=0.0)
+        client = self.client(profiler)
+        client.get('/compute/')
+        self.assertEqual(profiler.patterns(), [])
+        profiler = Profiler(rate=1.0, patterns=['/other/'])
+        self.client(profiler).get('/compute/')
+        self.assertEqual(profiler.patterns(), [])
+        profiler = Profiler(rate=1.0, methods=['post'])
+        client = self.client(profiler)
+        client.get('/compute/')
+        self.assertEqual(profiler.patterns(), [])
+        client.post('/compute/')
+        self.assertEqual(profiler.patterns(), ['/compute/'])
+        profiler.reset()
+        self.assertEqual(profiler.patterns(), [])
+
+    def test_collapse(self):
+        profiler = Profiler(rate=1.0)
+        profiler(ComputeHandler, HTTPRequest.get(path_info='/compute/'), [])
+        lines = profiler.collapse().splitlines()
+        total = sum(int(line.rsplit(' ', 1)[1]) for line in lines)
+        stats = list(profiler._stats.values())[0]
+        self.assertTrue(total <= stats.total_tt * 1e6 + len(lines))
+        self.assertTrue(all(line.startswith('/compute/;') for line in lines))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+from weppy.handler import *
+from weppy.http import *
+from weppy.ratelimit import *
+from weppy.wsgi import *
+
+### Handlers ###
+
+calls = []
+
+@url('/')
+class RootHandler:
+    def get(self, req):
+        calls.append(req.path)
+        return HTTPResponse('root')
+
+@url('/item/_/')
+class ItemHandler:
+    def get(self, req, item):
+        calls.append(req.path)
+        return HTTPResponse('item %s' % item)
+
+### Tests ###
+
+def request(path='/', address='10.0.0.1', headers=None):
+    environ = {'REMOTE_ADDR': address}
+    environ.update(headers or {})
+    return HTTPRequest.get(path_info=path, headers=environ)
+
+class RateLimiterTest(unittest.TestCase):
+    def test_acquire(self):
+        limiter = RateLimiter(2, burst=3)
+        self.assertEqual([limiter.acquire('a', 100.0) for i in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.acquire('a', 100.0), 0.5)
+        self.assertEqual(limiter.acquire('b', 100.0), 0)
+        self.assertEqual(limiter.acquire('a', 100.5), 0)
+        self.assertAlmostEqual(limiter.acquire('a', 100.5), 0.5)
+        self.assertEqual([limiter.acquire('a', 110.0) for i in range(3)], [0, 0, 0])
+
+    def test_eviction(self):
+        limiter = RateLimiter(0.001, burst=1, slots=4, probes=4)
+        for (i, key) in enumerate('abcd'):
+            limiter.acquire(key, 100.0 + i)
+        self.assertEqual(limiter.acquire('e', 104.0), 0)
+        self.assertTrue(limiter.acquire('d', 104.0) > 0)
+        self.assertEqual(limiter.acquire('a', 104.0), 0)
+
+    def test_keys(self):
+        limiter = RateLimiter(1, key='header:X-Api-Key')
+        limiter(request(headers={'HTTP_X_API_KEY': 'a'}))
+        limiter(request(headers={'HTTP_X_API_KEY': 'b'}))
+        self.assertRaises(HTTPTooManyRequests, limiter,
+                          request(address='10.0.0.2', headers={'HTTP_X_API_KEY': 'a'}))
+
+        limiter = RateLimiter(1, key=lambda req: None)
+        limiter(request())
+        limiter(request())
+
+        self.assertRaises(ValueError, RateLimiter, 1, key='cookie')
+
+    def test_shared(self):
+        directory = tempfile.mkdtemp()
+        try:
+            limiter = RateLimiter(1, burst=2)
+            other = RateLimiter(1, burst=2, path=os.path.join(directory, 'table'))
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    limiter.acquire('a', 100.0)
+                    RateLimiter(1, burst=2, path=os.path.join(directory, 'table')).acquire(
+                        'a', 100.0)
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+            self.assertEqual(limiter.acquire('a', 100.0), 0)
+            self.assertTrue(limiter.acquire('a', 100.0) > 0)
+            self.assertEqual(other.acquire('a', 100.0), 0)
+            self.assertTrue(other.acquire('a', 100.0) > 0)
+        finally:
+            shutil.rmtree(directory)
+
+class ApplicationRateLimitTest(unittest.TestCase):
+    def test_address(self):
+        del calls[:]
+        app = WSGIApplication(False, rate_limiter=RateLimiter(0.001, burst=1))
+        app.add_handler(RootHandler)
+        self.assertEqual(app.handle_request(request()).text, 'root')
+        res = app.handle_request(request())
+        self.assertEqual(res.status, '429 Too Many Requests')
+        self.assertIn(('Retry-After', '1000'), res.headerlist)
+        self.assertEqual(app.handle_request(request(address='10.0.0.2')).text, 'root')
+        self.assertEqual(calls, ['/', '/'])
+
+    def test_route(self):
+        app = WSGIApplication(False, rate_limiter=RateLimiter(0.001, key='route'))
+        app.add_handler(RootHandler)
+        app.add_handler(ItemHandler)
+        self.assertEqual(app.handle_request(request('/item/a/')).status, '200 OK')
+        self.assertEqual(app.handle_request(request('/item/b/', '10.0.0.2')).status,
+                         '429 Too Many Requests')
+        self.assertEqual(app.handle_request(request('/')).status, '200 OK')
+        self.assertEqual(app.handle_request(request('/none/')).status, '404 Not Found')
+        self.assertEqual(app.handle_request(request('/none/')).status, '404 Not Found')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import unittest
+from weppy.router import *
+
+class RouterTest(unittest.TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.router.add('/', 'root')
+        self.router.add('/one/_/', 'one')
+        self.router.add('/two/_/_/', 'two')
+        self.router.add('/one/gold/', 'gold')
+        self.router.add('/file/_.json', 'json')
+        self.router.add('/a/b/c/', 'static')
+        self.router.add('/a/_/d/', 'wildcard')
+        self.router.add('/static/*', 'catchall')
+        self.router.add('/static/robots.txt', 'robots')
+
+    def test_match(self):
+        self.assertEqual(self.router.resolve('/'), ('root', [], False))
+        self.assertEqual(self.router.resolve('/one/silver/'), ('one', ['silver'], False))
+        self.assertEqual(self.router.resolve('/two/a/b/'), ('two', ['a', 'b'], False))
+        self.assertEqual(self.router.resolve('/file/data.json'), ('json', ['data'], False))
+
+    def test_static_precedence(self):
+        self.assertEqual(self.router.resolve('/one/gold/'), ('gold', [], False))
+        self.assertEqual(self.router.resolve('/a/b/c/'), ('static', [], False))
+
+    def test_backtracking(self):
+        self.assertEqual(self.router.resolve('/a/b/d/'), ('wildcard', ['b'], False))
+
+    def test_catchall(self):
+        self.assertEqual(self.router.resolve('/static/a.css'), ('catchall', ['a.css'], False))
+        self.assertEqual(self.router.resolve('/static/css/a.css'),
+                         ('catchall', ['css/a.css'], False))
+        self.assertEqual(self.router.resolve('/static/robots.txt'), ('robots', [], False))
+        self.assertEqual(self.router.resolve('/static/'), (None, [], False))
+        self.assertRaises(ValueError, self.router.add, '/*/a', 'invalid')
+
+    def test_redirect(self):
+        self.assertEqual(self.router.resolve(''), (None, [], True))
+        self.assertEqual(self.router.resolve('/one/silver'), (None, [], True))
+        self.assertEqual(self.router.resolve('/a/b/d'), (None, [], True))
+
+    def test_not_found(self):
+        self.assertEqual(self.router.resolve('/gold/'), (None, [], False))
+        self.assertEqual(self.router.resolve('/one//'), (None, [], False))
+        self.assertEqual(self.router.resolve('/one/silver/gold/'), (None, [], False))
+        self.assertEqual(self.router.resolve('/file/.json'), (None, [], False))
+
+    def test_replace(self):
+        self.router.add('/one/_/', 'other')
+        self.assertEqual(self.router.resolve('/one/silver/'), ('other', ['silver'], False))
+
+    def test_dump(self):
+        data = json.loads(json.dumps(self.router.dump(lambda handler: handler.upper())))
+        router = Router.load(data, lambda key: key.lower())
+        for path in ('/', '/one/silver/', '/one/gold/', '/file/data.json', '/a/b/d/',
+                     '/static/css/main.css', '/static/robots.txt', '/one/silver', '/gold/'):
+            self.assertEqual(router.resolve(path), self.router.resolve(path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import unittest
+from weppy.handler import *
+from weppy.http import *
+from weppy.middleware import Middleware
+from weppy.server import *
+from weppy.static import *
+from weppy.wsgi import *
+
+### Handlers ###
+
+@url('/pid/')
+class PidHandler:
+    def get(self, req):
+        return '%d %s' % (os.getpid(), req.environ['wsgi.multiprocess'])
+
+@url('/wait/')
+class WaitHandler:
+    started = threading.Semaphore(0)
+    release = threading.Event()
+
+    def get(self, req):
+        self.started.release()
+        self.release.wait(5)
+        return str(req.environ['wsgi.multithread'])
+
+class AfterResponseMiddleware(Middleware):
+    def __init__(self):
+        self.done = []
+
+    def before(self, req):
+        req.after_response(self.done.append, req.path)
+
+### Tests ###
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'data.bin'), 'wb') as f:
+            f.write(b'0123456789' * 10000)
+        self.middleware = AfterResponseMiddleware()
+        app = WSGIApplication(False, middleware=[self.middleware])
+        app.add_handler(StaticFileHandler('/static/', self.directory))
+        self.server = make_server('127.0.0.1', 0, app)
+        self.server.RequestHandlerClass.log_message = lambda *args: None
+
+    def tearDown(self):
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_file(self):
+        sent = []
+        sendfile = ServerHandler.sendfile
+
+        def record(handler):
+            sent.append(sendfile(handler))
+            return sent[-1]
+
+        ServerHandler.sendfile = record
+        try:
+            thread = threading.Thread(target=self.server.handle_request)
+            thread.start()
+            res = urlopen('http://127.0.0.1:%d/static/data.bin' % self.server.server_port)
+            self.assertEqual(res.read(), b'0123456789' * 10000)
+            thread.join()
+        finally:
+            ServerHandler.sendfile = sendfile
+        self.assertEqual(sent, [hasattr(os, 'sendfile')])
+        self.assertEqual(self.middleware.done, ['/static/data.bin'])
+
+class ThreadPoolServerTest(unittest.TestCase):
+    def test(self):
+        app = WSGIApplication(False)
+        app.add_handler(WaitHandler)
+        server = make_server('127.0.0.1', 0, app, threads=2, max_queue=1)
+        server.RequestHandlerClass.log_message = lambda *args: None
+        url = 'http://127.0.0.1:%d/wait/' % server.server_port
+        results = []
+        clients = [threading.Thread(target=lambda: results.append(urlopen(url).read()))
+                   for i in range(3)]
+        for client in clients:
+            client.start()
+        for i in range(3):
+            server.handle_request()
+        WaitHandler.started.acquire()
+        WaitHandler.started.acquire()
+        self.assertEqual(server.in_flight, 2)
+        self.assertEqual(server.queued, 1)
+        WaitHandler.release.set()
+        for client in clients:
+            client.join()
+        server.server_close()
+        self.assertEqual(results, [b'True'] * 3)
+        self.assertEqual(server.in_flight, 0)
+
+class ParseBindTest(unittest.TestCase):
+    def test(self):
+        self.assertEqual(parse_bind('127.0.0.1:8000'), ('127.0.0.1', 8000))
+        self.assertEqual(parse_bind(':8000'), ('0.0.0.0', 8000))
+        self.assertEqual(parse_bind('8000'), ('0.0.0.0', 8000))
+        self.assertEqual(parse_bind('[::1]:8000'), ('::1', 8000))
+
+class PreforkServerTest(unittest.TestCase):
+    def test(self):
+        app = WSGIApplication(False)
+        app.add_handler(PidHandler)
+        server = PreforkServer(app, '127.0.0.1', 0, 2, graceful_timeout=5)
+        url = 'http://127.0.0.1:%d/pid/' % server.server_address[1]
+        pid = os.fork()
+        if pid == 0:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), 2)
+            server.serve_forever(poll_interval=0.05)
+            os._exit(0)
+        try:
+            pids = set()
+            for i in range(20):
+                worker, multiprocess = urlopen(url).read().decode('ascii').split()
+                self.assertNotEqual(int(worker), pid)
+                self.assertEqual(multiprocess, 'True')
+                pids.add(int(worker))
+            os.kill(int(worker), signal.SIGKILL)
+            for i in range(20):
+                pids.add(int(urlopen(url).read().decode('ascii').split()[0]))
+            self.assertTrue(len(pids) >= 2)
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            self.assertEqual(os.waitpid(pid, 0)[1], 0)
+            server._server.server_close()
+
+    def test_spawn(self):
+        read, write = os.pipe()
+
+        class Server(PreforkServer):
+            def run_worker(self):
+                os.write(write, ('%s %d' % (signal.getsignal(signal.SIGTERM) is signal.SIG_DFL,
+                                            len(self._pids))).encode('ascii'))
+
+        server = Server(WSGIApplication(False), '127.0.0.1', 0, 1)
+        handler = signal.signal(signal.SIGTERM, server._stop)
+        try:
+            server._pids[0] = 0
+            server._spawn()
+        finally:
+            signal.signal(signal.SIGTERM, handler)
+            server._server.server_close()
+        os.waitpid(max(server._pids), 0)
+        self.assertEqual(os.read(read, 100), b'True 0')
+        os.close(read)
+        os.close(write)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from weppy.handler import *
+from weppy.http import *
+from weppy.sessions import *
+from weppy.test import Client
+from weppy.wsgi import *
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+### Handlers ###
+
+@url('/count/')
+class CountHandler:
+    def get(self, req):
+        return HTTPResponse('%d' % req.session.get('count', 0))
+
+    def post(self, req):
+        req.session['count'] = req.session.get('count', 0) + 1
+        return HTTPResponse('%d' % req.session['count'])
+
+@url('/logout/')
+class LogoutHandler:
+    def post(self, req):
+        req.session.invalidate()
+        return HTTPResponse('')
+
+@url('/static/')
+class StaticHandler:
+    def get(self, req):
+        return HTTPResponse('static')
+
+class CountingStore(MemoryStore):
+    def __init__(self):
+        super(CountingStore, self).__init__()
+        self.loads = 0
+        self.saves = 0
+
+    def load(self, session_id, now):
+        self.loads += 1
+        return super(CountingStore, self).load(session_id, now)
+
+    def save(self, session_id, data, expires):
+        self.saves += 1
+        super(CountingStore, self).save(session_id, data, expires)
+
+class FailingStore(MemoryStore):
+    def __init__(self):
+        super(FailingStore, self).__init__()
+        self.sweeps = 0
+
+    def sweep(self, now):
+        self.sweeps += 1
+        if self.sweeps > 1:
+            raise SystemExit()
+        raise ValueError('failure')
+
+### Tests ###
+
+class SessionMiddlewareTest(unittest.TestCase):
+    def client(self, store, **kwargs):
+        sessions = SessionMiddleware(store, 'secret', sweep_interval=None, **kwargs)
+        app = WSGIApplication(False, middleware=[sessions])
+        app.add_handler(CountHandler)
+        app.add_handler(LogoutHandler)
+        app.add_handler(StaticHandler)
+        return Client(app)
+
+    def test_session(self):
+        store = CountingStore()
+        client = self.client(store)
+        self.assertEqual(client.get('/count/').text, '0')
+        self.assertEqual(store.saves, 0)
+        self.assertEqual(client._cookies, {})
+        res = client.post('/count/')
+        self.assertTrue(any(name == 'Set-Cookie' for (name, value) in res.headerlist))
+        res = client.post('/count/')
+        self.assertEqual(res.text, '2')
+        self.assertIn('Max-Age=1209600', dict(res.headerlist)['Set-Cookie'])
+        res = client.get('/count/')
+        self.assertEqual(res.text, '2')
+        self.assertFalse(any(name == 'Set-Cookie' for (name, value) in res.headerlist))
+        self.assertEqual((store.loads, store.saves), (2, 2))
+        client.get('/static/')
+        self.assertEqual(store.loads, 2)
+
+    def test_invalidate(self):
+        client = self.client(MemoryStore())
+        client.post('/count/')
+        client.post('/logout/')
+        self.assertEqual(client._cookies, {})
+        self.assertEqual(client.get('/count/').text, '0')
+
+    def test_signature(self):
+        store = MemoryStore()
+        client = self.client(store)
+        client.post('/count/')
+        session_id = client._cookies['session'].split('.')[0]
+        client._cookies['session'] = session_id + '.' + '0' * 64
+        self.assertEqual(client.get('/count/').text, '0')
+        client._cookies['session'] = session_id
+        self.assertEqual(client.get('/count/').text, '0')
+
+    def test_sweep(self):
+        store = FailingStore()
+        sessions = SessionMiddleware(store, 'secret', sweep_interval=0)
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertRaises(SystemExit, sessions._sweep_forever)
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertIn('Session sweep failed', output)
+        self.assertIn('ValueError: failure', output)
+
+    def test_without_middleware(self):
+        app = WSGIApplication(False)
+        app.add_handler(CountHandler)
+        self.assertEqual(Client(app).get('/count/').status, '500 Internal Server Error')
+
+class SessionTest(unittest.TestCase):
+    def test_dirty(self):
+        session = Session('a', {'x': [1]})
+        session['x'].append(2)
+        self.assertFalse(session.dirty)
+        session.setdefault('x', [])
+        self.assertFalse(session.dirty)
+        session.update(y=1)
+        self.assertTrue(session.dirty)
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, store):
+        now = time.time()
+        store.save('a' * 32, {'x': 1}, now + 60)
+        store.save('b' * 32, {'y': 2}, now - 1)
+        self.assertEqual(store.sweep(now), 1)
+        self.assertEqual(store.load('a' * 32, now), {'x': 1})
+        self.assertEqual(store.load('b' * 32, now), None)
+        self.assertEqual(store.load('c' * 32, now), None)
+        store.save('a' * 32, {'x': 2}, now + 60)
+        self.assertEqual(store.load('a' * 32, now), {'x': 2})
+        store.delete('a' * 32)
+        self.assertEqual(store.load('a' * 32, now), None)
+
+    def test_memory(self):
+        self.check(MemoryStore())
+        store = MemoryStore(max_entries=2)
+        now = time.time()
+        for session_id in ('a', 'b', 'c'):
+            store.save(session_id * 32, {}, now + 60)
+        self.assertEqual(store.load('a' * 32, now), None)
+        self.assertEqual(store.load('c' * 32, now), {})
+
+    def test_file(self):
+        self.check(FileStore(os.path.join(self.directory, 'sessions')))
+
+    def test_sqlite(self):
+        self.check(SQLiteStore(os.path.join(self.directory, 'sessions.db')))
+
+    def test_sqlite_fork(self):
+        store = SQLiteStore(os.path.join(self.directory, 'sessions.db'))
+        store.save('a' * 32, {'x': 1}, time.time() + 60)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                store.save('b' * 32, store.load('a' * 32, time.time()), time.time() + 60)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(store.load('b' * 32, time.time()), {'x': 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import shutil
+import tempfile
+import unittest
+from email.utils import formatdate
+from weppy.static import *
+from weppy.http import *
+from weppy.wsgi import *
+
+class StaticFileHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, 'css'))
+        with open(os.path.join(self.directory, 'css', 'site.css'), 'wb') as f:
+            f.write(b'0123456789')
+        with open(os.path.join(self.directory, 'css', 'site.css.gz'), 'wb') as f:
+            f.write(b'compressed')
+        self.app = WSGIApplication(False)
+        self.app.add_handler(StaticFileHandler('/static/', self.directory, max_age=60))
+        self.gzip_app = WSGIApplication(False)
+        self.gzip_app.add_handler(StaticFileHandler('/static/', self.directory,
+                                                    precompressed=True))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get(self, path, headers=None, app=None):
+        req = HTTPRequest.get(path_info=path, headers=headers)
+        return (app or self.app).handle_request(req)
+
+    def test_get(self):
+        res = self.get('/static/css/site.css')
+        self.assertEqual(res.status, '200 OK')
+        self.assertEqual(res.body, b'0123456789')
+        headers = dict(res.headerlist)
+        self.assertEqual(headers['Content-Type'], 'text/css')
+        self.assertEqual(headers['Content-Length'], '10')
+        self.assertEqual(headers['Cache-Control'], 'max-age=60')
+        self.assertIn('ETag', headers)
+        self.assertIn('Last-Modified', headers)
+
+    def test_not_found(self):
+        self.assertEqual(self.get('/static/css/missing.css').status, '404 Not Found')
+        self.assertEqual(self.get('/static/css').status, '404 Not Found')
+        self.assertEqual(self.get('/static/../static_test.py').status, '404 Not Found')
+        self.assertEqual(self.get('/static/css/%2e%2e/%2e%2e/x').status, '404 Not Found')
+
+    def test_not_modified(self):
+        etag = dict(self.get('/static/css/site.css').headerlist)['ETag']
+        res = self.get('/static/css/site.css', {'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(res.status, '304 Not Modified')
+        self.assertEqual(res.body, b'')
+        self.assertNotIn('Content-Length', dict(res.headerlist))
+
+        res = self.get('/static/css/site.css', {'HTTP_IF_NONE_MATCH': '"other"'})
+        self.assertEqual(res.status, '200 OK')
+
+        since = formatdate(os.path.getmtime(os.path.join(self.directory, 'css', 'site.css')),
+                           usegmt=True)
+        res = self.get('/static/css/site.css', {'HTTP_IF_MODIFIED_SINCE': since})
+        self.assertEqual(res.status, '304 Not Modified')
+
+    def test_range(self):
+        res = self.get('/static/css/site.css', {'HTTP_RANGE': 'bytes=2-4'})
+        self.assertEqual(res.status, '206 Partial Content')
+        self.assertEqual(res.body, b'234')
+        self.assertEqual(dict(res.headerlist)['Content-Range'], 'bytes 2-4/10')
+
+        res = self.get('/static/css/site.css', {'HTTP_RANGE': 'bytes=-3'})
+        self.assertEqual(res.body, b'789')
+
+        res = self.get('/static/css/site.css', {'HTTP_RANGE': 'bytes=20-'})
+        self.assertEqual(res.status, '416 Requested Range Not Satisfiable')
+        self.assertEqual(dict(res.headerlist)['Content-Range'], 'bytes */10')
+
+        res = self.get('/static/css/site.css', {'HTTP_RANGE': 'bytes=0-1,8-'})
+        self.assertEqual(res.status, '206 Partial Content')
+        headers = dict(res.headerlist)
+        self.assertTrue(headers['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = res.body
+        self.assertEqual(len(body), int(headers['Content-Length']))
+        self.assertIn(b'Content-Range: bytes 0-1/10\r\n\r\n01\r\n', body)
+        self.assertIn(b'Content-Range: bytes 8-9/10\r\n\r\n89\r\n', body)
+
+        res = self.get('/static/css/site.css', {'HTTP_RANGE': 'bytes=2-4',
+                                                'HTTP_IF_RANGE': '"other"'})
+        self.assertEqual(res.status, '200 OK')
+
+        res = self.get('/static/css/site.css', {'HTTP_RANGE': 'bytes=5-7,0-2,1-3,4-4'})
+        self.assertEqual((res.status, res.body), ('206 Partial Content', b'01234567'))
+        self.assertEqual(dict(res.headerlist)['Content-Range'], 'bytes 0-7/10')
+        ranges = 'bytes=' + ','.join(['0-'] * MAX_RANGES)
+        res = self.get('/static/css/site.css', {'HTTP_RANGE': ranges})
+        self.assertEqual((res.status, res.body), ('206 Partial Content', b'0123456789'))
+        res = self.get('/static/css/site.css', {'HTTP_RANGE': ranges + ',0-'})
+        self.assertEqual(res.status, '200 OK')
+        self.assertEqual(res.body, b'0123456789')
+
+    def test_precompressed(self):
+        res = self.get('/static/css/site.css', {'HTTP_ACCEPT_ENCODING': 'gzip'}, self.gzip_app)
+        self.assertEqual(res.body, b'compressed')
+        headers = dict(res.headerlist)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Content-Type'], 'text/css')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+
+        res = self.get('/static/css/site.css', None, self.gzip_app)
+        self.assertEqual(res.body, b'0123456789')
+
+    def test_file_wrapper(self):
+        responses = []
+
+        def start_response(status, headerlist):
+            responses.append(status)
+
+        class FileWrapper(object):
+            def __init__(self, f, block_size):
+                self.f = f
+
+            def __iter__(self):
+                return iter([self.f.read()])
+
+        environ = HTTPRequest.get(path_info='/static/css/site.css')._req.environ
+        environ['wsgi.file_wrapper'] = FileWrapper
+        result = self.app(environ, start_response)
+        self.assertTrue(isinstance(result, FileWrapper))
+        self.assertEqual(list(result), [b'0123456789'])
+        result.f.close()
+
+    def test_stat_cache(self):
+        self.get('/static/css/site.css')
+        with open(os.path.join(self.directory, 'css', 'site.css'), 'ab') as f:
+            f.write(b'0123456789')
+        res = self.get('/static/css/site.css')
+        self.assertEqual((res.body, dict(res.headerlist)['Content-Length']),
+                         (b'0123456789', '10'))
+        self.assertTrue(res._whole)
+
+        handler = StaticFileHandler('/static/', self.directory, max_stats=2)
+        for name in ('a', 'b', 'c'):
+            handler._stat(os.path.join(self.directory, name))
+        self.assertEqual(list(handler._stats),
+                         [os.path.join(self.directory, name) for name in ('b', 'c')])
+
+if __name__ == '__main__':
+    unittest.main()
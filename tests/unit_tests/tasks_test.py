@@ -0,0 +1,135 @@
+import os
+import sys
+import threading
+import unittest
+from weppy.handler import *
+from weppy.http import *
+from weppy.tasks import *
+from weppy.test import Client
+from weppy.wsgi import *
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+### Handlers ###
+
+done = []
+
+@url('/')
+class RootHandler:
+    def get(self, req):
+        req.after_response(done.append, req.path)
+        req.after_response(done.append, 'second')
+        return HTTPResponse('root')
+
+### Tests ###
+
+class TaskQueueTest(unittest.TestCase):
+    def test_submit(self):
+        tasks = TaskQueue(threads=2)
+        results = []
+        for i in range(10):
+            self.assertTrue(tasks.submit(results.append, i))
+        self.assertTrue(tasks.drain(1))
+        self.assertEqual(sorted(results), list(range(10)))
+        self.assertEqual(tasks.pending, 0)
+        tasks.submit(results.append, 10)
+        tasks.drain()
+        self.assertEqual(len(results), 11)
+
+    def test_drop(self):
+        started = threading.Event()
+        event = threading.Event()
+
+        def block():
+            started.set()
+            event.wait()
+
+        tasks = TaskQueue(threads=1, max_queue=1)
+        self.assertTrue(tasks.submit(block))
+        started.wait()
+        self.assertTrue(tasks.submit(event.wait))
+        self.assertFalse(tasks.submit(event.wait))
+        self.assertEqual((tasks.pending, tasks.dropped), (2, 1))
+        event.set()
+        tasks.drain()
+
+    def test_block(self):
+        event = threading.Event()
+        tasks = TaskQueue(threads=1, max_queue=1, policy='block', block_timeout=0.01)
+        tasks.submit(event.wait)
+        tasks.submit(event.wait)
+        self.assertFalse(tasks.submit(event.wait))
+        threading.Timer(0.02, event.set).start()
+        tasks = TaskQueue(threads=1, max_queue=1, policy='block')
+        tasks.submit(event.wait)
+        tasks.submit(event.wait)
+        self.assertTrue(tasks.submit(event.wait))
+        tasks.drain()
+        self.assertRaises(ValueError, TaskQueue, policy='wait')
+
+    def test_error(self):
+        def fail():
+            raise ValueError('failure')
+
+        tasks = TaskQueue()
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            tasks.submit(fail)
+            tasks.drain()
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertIn('fail failed', output)
+        self.assertIn('ValueError: failure', output)
+        self.assertEqual(tasks.failed, 1)
+
+    def test_fork(self):
+        event = threading.Event()
+        tasks = TaskQueue(threads=1, max_queue=1)
+        tasks.submit(event.wait)
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                results = []
+                tasks.submit(results.append, 1)
+                tasks.drain(1)
+                os.write(write, b'%d' % len(results))
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(read, 1), b'1')
+        event.set()
+        tasks.drain()
+        os.close(read)
+        os.close(write)
+
+class ApplicationTasksTest(unittest.TestCase):
+    def test_client(self):
+        del done[:]
+        app = WSGIApplication(False)
+        app.add_handler(RootHandler)
+        self.assertEqual(Client(app).get('/').text, 'root')
+        self.assertEqual(done, ['/', 'second'])
+
+    def test_call(self):
+        def start_response(status, headers, exc_info=None):
+            pass
+
+        del done[:]
+        app = WSGIApplication(False, tasks=TaskQueue(threads=1))
+        app.add_handler(RootHandler)
+        app.startup()
+        result = app(HTTPRequest.get(path_info='/')._req.environ, start_response)
+        self.assertEqual(b''.join(result), b'root')
+        self.assertEqual(done, [])
+        result.close()
+        app.shutdown()
+        self.assertEqual(done, ['/', 'second'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from weppy.handler import *
+from weppy.http import *
+from weppy.templates import *
+from weppy.test import Client
+from weppy.wsgi import *
+
+### Tests ###
+
+class TemplateTest(unittest.TestCase):
+    def test_expressions(self):
+        template = Template('<p>{{ name }} {{! html }} {{ 1 + 2 }}</p>{# comment #}')
+        self.assertEqual(template.render(name='<b>&', html='<i>x</i>'),
+                         '<p>&lt;b&gt;&amp; <i>x</i> 3</p>')
+        self.assertEqual(Template('{{ value }}').render(value=Markup('<br>')), '<br>')
+
+    def test_statements(self):
+        template = Template('<ul>\n'
+                            '{% for item in items %}\n'
+                            '{% if item % 2 %}\n'
+                            '<li>{{ item }} odd</li>\n'
+                            '{% elif item == 0 %}\n'
+                            '<li>zero</li>\n'
+                            '{% else %}\n'
+                            '{% set half = item // 2 %}\n'
+                            '<li>{{ item }} twice {{ half }}</li>\n'
+                            '{% end %}\n'
+                            '{% end %}\n'
+                            '</ul>')
+        self.assertEqual(template.render(items=range(4)),
+                         '<ul>\n<li>zero</li>\n<li>1 odd</li>\n<li>2 twice 1</li>\n'
+                         '<li>3 odd</li>\n</ul>')
+
+    def test_syntax_error(self):
+        self.assertRaises(TemplateSyntaxError, Template, '{% for x in y %}')
+        self.assertRaises(TemplateSyntaxError, Template, '{% end %}')
+        self.assertRaises(TemplateSyntaxError, Template, '{% print x %}')
+        self.assertRaises(TemplateSyntaxError, Template, '{{ x + }}')
+        self.assertRaises(TemplateSyntaxError, Template, '{% set x = %}')
+        with self.assertRaises(TemplateSyntaxError) as context:
+            compile_template('<p>\n{{ x + }}\n</p>\n{% if x %}\n{% end %}\n', 'page.html')
+        self.assertEqual((context.exception.name, context.exception.line), ('page.html', 2))
+
+    def test_set(self):
+        template = Template('{% for i in range(3) %}{% set n = n + i %}{% end %}'
+                            '{% set a, b = n, total %}{{ a }} {{ b }}')
+        self.assertEqual(template.render(n=10, total=1), '13 1')
+
+    def test_generate(self):
+        template = Template('{% for i in range(1000) %}{{ i }},{% end %}', chunk_size=100)
+        chunks = list(template.generate())
+        self.assertTrue(len(chunks) > 10)
+        self.assertTrue(all(len(chunk) < 200 for chunk in chunks))
+        self.assertEqual(''.join(chunks), template.render())
+
+class TemplateLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('page.html', '<h1>{{ title }}</h1>{% include "row.html" %}')
+        self.write('row.html', '<p>{{ title }}</p>')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, source, mtime=None):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(source)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_render(self):
+        loader = TemplateLoader(self.directory)
+        self.assertEqual(loader.render('page.html', title='<a>'),
+                         '<h1>&lt;a&gt;</h1><p>&lt;a&gt;</p>')
+        self.assertTrue(loader.get('page.html') is loader.get('page.html'))
+        self.assertRaises(ValueError, loader.get, '../page.html')
+        self.assertRaises(OSError, loader.get, 'missing.html')
+
+    def test_reload(self):
+        loader = TemplateLoader(self.directory)
+        debug_loader = TemplateLoader(self.directory, debug=True)
+        self.assertEqual(loader.render('row.html', title='a'), '<p>a</p>')
+        self.assertEqual(debug_loader.render('row.html', title='a'), '<p>a</p>')
+        self.write('row.html', '<div>{{ title }}</div>', time.time() + 10)
+        self.assertEqual(loader.render('row.html', title='a'), '<p>a</p>')
+        self.assertEqual(debug_loader.render('row.html', title='a'), '<div>a</div>')
+
+    def test_cache_directory(self):
+        cache_directory = os.path.join(self.directory, 'cache')
+        loader = TemplateLoader(self.directory, cache_directory=cache_directory)
+        self.assertEqual(loader.render('row.html', title='a'), '<p>a</p>')
+        self.assertEqual(len(os.listdir(cache_directory)), 1)
+        with open(os.path.join(self.directory, 'row.html'), 'w') as f:
+            f.write('<div>{{ title }}</div>')
+        mtime = os.path.getmtime(os.path.join(self.directory, 'row.html'))
+        os.utime(os.path.join(self.directory, 'row.html'), (mtime + 10, mtime + 10))
+        loader = TemplateLoader(self.directory, cache_directory=cache_directory)
+        self.assertEqual(loader.render('row.html', title='a'), '<div>a</div>')
+
+    def test_handler(self):
+        loader = TemplateLoader(self.directory)
+
+        @url('/')
+        class PageHandler:
+            def get(self, req):
+                return loader.generate('page.html', title='stream')
+
+        app = WSGIApplication(False)
+        app.add_handler(PageHandler)
+        res = Client(app).get('/')
+        self.assertTrue(res.streaming)
+        self.assertEqual(res.text, '<h1>stream</h1><p>stream</p>')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
+import threading
+import time
 import unittest
+from weppy.server import make_server
 from weppy.test import *
 from weppy.handler import *
 from weppy.http import *
@@ -28,6 +31,23 @@ class RootHandler:
         res.set_cookie('method', 'delete')
         return res
 
+@url('/item/_/')
+class ItemHandler:
+    def get(self, req, item):
+        return HTTPResponse('item %s' % item)
+
+    def post(self, req, item):
+        if req.POST.get('fail'):
+            raise ValueError()
+        return HTTPResponse('post %s' % item)
+
+@url('/slow/')
+class SlowHandler:
+    def get(self, req):
+        for i in range(2):
+            time.sleep(0.02)
+            yield 'chunk %d' % i
+
 ### Tests ###
 
 class ClientTest(unittest.TestCase):
@@ -66,5 +86,62 @@ class ClientTest(unittest.TestCase):
         res = self.client.get('/')
         self.assertEqual(res.text, 'get, get')
 
+class LoadDriverTest(unittest.TestCase):
+    def setUp(self):
+        self.app = WSGIApplication(False)
+        self.app.add_handler(RootHandler)
+        self.app.add_handler(ItemHandler)
+        self.app.add_handler(SlowHandler)
+        self.script = [('GET', '/item/1/'), ('GET', '/item/2/'), ('POST', '/item/1/', {}),
+                       ('POST', '/item/1/', {'fail': '1'}), ('DELETE', '/')]
+
+    def test_requests(self):
+        driver = LoadDriver(lambda: Client(self.app), self.script, concurrency=4)
+        report = driver.run(requests=100)
+        self.assertEqual(report.requests, 100)
+        self.assertEqual(report.routes(), ['DELETE /', 'GET /item/_/', 'POST /item/_/'])
+        self.assertEqual(len(report.latencies['GET /item/_/']), 40)
+        self.assertEqual(report.errors, {'POST /item/_/': 20})
+        self.assertTrue(0 < report.percentile(50) <= report.percentile(99.9))
+        lines = report.summary().splitlines()
+        self.assertEqual(lines[0].split(), ['route', 'requests', 'errors', 'req/s', 'p50',
+                                            'p90', 'p99', 'p99.9'])
+        self.assertEqual(lines[-1].split()[:3], ['total', '100', '20'])
+
+    def test_streaming(self):
+        driver = LoadDriver(lambda: Client(self.app), [('GET', '/slow/')], concurrency=1)
+        self.assertTrue(driver.run(requests=2).percentile(50) >= 0.04)
+
+    def test_rate(self):
+        driver = LoadDriver(lambda: Client(self.app), self.script[:1], concurrency=2, rate=100)
+        report = driver.run(duration=0.3)
+        self.assertTrue(20 <= report.requests <= 31, report.requests)
+
+    def test_socket(self):
+        server = make_server('127.0.0.1', 0, self.app, threads=4)
+        server.RequestHandlerClass.log_message = lambda *args: None
+        thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05})
+        thread.start()
+        try:
+            port = server.server_address[1]
+            client = SocketClient('127.0.0.1', port)
+            self.assertEqual(client.get('/').text, 'get, ')
+            self.assertEqual(client.post('/').text, 'post, get')
+            self.assertEqual(client.head('/').status, '200 OK')
+            driver = LoadDriver(lambda: SocketClient('127.0.0.1', port), self.script,
+                                concurrency=2)
+            report = driver.run(requests=20)
+            self.assertEqual((report.requests, report.errors), (20, {'POST /item/1/': 4}))
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+class PercentileTest(unittest.TestCase):
+    def test(self):
+        report = LoadReport(1.0, {'a': list(range(1, 1001))}, {})
+        self.assertEqual([report.percentile(p, 'a') for p in (50, 90, 99, 99.9, 100)],
+                         [500, 900, 990, 999, 1000])
+
 if __name__ == '__main__':
     unittest.main()
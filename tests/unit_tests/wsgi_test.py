@@ -1,9 +1,19 @@
 import os
+import shutil
+import sys
+import tempfile
 import unittest
+import zlib
+from weppy.compression import Compressor
 from weppy.handler import *
 from weppy.http import *
 from weppy.wsgi import *
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 ### Handlers ###
 
 @url('/')
@@ -27,6 +37,17 @@ class ErrorHandler:
     def get(self, req):
         return HTTPResponse('%s' % 1 / 0)
 
+@url('/none/')
+class NoneHandler:
+    def get(self, req):
+        pass
+
+@url('/stream/')
+class StreamHandler:
+    def get(self, req):
+        for i in range(3):
+            yield 'chunk %d\n' % i
+
 ### Tests ###
 
 class WSGIApplicationTest(unittest.TestCase):
@@ -35,6 +56,8 @@ class WSGIApplicationTest(unittest.TestCase):
         self.app.add_handler(RootHandler)
         self.app.add_handler(ArgHandler)
         self.app.add_handler(ErrorHandler)
+        self.app.add_handler(NoneHandler)
+        self.app.add_handler(StreamHandler)
 
     def test_get(self):
         req = HTTPRequest.get(path_info='/')
@@ -75,11 +98,146 @@ class WSGIApplicationTest(unittest.TestCase):
         self.assertEqual(res.text, 'Error 500')
         self.assertEqual(res.status, '500 Internal Server Error')
 
+        res = self.app.handle_request(HTTPRequest.get(path_info='/none/'))
+        self.assertEqual(res.status, '500 Internal Server Error')
+
     def test_method_not_allowed(self):
         req = HTTPRequest.put(path_info='/')
         res = self.app.handle_request(req)
         self.assertEqual(res.text, 'Error 405')
         self.assertEqual(res.status, '405 Method Not Allowed')
+        self.assertIn(('Allow', 'GET, HEAD, POST, OPTIONS'), res.headerlist)
+
+    def test_call(self):
+        responses = []
+
+        def start_response(status, headerlist):
+            responses.append((status, dict(headerlist)))
+
+        environ = HTTPRequest.get(path_info='/stream/')._req.environ
+        app_iter = self.app(environ, start_response)
+        self.assertEqual(responses[0][0], '200 OK')
+        self.assertNotIn('Content-Length', responses[0][1])
+        self.assertEqual(next(iter(app_iter)), b'chunk 0\n')
+        app_iter.close()
+
+        environ = HTTPRequest.get(path_info='/')._req.environ
+        self.assertEqual(b''.join(self.app(environ, start_response)), b'get')
+        self.assertEqual(responses[1][1]['Content-Length'], '3')
+
+    def test_etag(self):
+        app = WSGIApplication(False, etag='weak')
+        app.add_handler(RootHandler)
+        res = app.handle_request(HTTPRequest.get(path_info='/'))
+        etag = res.etag
+        self.assertTrue(etag.startswith('W/"'))
+
+        req = HTTPRequest.get(path_info='/', headers={'HTTP_IF_NONE_MATCH': etag})
+        res = app.handle_request(req)
+        self.assertEqual(res.status, '304 Not Modified')
+
+        res = app.handle_request(HTTPRequest.post(path_info='/'))
+        self.assertEqual(res.etag, None)
+
+        res = app.handle_request(HTTPRequest.head(path_info='/'))
+        self.assertEqual(res.etag, etag)
+        req = HTTPRequest.head(path_info='/', headers={'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(app.handle_request(req).status, '304 Not Modified')
+
+    def test_compressor(self):
+        app = WSGIApplication(False, compressor=Compressor(min_size=0))
+        app.add_handler(RootHandler)
+        req = HTTPRequest.get(path_info='/', headers={'HTTP_ACCEPT_ENCODING': 'deflate'})
+        res = app.handle_request(req)
+        self.assertEqual(zlib.decompress(res.body), b'get')
+        self.assertIn(('Content-Encoding', 'deflate'), res.headerlist)
+        req = HTTPRequest.head(path_info='/', headers={'HTTP_ACCEPT_ENCODING': 'deflate'})
+        res = app.handle_request(req)
+        self.assertIn(('Content-Encoding', 'deflate'), res.headerlist)
+        self.assertIn(('Vary', 'Accept-Encoding'), res.headerlist)
+        self.assertEqual(res.body, b'')
+
+    def test_lifecycle(self):
+        app = WSGIApplication(False)
+        calls = []
+        app.on_startup(lambda: calls.append('start a'))
+        app.on_startup(lambda: calls.append('start b'))
+
+        @app.on_shutdown
+        def stop_a():
+            calls.append('stop a')
+
+        app.on_shutdown(lambda: calls.append('stop b'))
+        app.shutdown()
+        app.startup()
+        app.startup()
+        self.assertEqual(calls, ['start a', 'start b'])
+        app.shutdown()
+        app.shutdown()
+        self.assertEqual(calls, ['start a', 'start b', 'stop b', 'stop a'])
+
+        del calls[:]
+        read, write = os.pipe()
+        app.startup()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                app.startup()
+                os.write(write, ','.join(calls).encode('ascii'))
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(read, 100), b'start a,start b,start a,start b')
+        os.close(read)
+        os.close(write)
+
+    def test_manifest(self):
+        directory = tempfile.mkdtemp()
+        sys.path.insert(0, directory)
+        try:
+            with open(os.path.join(directory, 'manifest_controller.py'), 'w') as f:
+                f.write('from weppy.handler import *\n'
+                        'from weppy.http import *\n'
+                        '@url("/item/_/")\n'
+                        'class ItemHandler:\n'
+                        '    def get(self, req, item):\n'
+                        '        return HTTPResponse("item " + item)\n')
+            path = os.path.join(directory, 'routes.json')
+            WSGIApplication(False, ['manifest_controller']).write_manifest(path)
+            del sys.modules['manifest_controller']
+
+            app = WSGIApplication(False, ['manifest_controller'], manifest=path)
+            self.assertNotIn('manifest_controller', sys.modules)
+            res = app.handle_request(HTTPRequest.get(path_info='/item/a'))
+            self.assertEqual(res.status, '302 Found')
+            self.assertNotIn('manifest_controller', sys.modules)
+            res = app.handle_request(HTTPRequest.get(path_info='/item/a/'))
+            self.assertEqual(res.text, 'item a')
+            self.assertIn('manifest_controller', sys.modules)
+            self.assertTrue(isinstance(app._router.resolve('/item/a/')[0], Handler))
+
+            app = WSGIApplication(True, ['manifest_controller'], manifest=path)
+            self.assertTrue(isinstance(app._router.resolve('/item/a/')[0], Handler))
+            stderr = sys.stderr
+            sys.stderr = StringIO()
+            try:
+                app = WSGIApplication(False, [], manifest=path)
+                self.assertEqual(app.handle_request(HTTPRequest.get(path_info='/item/a/'))
+                                 .status, '404 Not Found')
+
+                del sys.modules['manifest_controller']
+                controller = os.path.join(directory, 'manifest_controller.py')
+                os.utime(controller, (0, os.path.getmtime(controller) + 10))
+                app = WSGIApplication(False, ['manifest_controller'], manifest=path)
+                output = sys.stderr.getvalue()
+            finally:
+                sys.stderr = stderr
+            self.assertIn('manifest_controller', sys.modules)
+            self.assertEqual(output.count('is out of date'), 2)
+        finally:
+            sys.path.remove(directory)
+            sys.modules.pop('manifest_controller', None)
+            shutil.rmtree(directory)
 
 if __name__ == '__main__':
     unittest.main()